@@ -4,15 +4,34 @@ Aplicação Flask para gerenciamento de propostas comerciais
 import os
 import io
 import re
+import json
+import base64
+import hashlib
+import tarfile
+import zipfile
+import time
+import socket
+import sqlite3
+import tempfile
+import zlib
 import threading
-from queue import Queue
+from queue import Queue, Empty, Full
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta, date
-from math import ceil
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file, send_from_directory
+import click
+from flask import Flask, Response, stream_with_context, g, has_request_context, render_template, request, redirect, url_for, flash, jsonify, send_file, send_from_directory
 from werkzeug.utils import secure_filename
-from models import db, Proposta, ItemProposta, Cliente, Setor, Regiao, Visita, Contato, Equipamento, init_db
-from pdf_reader import PropostaExtractor
-from sqlalchemy import text, func, literal, case
+from markupsafe import Markup, escape
+from models import (db, Proposta, ItemProposta, Cliente, Setor, Regiao, Visita, Contato, Equipamento, IngestaoJob,
+                    ReprocessamentoJob, RelatorioJob, MigracaoDados, SQLITE_PRAGMAS, aplicar_pragmas_sqlite, init_db)
+from pdf_reader import extract_pdf, extract_pdf_medido, text_sidecar_path, EXTRACTOR_VERSION
+from extraction_cache import ExtractionCache, file_sha256
+from relatorio import montar_relatorio_cliente
+from metricas import Registro, RequisicoesLentas
+from sqlalchemy import event, text, func, case, bindparam, literal_column, insert, update, delete, select
+from sqlalchemy.orm import load_only
+from sqlalchemy.exc import IntegrityError
 from openpyxl import Workbook
 from openpyxl.utils import get_column_letter
 
@@ -24,125 +43,512 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = 'sua-chave-secreta-aqui-mude-em-producao'
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# PRAGMAs de cada conexão SQLite (WAL, busy_timeout etc.; ver models.SQLITE_PRAGMAS)
+app.config['SQLITE_PRAGMAS'] = dict(SQLITE_PRAGMAS)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max
 app.config['MAX_FILES_PER_UPLOAD'] = 10
 app.config['BACKFILL_MAX_PER_REQUEST'] = 0
+# Processos de extração em paralelo (0 = extrair na própria thread do worker)
+app.config['EXTRACTION_WORKERS'] = max((os.cpu_count() or 2) - 1, 1)
+# Cache de extração por conteúdo do PDF (ver extraction_cache.py)
+app.config['EXTRACTION_CACHE_DIR'] = os.path.join(app.instance_path, 'extraction_cache')
+app.config['EXTRACTION_CACHE_MAX_BYTES'] = 256 * 1024 * 1024
+# Fila de importação persistente (tabela ingestao_jobs)
+app.config['INGESTAO_MAX_TENTATIVAS'] = 3
+# Stream de eventos da importação (/api/upload_events): intervalo do keep-alive
+app.config['UPLOAD_EVENTS_KEEPALIVE'] = 15
+# Reprocessamento incremental: propostas por lote (um checkpoint por lote)
+app.config['REPROCESS_BATCH_SIZE'] = 50
+# Normalização das propostas antigas (tabela migracoes_dados): propostas por lote
+app.config['NORMALIZACAO_BATCH_SIZE'] = 200
+# Tarefa diária que marca as propostas vencidas (também roda na inicialização)
+app.config['VENCIDAS_HORARIO'] = '00:05'
+# Listagem: validade (s) do total de propostas e dos contadores por status em cache
+app.config['LISTAGEM_CONTAGEM_TTL'] = 30
+# Busca textual (/busca): número máximo de resultados
+app.config['BUSCA_LIMITE'] = 100
+# /api/propostas sem paginação: propostas lidas do cursor do banco por vez
+app.config['API_STREAM_LOTE'] = 500
+# Exportação completa em XLSX (/relatorio/export_propostas): linhas lidas do banco por vez
+app.config['EXPORTACAO_LOTE'] = 1000
+# Relatórios em lote (ZIP com o relatório de cada cliente do filtro; ver RelatorioJob)
+app.config['RELATORIOS_DIR'] = os.path.join(app.instance_path, 'relatorios')
+app.config['RELATORIO_WORKERS'] = app.config['EXTRACTION_WORKERS']
+app.config['RELATORIO_LOTE'] = 50
+app.config['RELATORIO_VALIDADE_HORAS'] = 24
+# Backup do banco (API de backup online do SQLite): páginas copiadas por passo e
+# recomeços aceitos (banco alterado durante a cópia) antes de copiar num passo só
+app.config['BACKUP_PAGINAS'] = 1024
+app.config['BACKUP_MAX_REINICIOS'] = 3
+# Backup diário compactado em BACKUP_DIR ('HH:MM'; None desliga), mantendo os BACKUP_RETENCAO mais recentes
+app.config['BACKUP_HORARIO'] = None
+app.config['BACKUP_DIR'] = os.path.join(app.instance_path, 'backups')
+app.config['BACKUP_RETENCAO'] = 7
+# Métricas (/metrics): requisições a partir de METRICAS_LENTA_MS entram na lista
+# das lentas (/api/requisicoes_lentas), que guarda as METRICAS_LENTAS_MAX mais recentes
+app.config['METRICAS_LENTA_MS'] = 500
+app.config['METRICAS_LENTAS_MAX'] = 50
+
+# Identifica este processo nos jobs reservados ("host:pid")
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+upload_event = threading.Event()
+write_queue = Queue()
+extraction_pool = None
+extraction_cache = ExtractionCache(app.config['EXTRACTION_CACHE_DIR'],
+                                   app.config['EXTRACTION_CACHE_MAX_BYTES'])
+# Limita os jobs reservados e ainda não gravados (os demais ficam 'queued' no banco)
+ingestao_vagas = threading.Semaphore(max(app.config['EXTRACTION_WORKERS'], 1) * 2)
+# Filas das conexões abertas em /api/upload_events (importação e relatórios em lote)
+upload_subscribers = set()
+upload_subscribers_lock = threading.Lock()
+# Nome do evento enviado ao navegador para cada status de job
+UPLOAD_EVENT_BY_STATUS = {'queued': 'queued', 'running': 'extracting', 'done': 'written', 'failed': 'failed'}
+reprocess_thread = None
+# Nome da migração de dados que normaliza as propostas antigas (ver normalizar_proposta).
+# Ao mudar as regras de normalização, trocar o nome para rodar de novo sobre a tabela.
+NORMALIZACAO_MIGRACAO = 'normalizar_propostas_v3'
+# Tarefas periódicas executadas pela thread scheduler (ver agendar_tarefa)
+tarefas_agendadas = {}
+tarefas_lock = threading.Lock()
+# Totais da listagem por filtro: chave -> (expira_em, totais)
+contagem_cache = {}
+contagem_cache_lock = threading.Lock()
+# Threads de fundo já iniciadas neste processo (ver iniciar_threads)
+threads_iniciadas = False
+threads_lock = threading.Lock()
+# Índice FTS5 criado por ensure_schema (False se o SQLite não tiver FTS5)
+busca_fts_disponivel = False
+# Métricas do processo, expostas em /metrics no formato do Prometheus (ver metricas.py)
+metricas = Registro()
+http_requisicoes = metricas.contador(
+    'propostas_http_requisicoes_total', 'Requisições HTTP atendidas', ('rota', 'metodo', 'status'))
+http_duracao = metricas.histograma(
+    'propostas_http_requisicao_segundos', 'Duração das requisições HTTP', ('rota', 'metodo'))
+http_sql_comandos = metricas.histograma(
+    'propostas_http_requisicao_sql_comandos', 'Comandos SQL executados por requisição', ('rota',),
+    limites=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+http_sql_segundos = metricas.histograma(
+    'propostas_http_requisicao_sql_segundos', 'Tempo no banco por requisição', ('rota',))
+sql_comandos = metricas.contador('propostas_sql_comandos_total', 'Comandos SQL executados (todas as threads)')
+sql_segundos = metricas.contador('propostas_sql_segundos_total', 'Tempo total no banco (todas as threads)')
+ingestao_etapas = metricas.histograma(
+    'propostas_ingestao_etapa_segundos', 'Duração de cada etapa da importação de um PDF', ('etapa',))
+ingestao_jobs = metricas.medidor('propostas_ingestao_jobs', 'Jobs de importação por status', ('status',))
+ingestao_fila_gravacao = metricas.medidor(
+    'propostas_ingestao_fila_gravacao', 'PDFs extraídos aguardando o escritor do banco')
+requisicoes_lentas = RequisicoesLentas(app.config['METRICAS_LENTAS_MAX'], app.config['METRICAS_LENTA_MS'])
+
+# Ordenações da listagem: expressão SQL de cada coluna. ensure_schema cria um
+# índice (versao_atual, expressão, id) para cada uma, usado pela paginação por chave.
+LISTAGEM_ORDENACAO = {
+    'id_proposta': "lower(coalesce(id_proposta, ''))",
+    'razao_social': "lower(coalesce(razao_social, ''))",
+    'cnpj': "lower(coalesce(cnpj, ''))",
+    'cod_vendedor': "lower(coalesce(cod_vendedor, ''))",
+    'status': "lower(coalesce(observacoes, ''))",
+    'data_vencimento': "coalesce(data_vencimento, '')",
+    'data_emissao': "coalesce(data_emissao_iso, '')",
+}
+
+
+def process_pdf(filepath, filename_original, filename, dados=None, job_id=None):
+    try:
+        if dados is None:
+            dados = extract_pdf(filepath, extraction_cache)
+        status, mensagem = add_proposta_from_pdf(filepath, filename_original, filename, dados)
+        # Job concluído no mesmo commit da proposta: um reinício nunca a importa duas vezes
+        finish_ingestao_job(job_id, status, mensagem)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Erro ao processar PDF ({filename_original}): {e}")
+        if job_id is not None:
+            retry_ingestao_job(job_id, str(e))
+
+
+def add_proposta_from_pdf(filepath, filename_original, filename, dados, arquivo_hash=None):
+    """Adiciona à sessão a proposta, seus itens e o cliente novo (sem commit).
+
+    Retorna (status, mensagem): ('done', None) se a proposta foi adicionada,
+    ('done', 'Proposta já importada') ou ('failed', motivo).
+    """
+    base_id = extract_base_id_from_filename(filename_original or filename)
+    if not dados or (not dados.get('id_proposta') and not base_id):
+        print(f"Falha ao extrair dados do PDF: {filename_original}")
+        return 'failed', 'Falha ao extrair dados do PDF'
+
+    cod_vendedor = extract_cod_from_filename(filename_original)
+    data_emissao_date = parse_date_br(dados.get('data_emissao'))
+    data_vencimento = compute_data_vencimento(dados.get('validade'), data_emissao_date)
+    if not data_vencimento and data_emissao_date:
+        data_vencimento = data_emissao_date + timedelta(days=30)
+
+    proposta_existente = Proposta.query.filter_by(nome_arquivo_pdf=filename).first()
+
+    if proposta_existente:
+        print(f"Proposta já importada: {dados['id_proposta']}")
+        return 'done', 'Proposta já importada'
+
+    versao = extract_version_from_filename(filename_original or filename)
+    id_proposta = ensure_unique_id_proposta(dados.get('id_proposta'), base_id, filename_original or filename)
+
+    razao_social = dados.get('razao_social')
+    razao_social = razao_social.upper() if isinstance(razao_social, str) and razao_social.strip() else razao_social
+    tipo = dados.get('tipo') or extract_tipo_from_filename(filename_original or filename)
+
+    proposta = Proposta(
+        razao_social=razao_social,
+        nome_fantasia=dados.get('nome_fantasia'),
+        id_proposta=id_proposta or dados.get('id_proposta'),
+        data_emissao=dados.get('data_emissao'),
+        validade=dados.get('validade'),
+        cnpj=dados.get('cnpj'),
+        telefone=dados.get('telefone'),
+        celular=dados.get('celular'),
+        email=dados.get('email'),
+        pessoa_contato=dados.get('pessoa_contato'),
+        descricao_item=dados.get('descricao_item'),
+        quantidade=dados.get('quantidade'),
+        valor_total=dados.get('valor_total'),
+        nome_arquivo_pdf=filename,
+        cod_vendedor=cod_vendedor,
+        data_vencimento=data_vencimento,
+        instalacao_status=dados.get('instalacao_status'),
+        qualificacoes_status=dados.get('qualificacoes_status'),
+        treinamento_status=dados.get('treinamento_status'),
+        garantia_resumo=dados.get('garantia_resumo'),
+        garantia_texto=dados.get('garantia_texto'),
+        tipo=tipo,
+        observacoes='Em negociação'
+    )
+    proposta.id_proposta_base = base_id
+    proposta.versao = versao
+    normalizar_proposta(proposta)
+    mark_extracted(proposta, filepath, arquivo_hash)
+
+    # Outro processo pode gravar o mesmo id entre a escolha e o INSERT (id_proposta é
+    # único): nesse caso, escolher de novo dentro de um savepoint
+    for tentativa in range(3):
+        try:
+            with db.session.begin_nested():
+                db.session.add(proposta)
+                db.session.flush()
+            break
+        except IntegrityError:
+            if tentativa == 2:
+                raise
+            proposta.id_proposta = ensure_unique_id_proposta(
+                dados.get('id_proposta'), base_id, filename_original or filename
+            ) or dados.get('id_proposta')
+    atualizar_versao_atual([base_key(proposta)])
 
-upload_queue = Queue()
-upload_lock = threading.Lock()
-upload_total = 0
-upload_done = 0
-reprocess_status = {'running': False, 'total': 0, 'done': 0, 'errors': 0}
+    inserir_itens(proposta.id, dados.get('itens'))
 
+    cnpj = dados.get('cnpj')
+    if cnpj:
+        cnpj_normalizado = normalize_cnpj(cnpj)
+        cliente_existente = Cliente.query.filter(
+            (Cliente.cnpj == cnpj) | (Cliente.cnpj_normalizado == cnpj_normalizado)
+        ).first()
+        if not cliente_existente:
+            nome_cliente = dados.get('razao_social') or dados.get('nome_fantasia') or 'Cliente sem nome'
+            cliente_existente = Cliente(
+                nome=nome_cliente,
+                cnpj=cnpj,
+                cnpj_normalizado=cnpj_normalizado
+            )
+            db.session.add(cliente_existente)
+            db.session.flush()
+        proposta.cliente_id = cliente_existente.id
 
-def process_pdf(filepath, filename_original, filename):
+    return 'done', None
+
+
+def finish_ingestao_job(job_id, status, erro=None):
+    """Marca o job como concluído na transação atual (quem chama faz o commit)."""
+    if job_id is None:
+        return
+    IngestaoJob.query.filter_by(id=job_id).update({
+        'status': status,
+        'erro': erro,
+        'data_fim': datetime.now(),
+    })
+
+
+def retry_ingestao_job(job_id, erro):
+    """Devolve o job à fila após uma falha, ou o marca como 'failed' se esgotou as tentativas."""
     try:
-        extractor = PropostaExtractor(filepath)
-        dados = extractor.extract_all()
-        base_id = extract_base_id_from_filename(filename_original or filename)
-        if not dados or (not dados.get('id_proposta') and not base_id):
-            print(f"Falha ao extrair dados do PDF: {filename_original}")
+        job = db.session.get(IngestaoJob, job_id)
+        if job is None:
             return
+        job.erro = erro
+        job.worker = None
+        if job.tentativas < app.config['INGESTAO_MAX_TENTATIVAS']:
+            job.status = 'queued'
+        else:
+            job.status = 'failed'
+            job.data_fim = datetime.now()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Erro ao atualizar job de importação {job_id}: {e}")
+        return
+    if job.status == 'queued':
+        upload_event.set()
 
-        cod_vendedor = extract_cod_from_filename(filename_original)
-        data_emissao_date = parse_date_br(dados.get('data_emissao'))
-        data_vencimento = compute_data_vencimento(dados.get('validade'), data_emissao_date)
-        if not data_vencimento and data_emissao_date:
-            data_vencimento = data_emissao_date + timedelta(days=30)
 
-        proposta_existente = Proposta.query.filter_by(nome_arquivo_pdf=filename).first()
+def claim_ingestao_job():
+    """Reserva o próximo job da fila (queued -> running) ou retorna None.
 
-        if proposta_existente:
-            print(f"Proposta já importada: {dados['id_proposta']}")
-            return
+    A reserva é um UPDATE condicionado a status='queued': se outro processo
+    pegar o mesmo job antes, nenhuma linha muda e tenta-se o seguinte.
+    """
+    while True:
+        job = IngestaoJob.query.filter_by(status='queued').order_by(IngestaoJob.id).first()
+        if job is None:
+            db.session.commit()
+            return None
+        reservado = IngestaoJob.query.filter_by(id=job.id, status='queued').update({
+            'status': 'running',
+            'tentativas': IngestaoJob.tentativas + 1,
+            'worker': WORKER_ID,
+            'data_inicio': datetime.now(),
+        }, synchronize_session=False)
+        db.session.commit()
+        if reservado:
+            # Recarregado do banco no próximo acesso (o commit expira o objeto)
+            return job
+
+
+def _worker_ativo(worker):
+    """Indica se o processo "host:pid" que reservou um job ainda está rodando."""
+    host, _, pid = (worker or '').rpartition(':')
+    # O banco SQLite é local: jobs reservados em outro host (ex.: container
+    # anterior) são considerados órfãos.
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def recover_ingestao_jobs(inicializacao=True):
+    """Devolve à fila os jobs 'running' de processos que não existem mais.
+
+    Na inicialização, os jobs com o "host:pid" deste processo também voltam
+    (pid reaproveitado de um processo morto); depois, são os jobs em andamento aqui.
+    """
+    recuperados = 0
+    for job in IngestaoJob.query.filter_by(status='running').all():
+        if job.worker == WORKER_ID:
+            if not inicializacao:
+                continue
+        elif _worker_ativo(job.worker):
+            continue
+        job.status = 'queued'
+        job.worker = None
+        recuperados += 1
+    db.session.commit()
+    if recuperados:
+        print(f"{recuperados} job(s) de importação devolvidos à fila")
+        upload_event.set()
+    return recuperados
 
-        versao = extract_version_from_filename(filename_original or filename)
-        id_proposta = ensure_unique_id_proposta(dados.get('id_proposta'), base_id, filename_original or filename)
-
-        razao_social = dados.get('razao_social')
-        razao_social = razao_social.upper() if isinstance(razao_social, str) and razao_social.strip() else razao_social
-        tipo = dados.get('tipo') or extract_tipo_from_filename(filename_original or filename)
-
-        proposta = Proposta(
-            razao_social=razao_social,
-            nome_fantasia=dados.get('nome_fantasia'),
-            id_proposta=id_proposta or dados.get('id_proposta'),
-            data_emissao=dados.get('data_emissao'),
-            validade=dados.get('validade'),
-            cnpj=dados.get('cnpj'),
-            telefone=dados.get('telefone'),
-            celular=dados.get('celular'),
-            email=dados.get('email'),
-            pessoa_contato=dados.get('pessoa_contato'),
-            descricao_item=dados.get('descricao_item'),
-            quantidade=dados.get('quantidade'),
-            valor_total=dados.get('valor_total'),
-            nome_arquivo_pdf=filename,
-            cod_vendedor=cod_vendedor,
-            data_vencimento=data_vencimento,
-            instalacao_status=dados.get('instalacao_status'),
-            qualificacoes_status=dados.get('qualificacoes_status'),
-            treinamento_status=dados.get('treinamento_status'),
-            garantia_resumo=dados.get('garantia_resumo'),
-            garantia_texto=dados.get('garantia_texto'),
-            tipo=tipo,
-            observacoes='Em negociação'
-        )
-        proposta.id_proposta_base = base_id
-        proposta.versao = versao
 
-        db.session.add(proposta)
-        db.session.flush()
+def tarefa_recuperar_importacoes():
+    """Devolve à fila os jobs de processos que morreram sem terminá-los; retorna {'recuperados': n}."""
+    return {'recuperados': recover_ingestao_jobs(inicializacao=False)}
 
-        for item_data in dados.get('itens', []):
-            item = ItemProposta(
-                proposta_id=proposta.id,
-                numero=item_data.get('numero'),
-                descricao=item_data.get('descricao'),
-                quantidade=item_data.get('quantidade'),
-                valor_unitario=item_data.get('valor_unitario'),
-                valor_total=item_data.get('valor_total')
-            )
-            db.session.add(item)
-
-        cnpj = dados.get('cnpj')
-        if cnpj:
-            cnpj_normalizado = normalize_cnpj(cnpj)
-            cliente_existente = Cliente.query.filter(
-                (Cliente.cnpj == cnpj) | (Cliente.cnpj_normalizado == cnpj_normalizado)
-            ).first()
-            if not cliente_existente:
-                nome_cliente = dados.get('razao_social') or dados.get('nome_fantasia') or 'Cliente sem nome'
-                cliente = Cliente(
-                    nome=nome_cliente,
-                    cnpj=cnpj,
-                    cnpj_normalizado=cnpj_normalizado
-                )
-                db.session.add(cliente)
 
+def publish_upload_event(tipo, dados):
+    """Envia um evento para todas as conexões abertas em /api/upload_events."""
+    mensagem = f"event: {tipo}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+    with upload_subscribers_lock:
+        for fila in upload_subscribers:
+            try:
+                fila.put_nowait(mensagem)
+            except Full:
+                # Cliente lento: descartar; o próximo evento de progresso corrige o estado
+                pass
+
+
+def publish_job_event(job, **tempos):
+    """Publica o status atual de um job (queued, extracting, written ou failed)."""
+    dados = {
+        'id': job.id,
+        'arquivo': job.nome_original or job.nome_arquivo,
+        'status': job.status,
+        'tentativas': job.tentativas,
+        'erro': job.erro,
+    }
+    dados.update({nome: round(valor, 1) for nome, valor in tempos.items() if valor is not None})
+    publish_upload_event(UPLOAD_EVENT_BY_STATUS.get(job.status, job.status), dados)
+
+
+def upload_progress(concluir=False):
+    """Progresso do lote de importação atual (jobs ainda não notificados).
+
+    Com concluir=True, um lote sem pendências é marcado como notificado, para
+    não ser contado de novo no próximo lote.
+    """
+    contagem = dict(
+        db.session.query(IngestaoJob.status, func.count(IngestaoJob.id))
+        .filter(IngestaoJob.notificado.is_(False))
+        .group_by(IngestaoJob.status)
+        .all()
+    )
+    total = sum(contagem.values())
+    pending = contagem.get('queued', 0) + contagem.get('running', 0)
+    done = total - pending
+    if concluir and total and pending == 0:
+        IngestaoJob.query.filter(IngestaoJob.notificado.is_(False)).update(
+            {'notificado': True}, synchronize_session=False
+        )
         db.session.commit()
+    percent = int((done / total) * 100) if total else 0
+    return {
+        'total': total,
+        'done': done,
+        'pending': pending,
+        'failed': contagem.get('failed', 0),
+        'percent': percent,
+        'completed': True if total and pending == 0 else False
+    }
+
+
+def get_extraction_pool():
+    """Retorna o pool de processos de extração, criando-o sob demanda."""
+    global extraction_pool
+    if app.config['EXTRACTION_WORKERS'] <= 0:
+        return None
+    if extraction_pool is None:
+        extraction_pool = ProcessPoolExecutor(max_workers=app.config['EXTRACTION_WORKERS'])
+    return extraction_pool
+
+
+def submit_extraction(filepath, funcao=extract_pdf):
+    """Envia um PDF ao pool de extração, recriando o pool se um processo filho tiver morrido."""
+    global extraction_pool
+    try:
+        return get_extraction_pool().submit(funcao, filepath, extraction_cache)
+    except BrokenProcessPool:
+        extraction_pool = None
+        return get_extraction_pool().submit(funcao, filepath, extraction_cache)
+
+
+def extract_many(paths):
+    """Extrai vários PDFs (em paralelo, se houver pool); retorna [(dados, erro)] na mesma ordem."""
+    if get_extraction_pool() is None:
+        resultados = []
+        for path in paths:
+            try:
+                resultados.append((extract_pdf(path, extraction_cache) or {}, None))
+            except Exception as e:
+                print(f"Erro ao extrair PDF ({path}): {e}")
+                resultados.append((None, str(e)))
+        return resultados
+    futures = [submit_extraction(path) for path in paths]
+    return [_extraction_result(future, path) for future, path in zip(futures, paths)]
+
+
+def _extraction_result(future, filepath):
+    """Lê o resultado da extração: (dados, erro). Dados vazios são tratados como falha."""
+    try:
+        return future.result() or {}, None
     except Exception as e:
-        db.session.rollback()
-        print(f"Erro ao processar PDF ({filename_original}): {e}")
+        print(f"Erro ao extrair PDF ({filepath}): {e}")
+        return None, str(e) or e.__class__.__name__
+
+
+def _extrair_medido(filepath, future=None):
+    """Extração da importação: (dados, erro, tempos por etapa), na própria thread ou via pool."""
+    try:
+        dados, tempos = future.result() if future is not None else extract_pdf_medido(filepath, extraction_cache)
+    except Exception as e:
+        print(f"Erro ao extrair PDF ({filepath}): {e}")
+        return None, str(e) or e.__class__.__name__, {}
+    return dados or {}, None, tempos
+
+
+def _queue_extraction_result(item, inicio, future):
+    """Callback do pool: entrega o resultado (e o tempo de extração) ao escritor."""
+    dados, erro, tempos = _extrair_medido(item[1], future)
+    write_queue.put((item, dados, erro, (time.monotonic() - inicio) * 1000, tempos))
 
 
 def upload_worker():
+    """Reserva jobs da fila persistente e distribui os PDFs entre os processos de extração."""
+    with app.app_context():
+        while True:
+            ingestao_vagas.acquire()
+            try:
+                job = claim_ingestao_job()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Erro ao reservar job de importação: {e}")
+                job = None
+            if job is None:
+                ingestao_vagas.release()
+                upload_event.wait(timeout=5)
+                upload_event.clear()
+                continue
+            item = (job.id, job.caminho, job.nome_original, job.nome_arquivo)
+            espera_ms = (job.data_inicio - job.data_criacao).total_seconds() * 1000 if job.data_criacao else None
+            publish_job_event(job, espera_ms=espera_ms)
+            db.session.commit()
+            if espera_ms is not None:
+                ingestao_etapas.observar(espera_ms / 1000, etapa='espera')
+
+            filepath = item[1]
+            inicio = time.monotonic()
+            pool = get_extraction_pool()
+            if pool is None:
+                dados, erro, tempos = _extrair_medido(filepath)
+                write_queue.put((item, dados, erro, (time.monotonic() - inicio) * 1000, tempos))
+                continue
+            future = submit_extraction(filepath, extract_pdf_medido)
+            future.add_done_callback(
+                lambda f, item=item, inicio=inicio: _queue_extraction_result(item, inicio, f)
+            )
+
+
+def db_writer():
+    """Grava os dados extraídos no banco; escritor único para manter o SQLite seguro."""
     while True:
-        item = upload_queue.get()
-        if item is None:
+        entry = write_queue.get()
+        if entry is None:
             break
-        filepath, filename_original, filename = item
+        (job_id, filepath, filename_original, filename), dados, erro, extracao_ms, tempos = entry
         with app.app_context():
-            process_pdf(filepath, filename_original, filename)
-        with upload_lock:
-            global upload_done
-            upload_done += 1
-        upload_queue.task_done()
-
+            inicio = time.monotonic()
+            if erro is not None:
+                # Falha na extração (ex.: processo filho morreu): tentar de novo
+                retry_ingestao_job(job_id, erro)
+            else:
+                process_pdf(filepath, filename_original, filename, dados, job_id=job_id)
+            gravacao_ms = (time.monotonic() - inicio) * 1000
+            # Etapas medidas no processo de extração (cache, texto, campos) + totais
+            for etapa, segundos in tempos.items():
+                ingestao_etapas.observar(segundos, etapa=etapa)
+            ingestao_etapas.observar(extracao_ms / 1000, etapa='extracao')
+            ingestao_etapas.observar(gravacao_ms / 1000, etapa='gravacao')
+            try:
+                job = db.session.get(IngestaoJob, job_id)
+                if job is not None:
+                    publish_job_event(job, extracao_ms=extracao_ms, gravacao_ms=gravacao_ms)
+                publish_upload_event('progresso', upload_progress(concluir=True))
+            except Exception as e:
+                db.session.rollback()
+                print(f"Erro ao publicar progresso da importação: {e}")
+        ingestao_vagas.release()
+        write_queue.task_done()
 
-worker_thread = threading.Thread(target=upload_worker, daemon=True)
-worker_thread.start()
 
 def parse_date_br(date_str):
     """Converte data no formato dd/mm/aaaa para datetime.date."""
@@ -154,6 +560,20 @@ def parse_date_br(date_str):
         return None
 
 
+def parse_centavos(valor):
+    """Converte valor no formato brasileiro (R$ 23.900,00) para centavos (int)."""
+    if not valor:
+        return None
+    match = re.search(r'\d[\d.]*(?:,\d{1,2})?', valor)
+    if not match:
+        return None
+    reais, _, centavos = match.group(0).partition(',')
+    try:
+        return int(reais.replace('.', '')) * 100 + int(centavos.ljust(2, '0') or 0)
+    except ValueError:
+        return None
+
+
 def parse_date_iso(date_str):
     """Converte data no formato aaaa-mm-dd para datetime.date."""
     if not date_str:
@@ -210,18 +630,18 @@ def extract_version_from_filename(filename):
 
 
 def ensure_unique_id_proposta(candidate_id, base_id, filename):
-    """Garante que o id_proposta seja único; usa base/sufixo do arquivo se necessário."""
+    """Garante que o id_proposta seja único; usa base/sufixo do arquivo se necessário.
+
+    Os ids já usados entre os candidatos saem de uma única consulta (igualdade
+    e faixa "seed-..." no índice de id_proposta), qualquer que seja o número
+    de colisões.
+    """
     candidate = candidate_id or base_id
     if not candidate:
         return None
-    if not Proposta.query.filter_by(id_proposta=candidate).first():
-        return candidate
 
     suffix = extract_version_from_filename(filename)
-    if base_id and suffix:
-        candidate = f"{base_id}-{suffix}"
-        if not Proposta.query.filter_by(id_proposta=candidate).first():
-            return candidate
+    versionado = f"{base_id}-{suffix}" if base_id and suffix else None
 
     base = base_id or re.sub(r'\s+', '', (candidate_id or 'PROP'))[:10]
     base = re.sub(r'[^A-Za-z0-9-]', '', base) or 'PROP'
@@ -229,12 +649,19 @@ def ensure_unique_id_proposta(candidate_id, base_id, filename):
     name = re.sub(r'[^A-Za-z0-9-]', '', name)[:10]
     seed = f"{base}-{name}" if name else base
     seed = seed[:45]
-    attempt = seed
+
+    # "seed-" até "seed." cobre todos os "seed-<n>" ('.' é o caractere seguinte a '-')
+    usados = {row[0] for row in db.session.query(Proposta.id_proposta).filter(
+        Proposta.id_proposta.in_([c for c in (candidate, versionado, seed) if c]) |
+        ((Proposta.id_proposta >= f"{seed}-") & (Proposta.id_proposta < f"{seed}."))
+    )}
+    for attempt in (candidate, versionado, seed):
+        if attempt and attempt not in usados:
+            return attempt
     counter = 1
-    while Proposta.query.filter_by(id_proposta=attempt).first():
-        attempt = f"{seed}-{counter}"
+    while f"{seed}-{counter}" in usados:
         counter += 1
-    return attempt
+    return f"{seed}-{counter}"
 
 
 def extract_tipo_from_filename(filename):
@@ -300,53 +727,858 @@ def apply_pdf_data(proposta, dados):
         proposta.data_vencimento = data_vencimento
 
 
+def preencher_centavos_item(item):
+    """Preenche os valores em centavos do item a partir dos textos; retorna True se algo mudou."""
+    unitario = parse_centavos(item.valor_unitario)
+    total = parse_centavos(item.valor_total)
+    if (item.valor_unitario_centavos, item.valor_total_centavos) == (unitario, total):
+        return False
+    item.valor_unitario_centavos = unitario
+    item.valor_total_centavos = total
+    return True
+
+
+# Colunas de itens_proposta comparadas ao reprocessar (além de proposta_id e id)
+ITEM_COLUNAS = ('numero', 'descricao', 'quantidade', 'valor_unitario', 'valor_total',
+                'valor_unitario_centavos', 'valor_total_centavos')
+
+
+def linha_item(item_data):
+    """Monta a linha de itens_proposta (sem proposta_id) a partir dos dados extraídos do PDF."""
+    return {
+        'numero': item_data.get('numero'),
+        'descricao': item_data.get('descricao'),
+        'quantidade': item_data.get('quantidade'),
+        'valor_unitario': item_data.get('valor_unitario'),
+        'valor_total': item_data.get('valor_total'),
+        'valor_unitario_centavos': parse_centavos(item_data.get('valor_unitario')),
+        'valor_total_centavos': parse_centavos(item_data.get('valor_total')),
+    }
+
+
+def indexar_itens_busca(proposta_id):
+    """Refaz a coluna itens da proposta no índice da busca (uma vez por gravação de itens)."""
+    if busca_fts_disponivel:
+        db.session.execute(
+            text(f"UPDATE propostas_fts SET itens = {FTS_ITENS.format(':id')} WHERE rowid = :id"),
+            {'id': proposta_id}
+        )
+
+
+def inserir_itens(proposta_id, itens, indexar=True):
+    """Grava os itens da proposta com um único executemany (sem objetos ORM)."""
+    linhas = [dict(linha_item(item_data), proposta_id=proposta_id) for item_data in itens or []]
+    if linhas:
+        db.session.execute(insert(ItemProposta), linhas)
+        if indexar:
+            indexar_itens_busca(proposta_id)
+
+
 def replace_itens(proposta, itens):
-    """Substitui os itens associados a uma proposta."""
-    ItemProposta.query.filter_by(proposta_id=proposta.id).delete()
-    for item_data in itens or []:
-        item = ItemProposta(
-            proposta_id=proposta.id,
-            numero=item_data.get('numero'),
-            descricao=item_data.get('descricao'),
-            quantidade=item_data.get('quantidade'),
-            valor_unitario=item_data.get('valor_unitario'),
-            valor_total=item_data.get('valor_total')
+    """Substitui os itens associados a uma proposta.
+
+    Compara os itens novos com os gravados, na ordem: só os que mudaram são
+    atualizados, os que sobraram de um lado são inseridos ou apagados.
+    Retorna o número de linhas escritas.
+    """
+    existentes = db.session.query(ItemProposta.id, *[getattr(ItemProposta, c) for c in ITEM_COLUNAS]).filter(
+        ItemProposta.proposta_id == proposta.id
+    ).order_by(ItemProposta.id).all()
+    novas = [linha_item(item_data) for item_data in itens or []]
+
+    alteradas = [
+        dict(linha, id=existente.id)
+        for existente, linha in zip(existentes, novas)
+        if tuple(existente[1:]) != tuple(linha[c] for c in ITEM_COLUNAS)
+    ]
+    if alteradas:
+        db.session.execute(update(ItemProposta), alteradas)
+    sobras = [existente.id for existente in existentes[len(novas):]]
+    if sobras:
+        db.session.execute(
+            delete(ItemProposta).where(ItemProposta.id.in_(sobras)).execution_options(synchronize_session=False)
         )
-        db.session.add(item)
+    inserir_itens(proposta.id, itens[len(existentes):] if itens else [], indexar=False)
+    escritas = len(alteradas) + len(sobras) + max(len(novas) - len(existentes), 0)
+    if escritas:
+        indexar_itens_busca(proposta.id)
+        proposta.data_atualizacao = datetime.now()
+    return escritas
+
+
+def mark_extracted(proposta, filepath, arquivo_hash=None):
+    """Registra a versão do extrator e o SHA-256 do PDF usados nos dados da proposta."""
+    proposta.extrator_versao = EXTRACTOR_VERSION
+    if arquivo_hash is None:
+        try:
+            arquivo_hash = file_sha256(filepath)
+        except OSError:
+            arquivo_hash = None
+    proposta.arquivo_hash = arquivo_hash
+
+
+# Marca como atual só a importação mais recente de cada base (desempate pelo maior id)
+SQL_VERSAO_ATUAL = """
+    UPDATE propostas SET versao_atual = (id = (
+        SELECT p2.id FROM propostas AS p2
+        WHERE coalesce(p2.id_proposta_base, p2.id_proposta) = coalesce(propostas.id_proposta_base, propostas.id_proposta)
+        ORDER BY p2.data_importacao DESC, p2.id DESC
+        LIMIT 1
+    ))
+"""
+
+
+def invalidar_contagens():
+    with contagem_cache_lock:
+        contagem_cache.clear()
+
 
+def contagens_alteradas(session=None):
+    """Marca a transação atual: no commit, os totais da listagem em cache são descartados."""
+    (session or db.session).info['contagens_alteradas'] = True
 
-def _reprocess_all_worker():
+
+@event.listens_for(db.session, 'after_flush')
+def _propostas_gravadas(session, _flush_context):
+    if any(isinstance(obj, Proposta) for obj in (*session.new, *session.dirty, *session.deleted)):
+        contagens_alteradas(session)
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _propostas_em_lote(estado):
+    # UPDATE/DELETE em lote (query.update, update(Proposta)) não passam pelo flush
+    if (estado.is_update or estado.is_delete) and any(m.class_ is Proposta for m in estado.all_mappers):
+        contagens_alteradas(estado.session)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidar_contagens_no_commit(session):
+    # Só depois do commit: antes dele, outra requisição ainda guardaria os totais antigos
+    if session.info.pop('contagens_alteradas', False):
+        invalidar_contagens()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _descartar_marca_contagens(session):
+    session.info.pop('contagens_alteradas', None)
+
+
+def contar_listagem(chave, query):
+    """Total e contadores por status da listagem, em cache por LISTAGEM_CONTAGEM_TTL segundos."""
+    agora = time.monotonic()
+    with contagem_cache_lock:
+        item = contagem_cache.get(chave)
+        if item and item[0] > agora:
+            return item[1]
+    linha = query.order_by(None).with_entities(
+        func.count(Proposta.id).label('total'),
+        func.sum(case((Proposta.observacoes == 'Ganha', 1), else_=0)).label('ganhas'),
+        func.sum(case((Proposta.observacoes == 'Perdida', 1), else_=0)).label('perdidas'),
+        func.sum(case((Proposta.observacoes == 'Em negociação', 1), else_=0)).label('abertas'),
+        func.sum(case((Proposta.observacoes == 'Vencida', 1), else_=0)).label('vencidas')
+    ).first()
+    totais = {campo: getattr(linha, campo) or 0 for campo in ('total', 'ganhas', 'perdidas', 'abertas', 'vencidas')}
+    with contagem_cache_lock:
+        contagem_cache[chave] = (agora + app.config['LISTAGEM_CONTAGEM_TTL'], totais)
+    return totais
+
+
+def encode_cursor(dados):
+    """Cursor opaco (base64 de JSON) para a paginação por chave."""
+    return base64.urlsafe_b64encode(json.dumps(dados, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Lê um cursor de encode_cursor(); None se ausente ou inválido."""
+    if not cursor:
+        return None
+    try:
+        dados = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        return None
+    if not isinstance(dados, dict):
+        return None
+    # Chave e id vão direto para o SQL: tipos inesperados invalidam o cursor
+    chave, ultimo_id = dados.get('k'), dados.get('id')
+    if isinstance(chave, bool) or not (chave is None or isinstance(chave, (str, int, float))):
+        return None
+    if isinstance(ultimo_id, bool) or not isinstance(ultimo_id, int):
+        return None
+    return dados
+
+
+def paginar_por_chave(query, sort, order, per_page, cursor, ordenacoes=LISTAGEM_ORDENACAO):
+    """Página de propostas sem OFFSET: continua a partir da (chave, id) do cursor.
+
+    Retorna (propostas, cursor_anterior, cursor_proximo); os cursores são None
+    quando não há página naquela direção.
+    """
+    chave = literal_column(ordenacoes[sort])
+    cursor = decode_cursor(cursor)
+    if cursor and (cursor.get('s'), cursor.get('o')) != (sort, order):
+        cursor = None
+    voltar = bool(cursor) and cursor.get('d') == 'prev'
+    crescente = (order == 'asc') != voltar
+
+    query = query.add_columns(chave)
+    if cursor:
+        # (chave, id) depois do cursor, escrito de forma que o SQLite use o índice como faixa
+        k, ultimo_id = cursor.get('k'), cursor.get('id')
+        if crescente:
+            query = query.filter(chave >= k, (chave > k) | (Proposta.id > ultimo_id))
+        else:
+            query = query.filter(chave <= k, (chave < k) | (Proposta.id < ultimo_id))
+    if crescente:
+        query = query.order_by(chave.asc(), Proposta.id.asc())
+    else:
+        query = query.order_by(chave.desc(), Proposta.id.desc())
+    linhas = query.limit(per_page + 1).all()
+
+    mais = len(linhas) > per_page
+    linhas = linhas[:per_page]
+    if voltar:
+        linhas.reverse()
+        tem_anterior, tem_proximo = mais, True
+    else:
+        tem_anterior, tem_proximo = bool(cursor), mais
+
+    def cursor_de(linha, direcao):
+        return encode_cursor({'s': sort, 'o': order, 'k': linha[1], 'id': linha[0].id, 'd': direcao})
+
+    anterior = cursor_de(linhas[0], 'prev') if linhas and tem_anterior else None
+    proximo = cursor_de(linhas[-1], 'next') if linhas and tem_proximo else None
+    return [linha[0] for linha in linhas], anterior, proximo
+
+
+def vincular_propostas_cliente(cliente):
+    """Refaz o vínculo das propostas com o cliente (dois UPDATEs) após criar ou editar o CNPJ."""
+    Proposta.query.filter(
+        Proposta.cliente_id == cliente.id,
+        Proposta.cnpj_normalizado != cliente.cnpj_normalizado
+    ).update({'cliente_id': None}, synchronize_session=False)
+    Proposta.query.filter(
+        Proposta.cnpj_normalizado == cliente.cnpj_normalizado
+    ).update({'cliente_id': cliente.id}, synchronize_session=False)
+
+
+def propostas_do_cliente(cliente):
+    """Propostas do cliente: pelo vínculo ou pelo CNPJ normalizado (as duas colunas são indexadas)."""
+    cnpj_normalizado = cliente.cnpj_normalizado or normalize_cnpj(cliente.cnpj)
+    return Proposta.query.filter(
+        (Proposta.cliente_id == cliente.id) | (Proposta.cnpj_normalizado == cnpj_normalizado)
+    ).order_by(Proposta.id_proposta.asc())
+
+
+def base_key(proposta):
+    """Chave que agrupa as versões de uma proposta."""
+    return proposta.id_proposta_base or proposta.id_proposta
+
+
+def atualizar_versao_atual(bases):
+    """Recalcula a flag versao_atual das bases informadas, na transação atual (quem chama faz o commit)."""
+    bases = {b for b in bases if b}
+    if not bases:
+        return
+    # O conjunto de propostas atuais mudou (SQL direto, fora dos eventos do ORM)
+    contagens_alteradas()
+    db.session.execute(
+        text(SQL_VERSAO_ATUAL + " WHERE coalesce(id_proposta_base, id_proposta) IN :bases")
+        .bindparams(bindparam('bases', expanding=True)),
+        {'bases': list(bases)}
+    )
+
+
+def _reprocess_query(job):
+    """Propostas com PDF que entram no reprocessamento (aplica os filtros do job)."""
+    query = Proposta.query.filter(Proposta.nome_arquivo_pdf.isnot(None))
+    if job.filtro_cod_vendedor:
+        query = query.filter(Proposta.cod_vendedor == job.filtro_cod_vendedor)
+    if job.filtro_data_inicio:
+        query = query.filter(Proposta.data_importacao >= datetime.combine(job.filtro_data_inicio, datetime.min.time()))
+    if job.filtro_data_fim:
+        fim = datetime.combine(job.filtro_data_fim + timedelta(days=1), datetime.min.time())
+        query = query.filter(Proposta.data_importacao < fim)
+    return query
+
+
+def _reprocess_batch(job):
+    """Processa o próximo lote após o checkpoint; retorna False quando não há mais propostas."""
+    lote = (
+        _reprocess_query(job)
+        .with_entities(Proposta.id, Proposta.nome_arquivo_pdf, Proposta.arquivo_hash, Proposta.extrator_versao)
+        .filter(Proposta.id > job.ultimo_id)
+        .order_by(Proposta.id)
+        .limit(app.config['REPROCESS_BATCH_SIZE'])
+        .all()
+    )
+    if not lote:
+        return False
+
+    # Só reextrair o que mudou: PDF diferente ou extraído por outra versão
+    ignorados = erros = atualizados = 0
+    pendentes = []
+    for proposta_id, nome_arquivo, arquivo_hash, extrator_versao in lote:
+        pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], nome_arquivo)
+        try:
+            hash_atual = file_sha256(pdf_path)
+        except OSError:
+            ignorados += 1
+            continue
+        if extrator_versao == EXTRACTOR_VERSION and arquivo_hash == hash_atual:
+            ignorados += 1
+            continue
+        pendentes.append((proposta_id, pdf_path, hash_atual))
+
+    # Encerrar a transação de leitura antes da extração (não segurar o SQLite)
+    db.session.commit()
+    resultados = extract_many([pdf_path for _, pdf_path, _ in pendentes])
+    for (proposta_id, pdf_path, hash_atual), (dados, erro) in zip(pendentes, resultados):
+        if erro or not dados:
+            erros += 1
+            continue
+        try:
+            with db.session.begin_nested():
+                proposta = db.session.get(Proposta, proposta_id)
+                apply_pdf_data(proposta, dados)
+                normalizar_proposta(proposta)
+                replace_itens(proposta, dados.get('itens'))
+                proposta.extrator_versao = EXTRACTOR_VERSION
+                proposta.arquivo_hash = hash_atual
+            atualizados += 1
+        except Exception as e:
+            erros += 1
+            print(f"Erro reprocessando {pdf_path}: {e}")
+
+    # Checkpoint gravado no mesmo commit das propostas do lote
+    job.ignorados += ignorados
+    job.erros += erros
+    job.atualizados += atualizados
+    job.processados += len(lote)
+    job.ultimo_id = lote[-1][0]
+    db.session.commit()
+    return True
+
+
+def _reprocess_worker(job_id):
+    """Percorre as propostas em lotes a partir do checkpoint até terminar ou ser pausado."""
     with app.app_context():
-        propostas = Proposta.query.filter(Proposta.nome_arquivo_pdf.isnot(None)).all()
-        reprocess_status['total'] = len(propostas)
-        reprocess_status['done'] = 0
-        reprocess_status['errors'] = 0
-        batch = 0
-        for proposta in propostas:
-            if not proposta.nome_arquivo_pdf:
-                reprocess_status['done'] += 1
-                continue
-            pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], proposta.nome_arquivo_pdf)
-            if not os.path.exists(pdf_path):
-                reprocess_status['done'] += 1
-                continue
-            try:
-                extractor = PropostaExtractor(pdf_path)
-                dados = extractor.extract_all()
-                if dados:
-                    apply_pdf_data(proposta, dados)
-                    replace_itens(proposta, dados.get('itens'))
-                    batch += 1
-            except Exception as e:
-                reprocess_status['errors'] += 1
-                print(f"Erro reprocessando {proposta.nome_arquivo_pdf}: {e}")
-            reprocess_status['done'] += 1
-            if batch >= 25:
+        try:
+            while True:
+                job = db.session.get(ReprocessamentoJob, job_id)
+                if job is None or job.status != 'running':
+                    break
+                if not _reprocess_batch(job):
+                    job.status = 'done'
+                    job.worker = None
+                    db.session.commit()
+                    break
+                # Reler o status (pausa/cancelamento) antes do próximo lote
+                db.session.expire_all()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Erro no reprocessamento: {e}")
+            job = db.session.get(ReprocessamentoJob, job_id)
+            if job is not None and job.status == 'running':
+                job.status = 'paused'
                 db.session.commit()
-                batch = 0
-        if batch:
+
+
+def start_reprocess_thread(job):
+    """Reserva o job para este processo e inicia a thread de reprocessamento."""
+    global reprocess_thread
+    job.status = 'running'
+    job.worker = WORKER_ID
+    db.session.commit()
+    reprocess_thread = threading.Thread(target=_reprocess_worker, args=(job.id,), daemon=True)
+    reprocess_thread.start()
+
+
+def resume_reprocess_jobs():
+    """Na inicialização, retoma do checkpoint o reprocessamento interrompido por um reinício."""
+    job = ReprocessamentoJob.query.filter_by(status='running').order_by(ReprocessamentoJob.id.desc()).first()
+    if job is None or (job.worker != WORKER_ID and _worker_ativo(job.worker)):
+        return
+    print(f"Retomando reprocessamento {job.id} a partir da proposta {job.ultimo_id}")
+    start_reprocess_thread(job)
+
+
+def _linhas_relatorio_cliente(cliente):
+    """Aba Cliente do relatório: pares [campo, valor]."""
+    linhas = [
+        ['Nome', cliente.nome],
+        ['CNPJ', cliente.cnpj],
+        ['Contato principal', cliente.contato or ''],
+        ['Email principal', cliente.email or ''],
+        ['Telefone principal', cliente.telefone or ''],
+        ['Endereço', cliente.endereco or ''],
+        ['Região', cliente.regiao or ''],
+        ['CPM Status', cliente.cpm_status or ''],
+    ]
+    if cliente.cpm_data:
+        linhas.append(['CPM Data', cliente.cpm_data.strftime('%d/%m/%Y')])
+    return linhas
+
+
+def carregar_dados_relatorio(clientes):
+    """Linhas das abas do relatório (relatorio.montar_relatorio_cliente) de cada cliente.
+
+    Uma consulta por tabela para o grupo inteiro, em vez de quatro por
+    cliente. Retorna {cliente.id: dados}.
+    """
+    dados = {
+        c.id: {'cliente': _linhas_relatorio_cliente(c), 'contatos': [], 'equipamentos': [],
+               'visitas': [], 'propostas': []}
+        for c in clientes
+    }
+    ids = list(dados)
+    for c in Contato.query.filter(Contato.cliente_id.in_(ids)).order_by(Contato.nome.asc()):
+        dados[c.cliente_id]['contatos'].append([c.nome, c.email or '', c.telefone or '', c.cargo or '', c.setor or ''])
+    for e in Equipamento.query.filter(Equipamento.cliente_id.in_(ids)).order_by(Equipamento.nome.asc()):
+        dados[e.cliente_id]['equipamentos'].append([
+            e.nome,
+            e.quantidade if e.quantidade is not None else '',
+            e.marca or '',
+            e.modelo or '',
+            e.ano_instalacao if e.ano_instalacao is not None else ''
+        ])
+    for v in Visita.query.filter(Visita.cliente_id.in_(ids)).order_by(Visita.data.desc()):
+        dados[v.cliente_id]['visitas'].append([v.data.strftime('%d/%m/%Y') if v.data else '', v.historico or ''])
+
+    # Mesmo critério de propostas_do_cliente: vínculo ou CNPJ normalizado
+    por_cnpj = {}
+    for c in clientes:
+        cnpj_normalizado = c.cnpj_normalizado or normalize_cnpj(c.cnpj)
+        if cnpj_normalizado:
+            por_cnpj.setdefault(cnpj_normalizado, set()).add(c.id)
+    propostas = Proposta.query.options(load_only(
+        Proposta.id_proposta, Proposta.razao_social, Proposta.data_emissao, Proposta.valor_total,
+        Proposta.cod_vendedor, Proposta.cliente_id, Proposta.cnpj_normalizado
+    )).filter(
+        Proposta.cliente_id.in_(ids) | Proposta.cnpj_normalizado.in_(list(por_cnpj))
+    ).order_by(Proposta.id_proposta.asc())
+    for p in propostas:
+        linha = [p.id_proposta or '', p.razao_social or '', p.data_emissao or '', p.valor_total or '',
+                 p.cod_vendedor or '']
+        destinos = set(por_cnpj.get(p.cnpj_normalizado, ()))
+        if p.cliente_id in dados:
+            destinos.add(p.cliente_id)
+        for cliente_id in destinos:
+            dados[cliente_id]['propostas'].append(linha)
+    return dados
+
+
+def _relatorio_clientes_query(job):
+    query = Cliente.query
+    if job.filtro_regiao:
+        query = query.filter(Cliente.regiao == job.filtro_regiao)
+    if job.filtro_setor:
+        # O setor fica nos contatos (Cliente.setor não é mais preenchido)
+        query = query.filter(Cliente.id.in_(
+            db.session.query(Contato.cliente_id).filter(Contato.setor == job.filtro_setor)
+        ))
+    if job.filtro_cpm_status:
+        query = query.filter(Cliente.cpm_status == job.filtro_cpm_status)
+    return query.order_by(Cliente.nome.asc(), Cliente.id.asc())
+
+
+def publish_relatorio_event(job):
+    """Publica o progresso do job no mesmo stream da importação (/api/upload_events)."""
+    publish_upload_event('relatorio', job.to_dict())
+
+
+def _relatorio_worker(job_id):
+    """Gera o ZIP com o relatório de cada cliente do filtro, publicando o progresso a cada lote.
+
+    As planilhas são montadas em RELATORIO_WORKERS processos e gravadas no ZIP
+    assim que ficam prontas; enquanto isso, o lote seguinte é lido do banco.
+    """
+    with app.app_context():
+        job = db.session.get(RelatorioJob, job_id)
+        destino = os.path.join(app.config['RELATORIOS_DIR'], f"relatorios_{job.id}.zip")
+        workers = app.config['RELATORIO_WORKERS']
+        pool = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+        try:
+            ids = [linha[0] for linha in _relatorio_clientes_query(job).with_entities(Cliente.id)]
+            job.total = len(ids)
+            job.processados = 0
             db.session.commit()
-        reprocess_status['running'] = False
+            publish_relatorio_event(job)
+            os.makedirs(app.config['RELATORIOS_DIR'], exist_ok=True)
+
+            # XLSX já é compactado: ZIP_STORED não gasta CPU compactando de novo
+            with zipfile.ZipFile(destino, 'w', zipfile.ZIP_STORED) as zf:
+                def gravar(prontos):
+                    for nome, resultado in prontos:
+                        zf.writestr(nome, resultado.result() if pool else resultado)
+                    if prontos:
+                        job.processados += len(prontos)
+                        db.session.commit()
+                        publish_relatorio_event(job)
+
+                pendentes = []
+                lote = app.config['RELATORIO_LOTE']
+                for inicio in range(0, len(ids), lote):
+                    clientes = Cliente.query.filter(Cliente.id.in_(ids[inicio:inicio + lote])).order_by(
+                        Cliente.nome.asc(), Cliente.id.asc()
+                    ).all()
+                    dados = carregar_dados_relatorio(clientes)
+                    novos = [
+                        (f"{secure_filename(c.nome) or 'cliente'}_{c.id}.xlsx",
+                         pool.submit(montar_relatorio_cliente, dados[c.id]) if pool
+                         else montar_relatorio_cliente(dados[c.id]))
+                        for c in clientes
+                    ]
+                    gravar(pendentes)
+                    pendentes = novos
+                gravar(pendentes)
+
+            job.status = 'done'
+            job.arquivo = destino
+            job.data_fim = datetime.now()
+            job.expira_em = job.data_fim + timedelta(hours=app.config['RELATORIO_VALIDADE_HORAS'])
+            job.worker = None
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Erro gerando os relatórios do job {job_id}: {e}")
+            job = db.session.get(RelatorioJob, job_id)
+            job.status = 'failed'
+            job.erro = str(e) or e.__class__.__name__
+            job.data_fim = datetime.now()
+            job.worker = None
+            db.session.commit()
+            if os.path.exists(destino):
+                os.remove(destino)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        publish_relatorio_event(job)
+
+
+def start_relatorio_thread(job):
+    """Reserva o job para este processo e inicia a thread que gera os relatórios."""
+    job.status = 'running'
+    job.worker = WORKER_ID
+    db.session.commit()
+    threading.Thread(target=_relatorio_worker, args=(job.id,), daemon=True).start()
+
+
+def resume_relatorio_jobs():
+    """Na inicialização, gera de novo os relatórios interrompidos por um reinício."""
+    for job in RelatorioJob.query.filter(RelatorioJob.status.in_(['queued', 'running'])).all():
+        if job.worker != WORKER_ID and _worker_ativo(job.worker):
+            continue
+        print(f"Retomando relatórios em lote do job {job.id}")
+        start_relatorio_thread(job)
+
+
+def tarefa_limpar_relatorios():
+    """Apaga os ZIPs de relatórios vencidos; retorna {'expirados': n}."""
+    expirados = RelatorioJob.query.filter(
+        RelatorioJob.status == 'done', RelatorioJob.expira_em <= datetime.now()
+    ).all()
+    for job in expirados:
+        if job.arquivo and os.path.exists(job.arquivo):
+            os.remove(job.arquivo)
+        job.status = 'expired'
+        job.arquivo = None
+    db.session.commit()
+    return {'expirados': len(expirados)}
+
+
+def normalizar_proposta(proposta, hoje=None, clientes=None):
+    """Completa e normaliza os campos derivados da proposta; retorna True se algo mudou.
+
+    Chamada ao gravar (importação, edição, reprocessamento) e pela migração
+    que normaliza as propostas antigas; a listagem só lê. clientes
+    ({cnpj_normalizado: id}) evita uma consulta por proposta nos lotes.
+    """
+    hoje = hoje or date.today()
+    alterou = False
+
+    # CNPJ normalizado e vínculo com o Cliente de mesmo CNPJ
+    cnpj_normalizado = normalize_cnpj(proposta.cnpj) or None
+    if proposta.cnpj_normalizado != cnpj_normalizado:
+        proposta.cnpj_normalizado = cnpj_normalizado
+        alterou = True
+    if cnpj_normalizado is None:
+        cliente_id = None
+    elif clientes is not None:
+        cliente_id = clientes.get(cnpj_normalizado)
+    else:
+        cliente_id = db.session.query(Cliente.id).filter(Cliente.cnpj_normalizado == cnpj_normalizado).scalar()
+    if proposta.cliente_id != cliente_id:
+        proposta.cliente_id = cliente_id
+        alterou = True
+
+    # Colunas tipadas (data ISO e centavos) para ordenar, filtrar e somar no SQL
+    data_emissao_iso = parse_date_br(proposta.data_emissao)
+    if proposta.data_emissao_iso != data_emissao_iso:
+        proposta.data_emissao_iso = data_emissao_iso
+        alterou = True
+    valor_total_centavos = parse_centavos(proposta.valor_total)
+    if proposta.valor_total_centavos != valor_total_centavos:
+        proposta.valor_total_centavos = valor_total_centavos
+        alterou = True
+
+    # Data de vencimento a partir da emissão/validade
+    if not proposta.data_vencimento and proposta.data_emissao:
+        data_emissao_date = parse_date_br(proposta.data_emissao)
+        data_vencimento = compute_data_vencimento(proposta.validade, data_emissao_date)
+        if not data_vencimento and data_emissao_date:
+            data_vencimento = data_emissao_date + timedelta(days=30)
+        if data_vencimento:
+            proposta.data_vencimento = data_vencimento
+            alterou = True
+
+    # Cod pelo nome do arquivo
+    if not proposta.cod_vendedor and proposta.nome_arquivo_pdf:
+        cod = extract_cod_from_filename(proposta.nome_arquivo_pdf)
+        if cod:
+            proposta.cod_vendedor = cod
+            alterou = True
+    if proposta.razao_social:
+        razao_upper = proposta.razao_social.upper()
+        if proposta.razao_social != razao_upper:
+            proposta.razao_social = razao_upper
+            alterou = True
+
+    # Tipo pelo nome do arquivo (sem abrir PDF)
+    if (proposta.tipo is None or clean_info(proposta.tipo) is None) and proposta.nome_arquivo_pdf:
+        tipo = extract_tipo_from_filename(proposta.nome_arquivo_pdf)
+        if tipo:
+            proposta.tipo = tipo
+            alterou = True
+
+    # Base/versao com base nos 3 primeiros dígitos do arquivo
+    base_id = extract_base_id_from_filename(proposta.nome_arquivo_pdf) if proposta.nome_arquivo_pdf else None
+    versao = extract_version_from_filename(proposta.nome_arquivo_pdf) if proposta.nome_arquivo_pdf else None
+    if base_id and proposta.id_proposta_base != base_id:
+        proposta.id_proposta_base = base_id
+        proposta.versao = versao or proposta.versao
+        alterou = True
+    elif not proposta.id_proposta_base:
+        base_id_fallback, versao_fallback = split_proposta_id(proposta.id_proposta)
+        proposta.id_proposta_base = base_id_fallback
+        proposta.versao = proposta.versao or versao_fallback
+        alterou = True
+
+    vencida = proposta.data_vencimento is not None and proposta.data_vencimento < hoje
+    if vencida:
+        if proposta.observacoes in (None, '', 'Em negociação'):
+            proposta.observacoes = 'Vencida'
+            alterou = True
+    elif not proposta.observacoes:
+        proposta.observacoes = 'Em negociação'
+        alterou = True
+    return alterou
+
+
+def marcar_vencidas():
+    """Passa para 'Vencida' as propostas em negociação com vencimento já passado (um único UPDATE)."""
+    contagens_alteradas()
+    return Proposta.query.filter(
+        Proposta.data_vencimento < date.today(),
+        (Proposta.observacoes.is_(None)) | (Proposta.observacoes.in_(('', 'Em negociação')))
+    ).update({'observacoes': 'Vencida'}, synchronize_session=False)
+
+
+def tarefa_marcar_vencidas():
+    """Tarefa agendada: marca as propostas vencidas e informa quantas mudaram."""
+    alteradas = marcar_vencidas()
+    db.session.commit()
+    return {'alteradas': alteradas}
+
+
+class _BackupReiniciado(Exception):
+    pass
+
+
+def backup_sqlite(destino):
+    """Grava em destino uma cópia consistente do banco, pela API de backup online do SQLite.
+
+    A cópia anda BACKUP_PAGINAS páginas por passo, liberando o banco para quem
+    grava entre os passos. Se o banco mudar no meio, o SQLite recomeça a cópia;
+    depois de BACKUP_MAX_REINICIOS recomeços, copia tudo num passo só (em WAL,
+    uma única transação de leitura, que não bloqueia as escritas).
+    """
+    origem = sqlite3.connect(db.engine.url.database)
+    copia = sqlite3.connect(destino)
+    estado = {'restantes': None, 'reinicios': 0}
+
+    def progresso(status, remaining, total):
+        # As páginas restantes só aumentam quando o SQLite recomeça a cópia
+        if estado['restantes'] is not None and remaining > estado['restantes']:
+            estado['reinicios'] += 1
+            if estado['reinicios'] > app.config['BACKUP_MAX_REINICIOS']:
+                raise _BackupReiniciado()
+        estado['restantes'] = remaining
+
+    try:
+        try:
+            origem.backup(copia, pages=app.config['BACKUP_PAGINAS'], progress=progresso, sleep=0.01)
+        except _BackupReiniciado:
+            origem.backup(copia)
+    finally:
+        copia.close()
+        origem.close()
+
+
+def gzip_stream(caminho, remover=False):
+    """Gera o conteúdo do arquivo compactado em gzip, em pedaços (sem montar o .gz em memória)."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: formato gzip
+    try:
+        with open(caminho, 'rb') as fh:
+            for pedaco in iter(lambda: fh.read(256 * 1024), b''):
+                dados = compressor.compress(pedaco)
+                if dados:
+                    yield dados
+        yield compressor.flush()
+    finally:
+        if remover:
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+
+
+def tarefa_backup_banco():
+    """Grava um backup compactado em BACKUP_DIR e apaga os mais antigos além de BACKUP_RETENCAO."""
+    pasta = app.config['BACKUP_DIR']
+    os.makedirs(pasta, exist_ok=True)
+    nome = f"database_{datetime.now():%Y%m%d_%H%M%S}.db.gz"
+    copia = os.path.join(pasta, f"{nome}.copia")
+    backup_sqlite(copia)
+    with open(os.path.join(pasta, f"{nome}.tmp"), 'wb') as fh:
+        for pedaco in gzip_stream(copia, remover=True):
+            fh.write(pedaco)
+    os.replace(os.path.join(pasta, f"{nome}.tmp"), os.path.join(pasta, nome))
+
+    retencao = app.config['BACKUP_RETENCAO']
+    backups = sorted(f for f in os.listdir(pasta) if f.startswith('database_') and f.endswith('.db.gz'))
+    antigos = backups[:-retencao] if retencao > 0 else []
+    for antigo in antigos:
+        os.remove(os.path.join(pasta, antigo))
+    return {'arquivo': nome, 'removidos': len(antigos)}
+
+
+def a_cada(minutos):
+    """Próxima execução de uma tarefa repetida a cada N minutos."""
+    return lambda agora: agora + timedelta(minutes=minutos)
+
+
+def diariamente(horario):
+    """Próxima execução de uma tarefa diária no horário 'HH:MM'."""
+    hora, minuto = (int(parte) for parte in horario.split(':'))
+
+    def proxima(agora):
+        alvo = agora.replace(hour=hora, minute=minuto, second=0, microsecond=0)
+        return alvo if alvo > agora else alvo + timedelta(days=1)
+    return proxima
+
+
+def agendar_tarefa(nome, funcao, proxima_execucao):
+    """Registra uma tarefa periódica; roda já na inicialização e depois em proxima_execucao(agora)."""
+    with tarefas_lock:
+        tarefas_agendadas[nome] = {
+            'funcao': funcao,
+            'proxima_execucao': proxima_execucao,
+            'proxima': datetime.now(),
+            'ultima': None,
+            'duracao_ms': None,
+            'execucoes': 0,
+            'resultado': None,
+            'erro': None,
+        }
+
+
+def _executar_tarefa(nome, tarefa):
+    inicio = time.monotonic()
+    tarefa['ultima'] = datetime.now()
+    with app.app_context():
+        try:
+            tarefa['resultado'] = tarefa['funcao']()
+            tarefa['erro'] = None
+        except Exception as e:
+            db.session.rollback()
+            tarefa['erro'] = str(e) or e.__class__.__name__
+            print(f"Erro na tarefa agendada {nome}: {e}")
+    tarefa['duracao_ms'] = round((time.monotonic() - inicio) * 1000, 1)
+    tarefa['execucoes'] += 1
+    tarefa['proxima'] = tarefa['proxima_execucao'](datetime.now())
+
+
+def scheduler():
+    """Thread que executa as tarefas agendadas quando chega a hora de cada uma."""
+    while True:
+        with tarefas_lock:
+            pendentes = [(n, t) for n, t in tarefas_agendadas.items() if t['proxima'] <= datetime.now()]
+        for nome, tarefa in pendentes:
+            _executar_tarefa(nome, tarefa)
+        with tarefas_lock:
+            proxima = min((t['proxima'] for t in tarefas_agendadas.values()), default=None)
+        # Acordar ao menos uma vez por minuto (ajustes de relógio, tarefas novas)
+        espera = 60 if proxima is None else (proxima - datetime.now()).total_seconds()
+        time.sleep(min(max(espera, 1), 60))
+
+
+def _normalizacao_batch(migracao):
+    """Normaliza o próximo lote após o checkpoint; retorna False quando não há mais propostas."""
+    lote = (
+        Proposta.query
+        .filter(Proposta.id > migracao.ultimo_id)
+        .order_by(Proposta.id)
+        .limit(app.config['NORMALIZACAO_BATCH_SIZE'])
+        .all()
+    )
+    if not lote:
+        return False
+    hoje = date.today()
+    bases = set()
+    cnpjs = {normalize_cnpj(p.cnpj) for p in lote if p.cnpj}
+    clientes = dict(
+        db.session.query(Cliente.cnpj_normalizado, Cliente.id).filter(Cliente.cnpj_normalizado.in_(cnpjs))
+    ) if cnpjs else {}
+    for proposta in lote:
+        base_anterior = base_key(proposta)
+        if normalizar_proposta(proposta, hoje, clientes):
+            migracao.alterados += 1
+        if base_key(proposta) != base_anterior:
+            bases.update((base_anterior, base_key(proposta)))
+    atualizar_versao_atual(bases)
+    for item in ItemProposta.query.filter(ItemProposta.proposta_id.in_([p.id for p in lote])):
+        preencher_centavos_item(item)
+    # Checkpoint gravado no mesmo commit das propostas do lote
+    migracao.processados += len(lote)
+    migracao.ultimo_id = lote[-1].id
+    db.session.commit()
+    return True
+
+
+def _normalizacao_worker():
+    """Roda (ou retoma do checkpoint) a normalização das propostas antigas."""
+    with app.app_context():
+        try:
+            migracao = MigracaoDados.query.filter_by(nome=NORMALIZACAO_MIGRACAO).first()
+            if migracao is None or migracao.status != 'done':
+                # Clientes antigos sem CNPJ normalizado (usado no vínculo com as propostas)
+                for cliente in Cliente.query.filter(Cliente.cnpj_normalizado.is_(None)):
+                    cliente.cnpj_normalizado = normalize_cnpj(cliente.cnpj)
+                db.session.commit()
+            if migracao is None:
+                migracao = MigracaoDados(nome=NORMALIZACAO_MIGRACAO)
+                db.session.add(migracao)
+                db.session.commit()
+            if migracao.status != 'done':
+                print(f"Normalizando propostas a partir da proposta {migracao.ultimo_id}")
+            while migracao.status != 'done':
+                if not _normalizacao_batch(migracao):
+                    migracao.status = 'done'
+                    migracao.data_fim = datetime.now()
+                    db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Erro na normalização das propostas: {e}")
 
 
 def split_proposta_id(id_proposta):
@@ -370,8 +1602,44 @@ def versao_ordem(versao):
     return 0
 
 
+# Busca textual: índice FTS5 com o cabeçalho, a garantia e a descrição dos itens de
+# cada proposta (rowid = propostas.id). O cabeçalho é mantido por triggers; a coluna
+# itens, por indexar_itens_busca, uma vez por gravação dos itens (um trigger por
+# linha de item refaria o group_concat a cada item: O(n²) por proposta).
+FTS_COLUNAS = 'id_proposta, razao_social, nome_fantasia, cnpj, cod_vendedor, garantia_texto'
+FTS_ITENS = "(SELECT group_concat(descricao, ' ') FROM itens_proposta WHERE proposta_id = {})"
+SQL_BUSCA_FTS = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS propostas_fts USING fts5(
+        {FTS_COLUNAS}, itens, tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS propostas_fts_ai AFTER INSERT ON propostas BEGIN
+        INSERT INTO propostas_fts(rowid, {FTS_COLUNAS}, itens)
+        VALUES (new.id, new.id_proposta, new.razao_social, new.nome_fantasia, new.cnpj, new.cod_vendedor,
+                new.garantia_texto, {FTS_ITENS.format('new.id')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS propostas_fts_au AFTER UPDATE OF {FTS_COLUNAS} ON propostas BEGIN
+        DELETE FROM propostas_fts WHERE rowid = old.id;
+        INSERT INTO propostas_fts(rowid, {FTS_COLUNAS}, itens)
+        VALUES (new.id, new.id_proposta, new.razao_social, new.nome_fantasia, new.cnpj, new.cod_vendedor,
+                new.garantia_texto, {FTS_ITENS.format('new.id')});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS propostas_fts_ad AFTER DELETE ON propostas BEGIN
+        DELETE FROM propostas_fts WHERE rowid = old.id;
+    END""",
+    # Triggers por item das versões anteriores (ver indexar_itens_busca)
+    "DROP TRIGGER IF EXISTS itens_fts_ai",
+    "DROP TRIGGER IF EXISTS itens_fts_au",
+    "DROP TRIGGER IF EXISTS itens_fts_ad",
+]
+SQL_BUSCA_FTS_POPULAR = f"""
+    INSERT INTO propostas_fts(rowid, {FTS_COLUNAS}, itens)
+    SELECT id, {FTS_COLUNAS}, {FTS_ITENS.format('propostas.id')} FROM propostas
+"""
+
+
 def ensure_schema():
     """Garante colunas novas no SQLite sem migração."""
+    global busca_fts_disponivel
     with db.engine.connect() as conn:
         result = conn.execute(text("PRAGMA table_info(propostas)"))
         existing = {row[1] for row in result.fetchall()}
@@ -397,14 +1665,79 @@ def ensure_schema():
             conn.execute(text("ALTER TABLE propostas ADD COLUMN id_proposta_base VARCHAR(50)"))
         if 'versao' not in existing:
             conn.execute(text("ALTER TABLE propostas ADD COLUMN versao VARCHAR(5)"))
+        if 'extrator_versao' not in existing:
+            conn.execute(text("ALTER TABLE propostas ADD COLUMN extrator_versao VARCHAR(10)"))
+        if 'arquivo_hash' not in existing:
+            conn.execute(text("ALTER TABLE propostas ADD COLUMN arquivo_hash VARCHAR(64)"))
+        if 'data_emissao_iso' not in existing:
+            conn.execute(text("ALTER TABLE propostas ADD COLUMN data_emissao_iso DATE"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_propostas_data_emissao_iso ON propostas(data_emissao_iso)"))
+            # O índice de ordenação por emissão passa a usar a coluna tipada
+            conn.execute(text("DROP INDEX IF EXISTS idx_propostas_ord_data_emissao"))
+        if 'valor_total_centavos' not in existing:
+            conn.execute(text("ALTER TABLE propostas ADD COLUMN valor_total_centavos INTEGER"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_propostas_valor_total_centavos ON propostas(valor_total_centavos)"))
+        if 'cnpj_normalizado' not in existing:
+            conn.execute(text("ALTER TABLE propostas ADD COLUMN cnpj_normalizado VARCHAR(20)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_propostas_cnpj_normalizado ON propostas(cnpj_normalizado)"))
+        if 'cliente_id' not in existing:
+            conn.execute(text("ALTER TABLE propostas ADD COLUMN cliente_id INTEGER REFERENCES clientes(id)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_propostas_cliente_id ON propostas(cliente_id)"))
+        if 'versao_atual' not in existing:
+            conn.execute(text("ALTER TABLE propostas ADD COLUMN versao_atual BOOLEAN NOT NULL DEFAULT 0"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_propostas_versao_atual ON propostas(versao_atual)"))
+        if 'data_atualizacao' not in existing:
+            conn.execute(text("ALTER TABLE propostas ADD COLUMN data_atualizacao DATETIME"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_propostas_data_atualizacao ON propostas(data_atualizacao)"))
+            conn.execute(text(
+                "UPDATE propostas SET data_atualizacao = coalesce(data_importacao, datetime('now', 'localtime'))"
+            ))
+            conn.commit()
         # Índices para acelerar a listagem/paginação
         conn.execute(text("CREATE INDEX IF NOT EXISTS idx_propostas_base ON propostas(id_proposta_base)"))
         conn.execute(text("CREATE INDEX IF NOT EXISTS idx_propostas_import ON propostas(data_importacao)"))
         conn.execute(text("CREATE INDEX IF NOT EXISTS idx_propostas_obs ON propostas(observacoes)"))
+        # Paginação por chave da listagem (ver LISTAGEM_ORDENACAO)
+        for nome, expressao in LISTAGEM_ORDENACAO.items():
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS idx_propostas_ord_{nome} ON propostas(versao_atual, {expressao}, id)"
+            ))
+        # Busca das propostas vencidas (marcar_vencidas)
+        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_propostas_obs_venc ON propostas(observacoes, data_vencimento)"))
         conn.execute(text("CREATE INDEX IF NOT EXISTS idx_propostas_cnpj ON propostas(cnpj)"))
         conn.execute(text("CREATE INDEX IF NOT EXISTS idx_propostas_razao ON propostas(razao_social)"))
         conn.execute(text("CREATE INDEX IF NOT EXISTS idx_propostas_cod ON propostas(cod_vendedor)"))
         conn.execute(text("CREATE INDEX IF NOT EXISTS idx_propostas_id ON propostas(id_proposta)"))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_propostas_base_import "
+            "ON propostas(coalesce(id_proposta_base, id_proposta), data_importacao)"
+        ))
+        if 'versao_atual' not in existing:
+            # Preencher a flag das propostas já existentes
+            conn.execute(text(SQL_VERSAO_ATUAL))
+            conn.commit()
+
+        # Itens: valores em centavos
+        result_itens = conn.execute(text("PRAGMA table_info(itens_proposta)"))
+        existing_itens = {row[1] for row in result_itens.fetchall()}
+        if 'valor_unitario_centavos' not in existing_itens:
+            conn.execute(text("ALTER TABLE itens_proposta ADD COLUMN valor_unitario_centavos INTEGER"))
+        if 'valor_total_centavos' not in existing_itens:
+            conn.execute(text("ALTER TABLE itens_proposta ADD COLUMN valor_total_centavos INTEGER"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_itens_proposta ON itens_proposta(proposta_id)"))
+
+        # Busca textual (FTS5); sem FTS5 no SQLite, /busca fica indisponível
+        try:
+            existe = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'propostas_fts'")).first()
+            for sql in SQL_BUSCA_FTS:
+                conn.execute(text(sql))
+            if not existe:
+                conn.execute(text(SQL_BUSCA_FTS_POPULAR))
+                conn.commit()
+            busca_fts_disponivel = True
+        except Exception as e:
+            conn.rollback()
+            print(f"Busca textual (FTS5) indisponível: {e}")
 
         # Visitas: ajustes de schema
         try:
@@ -468,12 +1801,78 @@ def ensure_schema():
         except Exception:
             pass
 
+def instrumentar_sql(engine):
+    """Conta os comandos SQL do engine e o tempo gasto neles (no total e na requisição atual)."""
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.metricas_inicio = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _depois(conn, cursor, statement, parameters, context, executemany):
+        inicio = getattr(context, 'metricas_inicio', None)
+        if inicio is None:
+            return
+        duracao = time.perf_counter() - inicio
+        sql_comandos.inc()
+        sql_segundos.inc(duracao)
+        if has_request_context() and 'metricas_sql' in g:
+            g.metricas_sql[0] += 1
+            g.metricas_sql[1] += duracao
+
+
 # Inicializar banco de dados
 db.init_app(app)
 with app.app_context():
+    aplicar_pragmas_sqlite(db.engine, app.config['SQLITE_PRAGMAS'])
+    instrumentar_sql(db.engine)
     db.create_all()
     ensure_schema()
 
+def iniciar_threads():
+    """Sobe as threads de fundo (importação, escritor, normalização e tarefas agendadas).
+
+    Só o processo que atende HTTP deve chamá-la: o pai do reloader, os comandos
+    de CLI (ex.: importar-lote) e os processos do pool importam este módulo sem
+    subir as threads. Chamadas repetidas não fazem nada.
+    """
+    global threads_iniciadas
+    with threads_lock:
+        if threads_iniciadas:
+            return
+        threads_iniciadas = True
+    with app.app_context():
+        recover_ingestao_jobs()
+        resume_reprocess_jobs()
+        resume_relatorio_jobs()
+    threading.Thread(target=upload_worker, daemon=True).start()
+    threading.Thread(target=_normalizacao_worker, daemon=True).start()
+    agendar_tarefa('marcar_vencidas', tarefa_marcar_vencidas, diariamente(app.config['VENCIDAS_HORARIO']))
+    agendar_tarefa('limpar_relatorios', tarefa_limpar_relatorios, a_cada(60))
+    agendar_tarefa('recuperar_importacoes', tarefa_recuperar_importacoes, a_cada(5))
+    if app.config['BACKUP_HORARIO']:
+        agendar_tarefa('backup_banco', tarefa_backup_banco, diariamente(app.config['BACKUP_HORARIO']))
+    threading.Thread(target=scheduler, daemon=True).start()
+    threading.Thread(target=db_writer, daemon=True).start()
+
+
+@app.before_request
+def iniciar_threads_servidor():
+    # Servidores que importam o app (flask run, WSGI) sobem as threads na primeira requisição
+    if not threads_iniciadas:
+        iniciar_threads()
+
+
+def remove_pdf_files(filename):
+    """Remove o PDF enviado e o texto extraído salvo ao lado dele."""
+    if not filename:
+        return
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    for path in (filepath, text_sidecar_path(filepath)):
+        if os.path.exists(path):
+            os.remove(path)
+
 
 def allowed_file(filename):
     """Verifica se o arquivo é permitido"""
@@ -486,6 +1885,41 @@ def index():
     return redirect(url_for('listagem'))
 
 
+def fts_consulta(termos):
+    """Converte o texto digitado em uma consulta FTS5: todas as palavras, por prefixo."""
+    return ' '.join(f'"{palavra}"*' for palavra in re.findall(r'\w+', termos))
+
+
+def destacar_trecho(trecho):
+    """Escapa o trecho do snippet() e troca os marcadores (\x02/\x03) por <mark>."""
+    return Markup(str(escape(trecho or '')).replace('\x02', '<mark>').replace('\x03', '</mark>'))
+
+
+@app.route('/busca')
+def busca():
+    """Busca textual nas propostas (cabeçalho, garantia e itens), por relevância."""
+    q = request.args.get('q', '').strip()
+    resultados = []
+    consulta = fts_consulta(q)
+    if consulta and not busca_fts_disponivel:
+        flash('Busca textual indisponível: o SQLite não tem suporte a FTS5.', 'warning')
+    elif consulta:
+        # Pesos do bm25 por coluna: ID e cliente valem mais que garantia e itens
+        linhas = db.session.execute(text("""
+            SELECT rowid, snippet(propostas_fts, -1, char(2), char(3), '…', 16) AS trecho
+            FROM propostas_fts
+            WHERE propostas_fts MATCH :consulta
+            ORDER BY bm25(propostas_fts, 10.0, 5.0, 5.0, 5.0, 2.0, 1.0, 2.0)
+            LIMIT :limite
+        """), {'consulta': consulta, 'limite': app.config['BUSCA_LIMITE']}).all()
+        propostas = {p.id: p for p in Proposta.query.filter(Proposta.id.in_([l.rowid for l in linhas]))}
+        resultados = [
+            {'proposta': propostas[l.rowid], 'trecho': destacar_trecho(l.trecho)}
+            for l in linhas if l.rowid in propostas
+        ]
+    return render_template('busca.html', q=q, resultados=resultados, limite=app.config['BUSCA_LIMITE'])
+
+
 @app.route('/upload', methods=['GET', 'POST'])
 def upload():
     """Página de upload de PDF"""
@@ -504,6 +1938,7 @@ def upload():
             return redirect(request.url)
 
         enfileirados = 0
+        jobs = []
         for file_obj in files:
             if file_obj.filename == '':
                 continue
@@ -514,14 +1949,19 @@ def upload():
             filename_original = file_obj.filename
             filename = secure_filename(filename_original)
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            inicio = time.perf_counter()
             file_obj.save(filepath)
-            upload_queue.put((filepath, filename_original, filename))
+            ingestao_etapas.observar(time.perf_counter() - inicio, etapa='salvar_arquivo')
+            jobs.append(IngestaoJob(caminho=filepath, nome_original=filename_original, nome_arquivo=filename))
+            db.session.add(jobs[-1])
             enfileirados += 1
 
         if enfileirados:
-            with upload_lock:
-                global upload_total, upload_done
-                upload_total += enfileirados
+            db.session.commit()
+            upload_event.set()
+            for job in jobs:
+                publish_job_event(job)
+            publish_upload_event('progresso', upload_progress())
 
         if enfileirados:
             flash(f'{enfileirados} PDF(s) enviados para processamento em background.', 'success')
@@ -541,14 +1981,12 @@ def listagem():
     cnpj = request.args.get('cnpj', '').strip()
     id_proposta = request.args.get('id_proposta', '').strip()
     cod_vendedor = request.args.get('cod_vendedor', '').strip()
+    emissao_de = request.args.get('emissao_de', '').strip()
+    emissao_ate = request.args.get('emissao_ate', '').strip()
     sort = request.args.get('sort', 'id_proposta').strip()
     order = request.args.get('order', 'asc').strip().lower()
-    page = request.args.get('page', '1').strip()
+    cursor = request.args.get('cursor', '').strip()
     per_page = request.args.get('per_page', '50').strip()
-    try:
-        page = max(int(page), 1)
-    except Exception:
-        page = 1
     try:
         per_page = int(per_page)
     except Exception:
@@ -557,18 +1995,12 @@ def listagem():
         per_page = 50
     if order not in ('asc', 'desc'):
         order = 'asc'
+    if sort not in LISTAGEM_ORDENACAO:
+        sort = 'id_proposta'
     
     # Query base (apenas a proposta atual por base)
     base_expr = func.coalesce(Proposta.id_proposta_base, Proposta.id_proposta)
-    subq = db.session.query(
-        base_expr.label('base_id'),
-        func.max(Proposta.data_importacao).label('max_import')
-    ).group_by(base_expr).subquery()
-
-    current_query = Proposta.query.join(
-        subq,
-        (base_expr == subq.c.base_id) & (Proposta.data_importacao == subq.c.max_import)
-    )
+    current_query = Proposta.query.filter(Proposta.versao_atual.is_(True))
 
     # Aplicar filtros
     if razao_social:
@@ -579,46 +2011,25 @@ def listagem():
         current_query = current_query.filter(Proposta.id_proposta.ilike(f'%{id_proposta}%'))
     if cod_vendedor:
         current_query = current_query.filter(Proposta.cod_vendedor.ilike(f'%{cod_vendedor}%'))
-
-    # Ordenacao
-    if sort == 'data_emissao':
-        emissao_expr = func.substr(Proposta.data_emissao, 7, 4)
-        emissao_expr = emissao_expr.op('||')(literal('-')).op('||')(func.substr(Proposta.data_emissao, 4, 2)).op('||')(literal('-')).op('||')(func.substr(Proposta.data_emissao, 1, 2))
-        order_col = func.coalesce(emissao_expr, '')
-    elif sort == 'data_vencimento':
-        order_col = func.coalesce(Proposta.data_vencimento, date.min)
-    elif sort == 'status':
-        order_col = func.lower(func.coalesce(Proposta.observacoes, ''))
-    elif sort == 'cnpj':
-        order_col = func.lower(func.coalesce(Proposta.cnpj, ''))
-    elif sort == 'razao_social':
-        order_col = func.lower(func.coalesce(Proposta.razao_social, ''))
-    elif sort == 'cod_vendedor':
-        order_col = func.lower(func.coalesce(Proposta.cod_vendedor, ''))
-    else:
-        order_col = func.lower(func.coalesce(Proposta.id_proposta, ''))
-
-    if order == 'desc':
-        current_query = current_query.order_by(order_col.desc())
-    else:
-        current_query = current_query.order_by(order_col.asc())
-
-    count_query = current_query.order_by(None)
-    total_propostas = count_query.count()
-    total_pages = max(ceil(total_propostas / per_page), 1)
-    if page > total_pages:
-        page = total_pages
-    start_idx = (page - 1) * per_page
-
-    current_propostas = current_query.offset(start_idx).limit(per_page).all()
+    if parse_date_iso(emissao_de):
+        current_query = current_query.filter(Proposta.data_emissao_iso >= parse_date_iso(emissao_de))
+    if parse_date_iso(emissao_ate):
+        current_query = current_query.filter(Proposta.data_emissao_iso <= parse_date_iso(emissao_ate))
+
+    # Paginação por chave (sem OFFSET) e totais em cache: o custo não cresce com a página
+    totais = contar_listagem((razao_social, cnpj, id_proposta, cod_vendedor, emissao_de, emissao_ate), current_query)
+    total_propostas = totais['total']
+    current_propostas, cursor_anterior, cursor_proximo = paginar_por_chave(
+        current_query, sort, order, per_page, cursor
+    )
 
     base_ids = [p.id_proposta_base or p.id_proposta for p in current_propostas]
     grupos_lista = []
-    propostas_para_backfill = []
+    todas_versoes = []
 
     if base_ids:
         all_versions = Proposta.query.filter(base_expr.in_(base_ids)).all()
-        propostas_para_backfill = all_versions
+        todas_versoes = all_versions
         grupos = {}
         for proposta in all_versions:
             base_id = proposta.id_proposta_base or proposta.id_proposta
@@ -636,84 +2047,20 @@ def listagem():
 
     hoje = date.today()
     limite_vencendo = hoje + timedelta(days=7)
-    total_vencidas = 0
-    alterou = False
-    for proposta in propostas_para_backfill:
-        # Backfill de data de vencimento se faltar
-        if not proposta.data_vencimento and proposta.data_emissao:
-            data_emissao_date = parse_date_br(proposta.data_emissao)
-            data_vencimento = compute_data_vencimento(proposta.validade, data_emissao_date)
-            if not data_vencimento and data_emissao_date:
-                data_vencimento = data_emissao_date + timedelta(days=30)
-            if data_vencimento:
-                proposta.data_vencimento = data_vencimento
-                alterou = True
-
-        # Backfill de cod pelo nome do arquivo
-        if not proposta.cod_vendedor and proposta.nome_arquivo_pdf:
-            cod = extract_cod_from_filename(proposta.nome_arquivo_pdf)
-            if cod:
-                proposta.cod_vendedor = cod
-                alterou = True
-        if proposta.razao_social:
-            razao_upper = proposta.razao_social.upper()
-            if proposta.razao_social != razao_upper:
-                proposta.razao_social = razao_upper
-                alterou = True
-
-        # Backfill leve para tipo (sem abrir PDF)
-        if (proposta.tipo is None or clean_info(proposta.tipo) is None) and proposta.nome_arquivo_pdf:
-            tipo = extract_tipo_from_filename(proposta.nome_arquivo_pdf)
-            if tipo:
-                proposta.tipo = tipo
-                alterou = True
-
-        # Flags para status de vencimento
+    for proposta in todas_versoes:
+        # Flags para status de vencimento (a normalização dos dados é feita na gravação)
         proposta.vencida = False
         proposta.vencendo = False
         if proposta.data_vencimento:
             if proposta.data_vencimento < hoje:
                 proposta.vencida = True
-                total_vencidas += 1
             elif proposta.data_vencimento <= limite_vencendo:
                 proposta.vencendo = True
 
-        # Backfill base/versao com base nos 3 primeiros dígitos do arquivo
-        base_id = extract_base_id_from_filename(proposta.nome_arquivo_pdf) if proposta.nome_arquivo_pdf else None
-        versao = extract_version_from_filename(proposta.nome_arquivo_pdf) if proposta.nome_arquivo_pdf else None
-        if base_id and proposta.id_proposta_base != base_id:
-            proposta.id_proposta_base = base_id
-            proposta.versao = versao or proposta.versao
-            alterou = True
-        elif not proposta.id_proposta_base:
-            base_id_fallback, versao_fallback = split_proposta_id(proposta.id_proposta)
-            proposta.id_proposta_base = base_id_fallback
-            proposta.versao = proposta.versao or versao_fallback
-            alterou = True
-
-        if proposta.vencida:
-            if proposta.observacoes in (None, '', 'Em negociação', 'Vencida'):
-                if proposta.observacoes != 'Vencida':
-                    proposta.observacoes = 'Vencida'
-                    alterou = True
-        elif not proposta.observacoes:
-            proposta.observacoes = 'Em negociação'
-            alterou = True
-
-    if alterou:
-        db.session.commit()
-
-    totals = count_query.with_entities(
-        func.sum(case((Proposta.observacoes == 'Ganha', 1), else_=0)).label('ganhas'),
-        func.sum(case((Proposta.observacoes == 'Perdida', 1), else_=0)).label('perdidas'),
-        func.sum(case((Proposta.observacoes == 'Em negociação', 1), else_=0)).label('abertas'),
-        func.sum(case((Proposta.observacoes == 'Vencida', 1), else_=0)).label('vencidas')
-    ).first()
-    total_ganhas = totals.ganhas or 0
-    total_perdidas = totals.perdidas or 0
-    total_abertas = totals.abertas or 0
-    total_vencidas_dashboard = totals.vencidas or 0
-    total_vencidas = total_vencidas_dashboard
+    total_ganhas = totais['ganhas']
+    total_perdidas = totais['perdidas']
+    total_abertas = totais['abertas']
+    total_vencidas = totais['vencidas']
 
     return render_template('listagem.html', 
                          grupos=grupos_lista,
@@ -722,6 +2069,8 @@ def listagem():
                              'cnpj': cnpj,
                              'id_proposta': id_proposta,
                              'cod_vendedor': cod_vendedor,
+                             'emissao_de': emissao_de,
+                             'emissao_ate': emissao_ate,
                              'sort': sort,
                              'order': order,
                              'per_page': per_page
@@ -731,34 +2080,49 @@ def listagem():
                          total_ganhas=total_ganhas,
                          total_perdidas=total_perdidas,
                          total_abertas=total_abertas,
-                         total_vencidas_dashboard=total_vencidas_dashboard,
-                         page=page,
+                         total_vencidas_dashboard=total_vencidas,
+                         cursor=cursor,
+                         cursor_anterior=cursor_anterior,
+                         cursor_proximo=cursor_proximo,
                          per_page=per_page,
-                         total_pages=total_pages,
                          sort=sort,
-                         order=order)
+                         order=order,
+                         reprocessamento=ReprocessamentoJob.query.filter(
+                             ReprocessamentoJob.status.in_(['running', 'paused'])
+                         ).first())
 
 
 @app.route('/api/upload_status')
 def upload_status():
     """Status da fila de importação"""
-    with upload_lock:
-        global upload_total, upload_done
-        total = upload_total
-        done = upload_done
-        pending = max(total - done, 0)
-        if total and pending == 0:
-            # Reset to avoid oscillating progress bar after completion
-            upload_total = 0
-            upload_done = 0
-    percent = int((done / total) * 100) if total else 0
-    return jsonify({
-        'total': total,
-        'done': done,
-        'pending': pending,
-        'percent': percent,
-        'completed': True if total and pending == 0 else False
-    })
+    return jsonify(upload_progress(concluir=True))
+
+
+@app.route('/api/upload_events')
+def upload_events():
+    """Stream (SSE) com o progresso da importação, enviado só quando algo muda."""
+    fila = Queue(maxsize=1000)
+    inicial = upload_progress()
+    keepalive = app.config['UPLOAD_EVENTS_KEEPALIVE']
+
+    def stream():
+        with upload_subscribers_lock:
+            upload_subscribers.add(fila)
+        try:
+            yield "retry: 5000\n\n"
+            yield f"event: progresso\ndata: {json.dumps(inicial)}\n\n"
+            while True:
+                try:
+                    yield fila.get(timeout=keepalive)
+                except Empty:
+                    # Comentário SSE: mantém a conexão aberta em proxies
+                    yield ": keep-alive\n\n"
+        finally:
+            with upload_subscribers_lock:
+                upload_subscribers.discard(fila)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @app.route('/clientes')
@@ -772,17 +2136,11 @@ def clientes():
 def relatorio():
     """Página de relatórios"""
     clientes = Cliente.query.order_by(Cliente.nome.asc()).all()
-    return render_template('relatorio.html', clientes=clientes)
-
-
-def _autosize_sheet(ws):
-    for col in ws.columns:
-        max_len = 0
-        col_letter = get_column_letter(col[0].column)
-        for cell in col:
-            if cell.value is not None:
-                max_len = max(max_len, len(str(cell.value)))
-        ws.column_dimensions[col_letter].width = min(max_len + 2, 60)
+    return render_template('relatorio.html',
+                           clientes=clientes,
+                           regioes=Regiao.query.order_by(Regiao.nome.asc()).all(),
+                           setores=Setor.query.order_by(Setor.nome.asc()).all(),
+                           relatorio_jobs=RelatorioJob.query.order_by(RelatorioJob.id.desc()).limit(10).all())
 
 
 @app.route('/relatorio/export', methods=['POST'])
@@ -794,93 +2152,249 @@ def relatorio_export():
         return redirect(url_for('relatorio'))
 
     cliente = Cliente.query.get_or_404(int(cliente_id))
-    contatos = Contato.query.filter_by(cliente_id=cliente.id).order_by(Contato.nome.asc()).all()
-    visitas = Visita.query.filter_by(cliente_id=cliente.id).order_by(Visita.data.desc()).all()
-    equipamentos = Equipamento.query.filter_by(cliente_id=cliente.id).order_by(Equipamento.nome.asc()).all()
-    cnpj_normalizado = cliente.cnpj_normalizado or normalize_cnpj(cliente.cnpj)
-    propostas = Proposta.query.filter(
-        (Proposta.cnpj == cliente.cnpj) |
-        (func.replace(func.replace(func.replace(Proposta.cnpj, '.', ''), '/', ''), '-', '') == cnpj_normalizado)
-    ).order_by(Proposta.id_proposta.asc()).all()
-
-    wb = Workbook()
-
-    ws_info = wb.active
-    ws_info.title = 'Cliente'
-    ws_info.append(['Campo', 'Valor'])
-    ws_info.append(['Nome', cliente.nome])
-    ws_info.append(['CNPJ', cliente.cnpj])
-    ws_info.append(['Contato principal', cliente.contato or ''])
-    ws_info.append(['Email principal', cliente.email or ''])
-    ws_info.append(['Telefone principal', cliente.telefone or ''])
-    ws_info.append(['Endereço', cliente.endereco or ''])
-    ws_info.append(['Região', cliente.regiao or ''])
-    ws_info.append(['CPM Status', cliente.cpm_status or ''])
-    if cliente.cpm_data:
-        ws_info.append(['CPM Data', cliente.cpm_data.strftime('%d/%m/%Y')])
-    _autosize_sheet(ws_info)
-
-    ws_contatos = wb.create_sheet('Contatos')
-    ws_contatos.append(['Nome', 'Email', 'Telefone', 'Cargo', 'Setor'])
-    for c in contatos:
-        ws_contatos.append([c.nome, c.email or '', c.telefone or '', c.cargo or '', c.setor or ''])
-    _autosize_sheet(ws_contatos)
-
-    ws_equip = wb.create_sheet('Parque instalado')
-    ws_equip.append(['Equipamento', 'Quantidade', 'Marca', 'Modelo', 'Ano'])
-    for e in equipamentos:
-        ws_equip.append([
-            e.nome,
-            e.quantidade if e.quantidade is not None else '',
-            e.marca or '',
-            e.modelo or '',
-            e.ano_instalacao if e.ano_instalacao is not None else ''
-        ])
-    _autosize_sheet(ws_equip)
-
-    ws_visitas = wb.create_sheet('Visitas')
-    ws_visitas.append(['Data', 'Histórico'])
-    for v in visitas:
-        ws_visitas.append([
-            v.data.strftime('%d/%m/%Y') if v.data else '',
-            v.historico or ''
-        ])
-    _autosize_sheet(ws_visitas)
-
-    ws_propostas = wb.create_sheet('Propostas')
-    ws_propostas.append(['ID Proposta', 'Razão Social', 'Data Emissão', 'Valor Total', 'Cod Vendedor'])
-    for p in propostas:
-        ws_propostas.append([
-            p.id_proposta or '',
-            p.razao_social or '',
-            p.data_emissao or '',
-            p.valor_total or '',
-            p.cod_vendedor or ''
-        ])
-    _autosize_sheet(ws_propostas)
-
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
+    output = io.BytesIO(montar_relatorio_cliente(carregar_dados_relatorio([cliente])[cliente.id]))
 
     filename = f"relatorio_cliente_{cliente.id}.xlsx"
     return send_file(output, as_attachment=True, download_name=filename,
                      mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
 
 
+def _reais(centavos):
+    return centavos / 100
+
+
+# Exportação completa (/relatorio/export_propostas): (título, coluna, formatação do valor)
+EXPORTACAO_PROPOSTAS = [
+    ('ID Proposta', Proposta.id_proposta, None),
+    ('Razão Social', Proposta.razao_social, None),
+    ('Nome Fantasia', Proposta.nome_fantasia, None),
+    ('CNPJ', Proposta.cnpj, None),
+    ('Cod Vendedor', Proposta.cod_vendedor, None),
+    ('Tipo', Proposta.tipo, None),
+    ('Data Emissão', Proposta.data_emissao, None),
+    ('Validade', Proposta.validade, None),
+    ('Data Vencimento', Proposta.data_vencimento, lambda v: v.strftime('%d/%m/%Y')),
+    ('Valor Total (R$)', Proposta.valor_total_centavos, _reais),
+    ('Status', Proposta.observacoes, None),
+    ('Versão', Proposta.versao, None),
+    ('Versão Atual', Proposta.versao_atual, lambda v: 'Sim' if v else 'Não'),
+    ('Data Importação', Proposta.data_importacao, lambda v: v.strftime('%d/%m/%Y %H:%M')),
+]
+EXPORTACAO_ITENS = [
+    ('ID Proposta', Proposta.id_proposta, None),
+    ('Item', ItemProposta.numero, None),
+    ('Descrição', ItemProposta.descricao, None),
+    ('Quantidade', ItemProposta.quantidade, None),
+    ('Valor Unitário (R$)', ItemProposta.valor_unitario_centavos, _reais),
+    ('Valor Total (R$)', ItemProposta.valor_total_centavos, _reais),
+]
+
+
+class _ExportacaoCancelada(Exception):
+    pass
+
+
+def _aba_em_lotes(wb, titulo, colunas, consulta, cancelado=None):
+    """Escreve uma aba write-only com as linhas da consulta, lidas em lotes do cursor.
+
+    Numa aba write-only as larguras precisam existir antes da primeira linha,
+    então não podem vir das linhas escritas: saem de uma consulta à parte, com
+    max(length()) por coluna (no texto do banco, antes da formatação), com a
+    mesma regra de _autosize_sheet.
+    """
+    maiores = db.session.execute(
+        consulta.with_only_columns(*[func.max(func.length(coluna)) for _, coluna, _ in colunas]).order_by(None)
+    ).one()
+    ws = wb.create_sheet(titulo)
+    for n, ((cabecalho, _, _), maior) in enumerate(zip(colunas, maiores), start=1):
+        ws.column_dimensions[get_column_letter(n)].width = min(max(len(cabecalho), maior or 0) + 2, 60)
+    ws.append([cabecalho for cabecalho, _, _ in colunas])
+
+    resultado = db.session.execute(consulta.execution_options(yield_per=app.config['EXPORTACAO_LOTE']))
+    for linhas in resultado.partitions():
+        if cancelado is not None and cancelado.is_set():
+            raise _ExportacaoCancelada()
+        for linha in linhas:
+            ws.append([
+                (formatar(valor) if formatar else valor) if valor is not None else ''
+                for valor, (_, _, formatar) in zip(linha, colunas)
+            ])
+
+
+def gerar_exportacao_propostas(destino, cancelado=None):
+    """Grava em destino o XLSX com todas as propostas e seus itens (workbook write-only).
+
+    Se o Event cancelado for acionado, para no próximo lote com _ExportacaoCancelada.
+    """
+    wb = Workbook(write_only=True)
+    _aba_em_lotes(wb, 'Propostas', EXPORTACAO_PROPOSTAS, select(
+        *[coluna for _, coluna, _ in EXPORTACAO_PROPOSTAS]
+    ).order_by(Proposta.id_proposta), cancelado)
+    _aba_em_lotes(wb, 'Itens', EXPORTACAO_ITENS, select(
+        *[coluna for _, coluna, _ in EXPORTACAO_ITENS]
+    ).join(Proposta, Proposta.id == ItemProposta.proposta_id).order_by(ItemProposta.proposta_id, ItemProposta.id),
+        cancelado)
+    wb.save(destino)
+
+
+class _SaidaSequencial(io.RawIOBase):
+    """Arquivo só de escrita e sem seek/tell.
+
+    Sem seek, o zipfile grava cada membro em sequência (com data descriptors)
+    em vez de voltar para corrigir cabeçalhos: o que já está no spool não muda
+    e pode ser enviado enquanto o wb.save() escreve o restante. Com o Event
+    cancelado acionado, a próxima escrita levanta _ExportacaoCancelada.
+    """
+
+    def __init__(self, fh, cancelado=None):
+        self.fh = fh
+        self.cancelado = cancelado
+        self.interrompida = False
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        if self.cancelado is not None and self.cancelado.is_set():
+            if not self.interrompida:
+                # Levanta uma vez; o fechamento do zip pelo coletor de lixo não escreve mais nada
+                self.interrompida = True
+                raise _ExportacaoCancelada()
+            return len(dados)
+        self.fh.write(dados)
+        self.fh.flush()
+        return len(dados)
+
+
+@app.route('/relatorio/export_propostas')
+def relatorio_export_propostas():
+    """Exporta todas as propostas e itens em XLSX, gerado numa thread e enviado pelo spool
+
+    O openpyxl write-only guarda as linhas de cada aba em arquivos temporários
+    e só monta o .xlsx (zip) no wb.save(), depois de ler todas as linhas: até
+    lá não sai nenhum byte, e o envio acontece praticamente no fim. O ganho é
+    de memória (nenhuma planilha montada em RAM), não de tempo até o primeiro byte.
+    """
+    spool = tempfile.NamedTemporaryFile(prefix='export_propostas_', suffix='.xlsx', delete=False)
+    pronto = threading.Event()
+    # Acionado quando o envio termina (inclusive se o cliente desconectar)
+    cancelado = threading.Event()
+    erros = []
+
+    def gerar():
+        try:
+            with app.app_context():
+                gerar_exportacao_propostas(_SaidaSequencial(spool, cancelado), cancelado)
+        except _ExportacaoCancelada:
+            pass
+        except Exception as e:
+            print(f"Erro na exportação das propostas: {e}")
+            erros.append(e)
+        finally:
+            spool.close()
+            pronto.set()
+
+    threading.Thread(target=gerar, daemon=True).start()
+
+    def enviar():
+        try:
+            with open(spool.name, 'rb') as fh:
+                while True:
+                    terminou = pronto.is_set()
+                    pedaco = fh.read(64 * 1024)
+                    if pedaco:
+                        yield pedaco
+                    elif terminou:
+                        break
+                    else:
+                        pronto.wait(0.2)
+            if erros:
+                # Interrompe a resposta: o navegador não pode receber um .xlsx truncado como completo
+                raise RuntimeError(f"Exportação das propostas interrompida: {erros[0]}")
+        finally:
+            cancelado.set()
+            try:
+                os.remove(spool.name)
+            except OSError:
+                pass
+
+    filename = f"propostas_completo_{datetime.now():%Y%m%d}.xlsx"
+    return Response(enviar(), mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+@app.route('/relatorio/lote', methods=['POST'])
+def relatorio_lote():
+    """Gera em segundo plano um ZIP com o relatório de cada cliente do filtro"""
+    ativo = RelatorioJob.query.filter(RelatorioJob.status.in_(['queued', 'running'])).first()
+    if ativo:
+        flash('Já existe uma geração de relatórios em andamento.', 'warning')
+        return redirect(url_for('relatorio'))
+
+    job = RelatorioJob(
+        filtro_regiao=request.form.get('regiao', '').strip() or None,
+        filtro_setor=request.form.get('setor', '').strip() or None,
+        filtro_cpm_status=request.form.get('cpm_status', '').strip() or None,
+    )
+    total = _relatorio_clientes_query(job).count()
+    if not total:
+        flash('Nenhum cliente encontrado com esses filtros.', 'warning')
+        return redirect(url_for('relatorio'))
+    job.total = total
+    db.session.add(job)
+    start_relatorio_thread(job)
+    flash(f'Gerando os relatórios de {total} cliente(s) em segundo plano.', 'success')
+    return redirect(url_for('relatorio'))
+
+
+@app.route('/relatorio/lote/<int:id>/download')
+def relatorio_lote_download(id):
+    """Baixa o ZIP de um job de relatórios concluído"""
+    job = RelatorioJob.query.get_or_404(id)
+    if job.status != 'done' or not job.arquivo or not os.path.exists(job.arquivo) or \
+            (job.expira_em and job.expira_em <= datetime.now()):
+        flash('Relatórios indisponíveis (ainda em geração ou expirados).', 'warning')
+        return redirect(url_for('relatorio'))
+    return send_file(job.arquivo, mimetype='application/zip', as_attachment=True,
+                     download_name=f"relatorios_clientes_{job.id}.zip")
+
+
+@app.route('/api/relatorio_jobs')
+def api_relatorio_jobs():
+    """Status dos jobs de relatórios em lote mais recentes"""
+    jobs = RelatorioJob.query.order_by(RelatorioJob.id.desc()).limit(10).all()
+    return jsonify([job.to_dict() for job in jobs])
+
+
 @app.route('/relatorio/export_db')
 def relatorio_export_db():
-    """Exporta o banco SQLite completo"""
-    db_path = os.path.join(app.instance_path, 'database.db')
-    if not os.path.exists(db_path):
+    """Exporta o banco SQLite completo (cópia consistente, compactada em gzip durante o envio)"""
+    db_path = db.engine.url.database
+    if not db_path or not os.path.exists(db_path):
         flash('Banco de dados nao encontrado.', 'error')
         return redirect(url_for('relatorio'))
-    return send_file(
-        db_path,
-        mimetype='application/x-sqlite3',
-        as_attachment=True,
-        download_name='database.db'
-    )
+
+    fd, copia = tempfile.mkstemp(prefix='export_db_', suffix='.db')
+    os.close(fd)
+    try:
+        backup_sqlite(copia)
+    except Exception as e:
+        os.remove(copia)
+        flash(f'Erro ao copiar o banco de dados: {str(e)}', 'error')
+        return redirect(url_for('relatorio'))
+    response = Response(gzip_stream(copia), mimetype='application/gzip',
+                        headers={'Content-Disposition': 'attachment; filename=database.db.gz'})
+
+    # Apagar a cópia quando a resposta for fechada, mesmo que o gerador nunca tenha
+    # começado (HEAD, cliente que desconecta antes do primeiro pedaço)
+    @response.call_on_close
+    def _remover_copia():
+        try:
+            os.remove(copia)
+        except OSError:
+            pass
+
+    return response
 
 
 @app.route('/clientes/novo', methods=['GET', 'POST'])
@@ -930,6 +2444,7 @@ def clientes_novo():
         )
         db.session.add(cliente)
         db.session.flush()
+        vincular_propostas_cliente(cliente)
 
         nomes_contatos = request.form.getlist('contato_nome[]')
         emails_contatos = request.form.getlist('contato_email[]')
@@ -1001,11 +2516,7 @@ def regioes_novo():
 def cliente_detalhes(id):
     """Detalhes do cliente e propostas vinculadas"""
     cliente = Cliente.query.get_or_404(id)
-    cnpj_normalizado = cliente.cnpj_normalizado or normalize_cnpj(cliente.cnpj)
-    propostas = Proposta.query.filter(
-        (Proposta.cnpj == cliente.cnpj) |
-        (func.replace(func.replace(func.replace(Proposta.cnpj, '.', ''), '/', ''), '-', '') == cnpj_normalizado)
-    ).order_by(Proposta.id_proposta.asc()).all()
+    propostas = propostas_do_cliente(cliente).all()
     visitas = Visita.query.filter_by(cliente_id=cliente.id).order_by(Visita.data.desc()).all()
     setores = Setor.query.order_by(Setor.nome.asc()).all()
     contatos = Contato.query.filter_by(cliente_id=cliente.id).order_by(Contato.nome.asc()).all()
@@ -1072,6 +2583,7 @@ def cliente_editar(id):
         cliente.cpm_status = cpm_status or None
         cliente.cpm_data = cpm_data
         cliente.regiao = regiao or None
+        vincular_propostas_cliente(cliente)
 
         db.session.commit()
         flash('Cliente atualizado com sucesso!', 'success')
@@ -1238,6 +2750,7 @@ def cliente_deletar(id):
         Contato.query.filter_by(cliente_id=cliente.id).delete()
         Equipamento.query.filter_by(cliente_id=cliente.id).delete()
         Visita.query.filter_by(cliente_id=cliente.id).delete()
+        Proposta.query.filter_by(cliente_id=cliente.id).update({'cliente_id': None}, synchronize_session=False)
         db.session.delete(cliente)
         db.session.commit()
         flash('Cliente deletado com sucesso!', 'success')
@@ -1276,15 +2789,10 @@ def detalhes(id):
     """Página de detalhes de uma proposta"""
     proposta = Proposta.query.get_or_404(id)
     itens = ItemProposta.query.filter_by(proposta_id=id).all()
-    total_itens = 0.0
-    for item in itens:
-        if not item.valor_total:
-            continue
-        try:
-            valor = item.valor_total.replace('.', '').replace(',', '.')
-            total_itens += float(valor)
-        except Exception:
-            continue
+    total_centavos = db.session.query(func.sum(ItemProposta.valor_total_centavos)).filter(
+        ItemProposta.proposta_id == id
+    ).scalar()
+    total_itens = total_centavos / 100 if total_centavos else 0.0
     return render_template('detalhes.html', proposta=proposta, itens=itens, total_itens=total_itens)
 
 
@@ -1301,6 +2809,7 @@ def editar(id):
     """Editar proposta"""
     proposta = Proposta.query.get_or_404(id)
     if request.method == 'POST':
+        base_anterior = base_key(proposta)
         proposta.id_proposta = request.form.get('id_proposta', '').strip() or proposta.id_proposta
         proposta.data_emissao = request.form.get('data_emissao', '').strip() or proposta.data_emissao
         data_vencimento_str = request.form.get('data_vencimento', '').strip()
@@ -1324,6 +2833,9 @@ def editar(id):
         observacoes = request.form.get('observacoes', '').strip()
         proposta.observacoes = observacoes if observacoes else proposta.observacoes
 
+        normalizar_proposta(proposta)
+        if base_key(proposta) != base_anterior:
+            atualizar_versao_atual([base_anterior, base_key(proposta)])
         db.session.commit()
         flash('Proposta atualizada com sucesso!', 'success')
         return redirect(url_for('detalhes', id=proposta.id))
@@ -1348,6 +2860,8 @@ def atualizar_observacoes(id):
     proposta = Proposta.query.get_or_404(id)
     observacoes = request.form.get('observacoes', '').strip()
     proposta.observacoes = observacoes if observacoes else None
+    # Status vazio volta a "Em negociação" (ou "Vencida"), como na edição
+    normalizar_proposta(proposta)
     db.session.commit()
     flash('Observações atualizadas com sucesso!', 'success')
     return redirect(url_for('listagem'))
@@ -1367,14 +2881,15 @@ def reprocessar_pdf(id):
         return redirect(url_for('listagem'))
 
     try:
-        extractor = PropostaExtractor(pdf_path)
-        dados = extractor.extract_all()
+        dados = extract_pdf(pdf_path, extraction_cache)
         if not dados:
             flash('Não foi possível extrair informações do PDF.', 'warning')
             return redirect(url_for('listagem'))
 
         apply_pdf_data(proposta, dados)
+        normalizar_proposta(proposta)
         replace_itens(proposta, dados.get('itens'))
+        mark_extracted(proposta, pdf_path)
 
         db.session.commit()
         flash('PDF reprocessado com sucesso!', 'success')
@@ -1387,18 +2902,144 @@ def reprocessar_pdf(id):
 
 @app.route('/reprocessar_todos', methods=['POST'])
 def reprocessar_todos():
-    """Reprocessa todos os PDFs disponíveis e atualiza campos extraídos."""
-    if reprocess_status.get('running'):
-        flash('Reprocessamento já em andamento.', 'warning')
+    """Reprocessa os PDFs alterados ou extraídos por outra versão do extrator."""
+    ativo = ReprocessamentoJob.query.filter(ReprocessamentoJob.status.in_(['running', 'paused'])).first()
+    if ativo:
+        flash('Já existe um reprocessamento em andamento ou pausado.', 'warning')
+        return redirect(url_for('listagem'))
+
+    job = ReprocessamentoJob(
+        filtro_cod_vendedor=request.form.get('cod_vendedor', '').strip() or None,
+        filtro_data_inicio=parse_date_iso(request.form.get('data_inicio', '').strip()),
+        filtro_data_fim=parse_date_iso(request.form.get('data_fim', '').strip()),
+    )
+    job.total = _reprocess_query(job).count()
+    db.session.add(job)
+    start_reprocess_thread(job)
+    flash(f'Reprocessamento iniciado em segundo plano ({job.total} proposta(s) a verificar).', 'success')
+    return redirect(url_for('listagem'))
+
+
+@app.route('/reprocessar_todos/pausar', methods=['POST'])
+def reprocessar_pausar():
+    """Pausa o reprocessamento ao fim do lote atual."""
+    job = ReprocessamentoJob.query.filter_by(status='running').first()
+    if job:
+        job.status = 'paused'
+        db.session.commit()
+        flash('Reprocessamento será pausado ao fim do lote atual.', 'success')
+    return redirect(url_for('listagem'))
+
+
+@app.route('/reprocessar_todos/retomar', methods=['POST'])
+def reprocessar_retomar():
+    """Retoma o reprocessamento pausado a partir do checkpoint."""
+    job = ReprocessamentoJob.query.filter_by(status='paused').first()
+    if not job:
         return redirect(url_for('listagem'))
+    if reprocess_thread is not None and reprocess_thread.is_alive():
+        flash('Aguarde o lote atual terminar antes de retomar.', 'warning')
+        return redirect(url_for('listagem'))
+    start_reprocess_thread(job)
+    flash('Reprocessamento retomado.', 'success')
+    return redirect(url_for('listagem'))
+
 
-    reprocess_status['running'] = True
-    thread = threading.Thread(target=_reprocess_all_worker, daemon=True)
-    thread.start()
-    flash('Reprocessamento iniciado em segundo plano. Aguarde alguns minutos.', 'success')
+@app.route('/reprocessar_todos/cancelar', methods=['POST'])
+def reprocessar_cancelar():
+    """Cancela o reprocessamento (as propostas já atualizadas permanecem)."""
+    job = ReprocessamentoJob.query.filter(ReprocessamentoJob.status.in_(['running', 'paused'])).first()
+    if job:
+        job.status = 'cancelled'
+        job.worker = None
+        db.session.commit()
+        flash('Reprocessamento cancelado.', 'success')
     return redirect(url_for('listagem'))
 
 
+@app.route('/api/reprocess_status')
+def reprocess_status():
+    """Status do reprocessamento mais recente"""
+    job = ReprocessamentoJob.query.order_by(ReprocessamentoJob.id.desc()).first()
+    return jsonify(job.to_dict() if job else {})
+
+
+@app.route('/api/tarefas_status')
+def api_tarefas_status():
+    """Status das tarefas agendadas (última execução, resultado e próxima execução)."""
+    formato = '%d/%m/%Y %H:%M:%S'
+    with tarefas_lock:
+        return jsonify({
+            nome: {
+                'ultima_execucao': t['ultima'].strftime(formato) if t['ultima'] else None,
+                'proxima_execucao': t['proxima'].strftime(formato),
+                'duracao_ms': t['duracao_ms'],
+                'execucoes': t['execucoes'],
+                'resultado': t['resultado'],
+                'erro': t['erro'],
+            }
+            for nome, t in tarefas_agendadas.items()
+        })
+
+
+@app.before_request
+def iniciar_metricas_requisicao():
+    g.metricas_inicio = time.perf_counter()
+    g.metricas_sql = [0, 0.0]  # comandos SQL, segundos no banco
+
+
+@app.after_request
+def status_metricas_requisicao(response):
+    g.metricas_status = response.status_code
+    return response
+
+
+@app.teardown_request
+def registrar_metricas_requisicao(erro=None):
+    """Registra duração, status e SQL da requisição.
+
+    Respostas com stream_with_context (ex.: /api/propostas) são medidas até o
+    fim do stream; as demais em stream (exportações, /api/upload_events), até a
+    view retornar.
+    """
+    if 'metricas_inicio' not in g:
+        return
+    duracao = time.perf_counter() - g.pop('metricas_inicio')
+    comandos, segundos_sql = g.metricas_sql
+    # Rota (padrão da URL, não o caminho) para não criar uma série por id
+    rota = request.url_rule.rule if request.url_rule else 'desconhecida'
+    status = g.get('metricas_status', 500)
+    http_requisicoes.inc(rota=rota, metodo=request.method, status=status)
+    http_duracao.observar(duracao, rota=rota, metodo=request.method)
+    http_sql_comandos.observar(comandos, rota=rota)
+    http_sql_segundos.observar(segundos_sql, rota=rota)
+    requisicoes_lentas.registrar(
+        duracao * 1000, rota=rota, metodo=request.method, caminho=request.full_path.rstrip('?'),
+        status=status, sql_comandos=comandos, sql_ms=round(segundos_sql * 1000, 1),
+    )
+
+
+@app.route('/metrics')
+def metrics():
+    """Métricas do processo no formato texto do Prometheus."""
+    contagem = dict(
+        db.session.query(IngestaoJob.status, func.count(IngestaoJob.id)).group_by(IngestaoJob.status).all()
+    )
+    for status in UPLOAD_EVENT_BY_STATUS:
+        ingestao_jobs.definir(contagem.get(status, 0), status=status)
+    ingestao_fila_gravacao.definir(write_queue.qsize())
+    return Response(metricas.texto(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/api/requisicoes_lentas')
+def api_requisicoes_lentas():
+    """Requisições lentas mais recentes (a partir de METRICAS_LENTA_MS), da mais lenta para a mais rápida."""
+    return jsonify({
+        'limite_ms': requisicoes_lentas.limite_ms,
+        'requisicoes': requisicoes_lentas.listar(),
+    })
+
+
 @app.route('/deletar/<int:id>', methods=['POST'])
 def deletar(id):
     """Deletar uma proposta"""
@@ -1406,12 +3047,11 @@ def deletar(id):
     
     try:
         # Deletar arquivo PDF
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], proposta.nome_arquivo_pdf)
-        if os.path.exists(filepath):
-            os.remove(filepath)
+        remove_pdf_files(proposta.nome_arquivo_pdf)
         
         # Deletar do banco (itens serão deletados em cascata)
         db.session.delete(proposta)
+        atualizar_versao_atual([base_key(proposta)])
         db.session.commit()
         
         flash(f'Proposta {proposta.id_proposta} deletada com sucesso!', 'success')
@@ -1439,11 +3079,9 @@ def deletar_multiplos():
     try:
         propostas = Proposta.query.filter(Proposta.id.in_(ids_int)).all()
         for proposta in propostas:
-            if proposta.nome_arquivo_pdf:
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], proposta.nome_arquivo_pdf)
-                if os.path.exists(filepath):
-                    os.remove(filepath)
+            remove_pdf_files(proposta.nome_arquivo_pdf)
             db.session.delete(proposta)
+        atualizar_versao_atual(base_key(p) for p in propostas)
         db.session.commit()
         flash(f'{len(propostas)} proposta(s) excluída(s) com sucesso!', 'success')
     except Exception as e:
@@ -1453,11 +3091,153 @@ def deletar_multiplos():
     return redirect(url_for('listagem'))
 
 
+# Campos de /api/propostas (?fields=): os mesmos de Proposta.to_dict(), que também
+# define o formato das datas
+API_CAMPOS = (
+    'id', 'razao_social', 'nome_fantasia', 'id_proposta', 'data_emissao', 'data_emissao_iso', 'validade',
+    'cnpj', 'cliente_id', 'telefone', 'celular', 'email', 'pessoa_contato', 'descricao_item', 'quantidade',
+    'valor_total', 'valor_total_centavos', 'nome_arquivo_pdf', 'cod_vendedor', 'data_vencimento',
+    'instalacao_status', 'qualificacoes_status', 'treinamento_status', 'garantia_resumo', 'garantia_texto',
+    'tipo', 'observacoes', 'id_proposta_base', 'versao', 'extrator_versao', 'data_importacao',
+    'data_atualizacao',
+)
+API_FORMATOS = {
+    'data_emissao_iso': lambda v: v.isoformat(),
+    'data_vencimento': lambda v: v.strftime('%d/%m/%Y'),
+    'data_importacao': lambda v: v.strftime('%d/%m/%Y %H:%M:%S'),
+    'data_atualizacao': lambda v: v.isoformat(timespec='seconds'),
+}
+API_ORDENACAO = {'id': 'id', 'data_atualizacao': 'data_atualizacao', **LISTAGEM_ORDENACAO}
+
+
+def proposta_api(linha, campos):
+    """Dicionário da proposta (objeto ou linha do SELECT) só com os campos pedidos."""
+    resultado = {}
+    for campo in campos:
+        valor = getattr(linha, campo)
+        formatar = API_FORMATOS.get(campo)
+        resultado[campo] = formatar(valor) if formatar and valor is not None else valor
+    return resultado
+
+
+def embutir_itens(propostas):
+    """Preenche "itens" nos dicionários das propostas com uma consulta só."""
+    por_id = {p['id']: p for p in propostas}
+    for p in propostas:
+        p['itens'] = []
+    if not por_id:
+        return
+    itens = ItemProposta.query.filter(ItemProposta.proposta_id.in_(list(por_id))).order_by(
+        ItemProposta.proposta_id, ItemProposta.id
+    )
+    for item in itens:
+        por_id[item.proposta_id]['itens'].append(item.to_dict())
+
+
+def parse_updated_since(valor):
+    """Lê ?updated_since= (ISO 8601 ou dd/mm/aaaa [hh:mm:ss]); None se ausente, ValueError se inválido."""
+    valor = (valor or '').strip()
+    if not valor:
+        return None
+    for formato in ('%d/%m/%Y %H:%M:%S', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(valor, formato)
+        except ValueError:
+            pass
+    return datetime.fromisoformat(valor)
+
+
+def stream_propostas_api(consulta, campos, com_itens, ndjson):
+    """Gera a resposta em pedaços, lendo API_STREAM_LOTE linhas do cursor por vez.
+
+    Só o lote corrente fica em memória, qualquer que seja o tamanho da tabela.
+    """
+    lote = app.config['API_STREAM_LOTE']
+    resultado = db.session.execute(consulta.execution_options(yield_per=lote))
+    primeiro = True
+    if not ndjson:
+        yield '['
+    for linhas in resultado.partitions():
+        propostas = [proposta_api(linha, campos) for linha in linhas]
+        if com_itens:
+            embutir_itens(propostas)
+        # app.json: mesma serialização do jsonify (chaves ordenadas)
+        if ndjson:
+            yield ''.join(app.json.dumps(p) + '\n' for p in propostas)
+        else:
+            yield ('' if primeiro else ',') + ','.join(app.json.dumps(p) for p in propostas)
+        primeiro = False
+    if not ndjson:
+        yield ']'
+
+
 @app.route('/api/propostas')
 def api_propostas():
-    """API para listar propostas (JSON)"""
-    propostas = Proposta.query.all()
-    return jsonify([p.to_dict() for p in propostas])
+    """API para listar propostas (JSON)
+
+    Sem ?limit=/?cursor= retorna todas, num array JSON enviado em pedaços (ou
+    NDJSON, uma proposta por linha, com ?format=ndjson). Com ?limit=N pagina
+    por chave: a resposta traz "proximo_cursor", que vai em ?cursor= para
+    buscar a página seguinte. Nos dois modos:
+    ?fields=id,razao_social,... escolhe os campos, ?itens=1 inclui os itens e
+    ?updated_since=<data> traz só as propostas alteradas desde a data.
+    """
+    pedidos = [c.strip() for c in request.args.get('fields', '').split(',') if c.strip()]
+    campos = list(dict.fromkeys(['id'] + pedidos)) if pedidos else list(API_CAMPOS)
+    invalidos = [c for c in campos if c not in API_CAMPOS]
+    if invalidos:
+        return jsonify({'erro': f"fields inválido ({', '.join(invalidos)}); use: {', '.join(API_CAMPOS)}"}), 400
+    try:
+        desde = parse_updated_since(request.args.get('updated_since'))
+    except ValueError:
+        return jsonify({'erro': 'updated_since inválido; use ISO 8601 (2025-03-17T08:00:00) ou dd/mm/aaaa'}), 400
+    com_itens = request.args.get('itens', '').strip().lower() in ('1', 'true', 'sim')
+
+    sort = request.args.get('sort', 'data_atualizacao' if desde else 'id').strip()
+    order = request.args.get('order', 'asc').strip().lower()
+    if sort not in API_ORDENACAO:
+        return jsonify({'erro': f"sort inválido; use um de: {', '.join(API_ORDENACAO)}"}), 400
+    if order not in ('asc', 'desc'):
+        order = 'asc'
+
+    # Só a ausência de ?limit= leva ao envio de tudo; um valor inválido não
+    limit = None
+    if 'limit' in request.args:
+        try:
+            limit = int(request.args['limit'])
+        except ValueError:
+            return jsonify({'erro': 'limit inválido; use um inteiro de 1 a 500'}), 400
+    cursor = request.args.get('cursor', '').strip()
+    if limit is None and not cursor:
+        chave = literal_column(API_ORDENACAO[sort])
+        consulta = select(*[getattr(Proposta, c) for c in campos])
+        if desde:
+            consulta = consulta.where(Proposta.data_atualizacao >= desde)
+        if order == 'asc':
+            consulta = consulta.order_by(chave.asc(), Proposta.id.asc())
+        else:
+            consulta = consulta.order_by(chave.desc(), Proposta.id.desc())
+        ndjson = request.args.get('format', '').strip().lower() == 'ndjson'
+        return Response(
+            stream_with_context(stream_propostas_api(consulta, campos, com_itens, ndjson)),
+            mimetype='application/x-ndjson' if ndjson else 'application/json'
+        )
+
+    query = Proposta.query.options(load_only(*[getattr(Proposta, c) for c in campos]))
+    if desde:
+        query = query.filter(Proposta.data_atualizacao >= desde)
+    limit = min(max(limit or 100, 1), 500)
+    propostas, cursor_anterior, cursor_proximo = paginar_por_chave(
+        query, sort, order, limit, cursor, API_ORDENACAO
+    )
+    propostas = [proposta_api(p, campos) for p in propostas]
+    if com_itens:
+        embutir_itens(propostas)
+    return jsonify({
+        'propostas': propostas,
+        'cursor_anterior': cursor_anterior,
+        'proximo_cursor': cursor_proximo,
+    })
 
 
 @app.route('/api/proposta/<int:id>')
@@ -1472,9 +3252,152 @@ def api_proposta(id):
     return jsonify(resultado)
 
 
+def _iter_pdfs_lote(origem):
+    """Percorre os PDFs de um diretório ou arquivo .zip/.tar(.gz); gera (nome, conteúdo)."""
+    if os.path.isdir(origem):
+        for raiz, _, arquivos in os.walk(origem):
+            for nome in sorted(arquivos):
+                if allowed_file(nome):
+                    with open(os.path.join(raiz, nome), 'rb') as fh:
+                        yield nome, fh.read()
+    elif zipfile.is_zipfile(origem):
+        with zipfile.ZipFile(origem) as zf:
+            for info in zf.infolist():
+                nome = os.path.basename(info.filename)
+                if not info.is_dir() and allowed_file(nome):
+                    yield nome, zf.read(info)
+    elif tarfile.is_tarfile(origem):
+        with tarfile.open(origem) as tf:
+            for membro in tf:
+                nome = os.path.basename(membro.name)
+                if membro.isfile() and allowed_file(nome):
+                    yield nome, tf.extractfile(membro).read()
+    else:
+        raise click.BadParameter(f'{origem} não é um diretório nem um arquivo .zip/.tar')
+
+
+@app.cli.command('importar-lote')
+@click.argument('origem', type=click.Path(exists=True))
+@click.option('--lote', default=200, show_default=True, help='Propostas gravadas por transação.')
+@click.option('--workers', default=None, type=int, help='Processos de extração (padrão: EXTRACTION_WORKERS).')
+def importar_lote(origem, lote, workers):
+    """Importa em massa os PDFs de um diretório ou arquivo .zip/.tar.
+
+    Arquivos já importados (mesmo nome ou mesmo conteúdo) são ignorados. A
+    extração roda em paralelo e as propostas são gravadas em transações de
+    LOTE propostas.
+    """
+    workers = app.config['EXTRACTION_WORKERS'] if workers is None else workers
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    inicio = time.monotonic()
+    stats = {'encontrados': 0, 'ignorados_nome': 0, 'ignorados_hash': 0, 'importados': 0,
+             'ja_importados': 0, 'falhas': 0, 'bytes': 0, 'gravacao_s': 0.0}
+
+    # Uma consulta para conhecer tudo o que já foi importado
+    nomes_existentes = set()
+    hashes_existentes = set()
+    for nome, arquivo_hash in db.session.query(Proposta.nome_arquivo_pdf, Proposta.arquivo_hash):
+        nomes_existentes.add(nome)
+        hashes_existentes.add(arquivo_hash)
+    db.session.commit()
+
+    pendentes_commit = 0
+
+    def gravar(item, dados, erro):
+        nonlocal pendentes_commit
+        filepath, filename_original, filename, arquivo_hash = item
+        if erro is not None:
+            stats['falhas'] += 1
+            return
+        inicio_gravacao = time.monotonic()
+        try:
+            with db.session.begin_nested():
+                status, mensagem = add_proposta_from_pdf(filepath, filename_original, filename, dados, arquivo_hash)
+        except Exception as e:
+            print(f"Erro ao processar PDF ({filename_original}): {e}")
+            stats['falhas'] += 1
+            return
+        if status == 'failed':
+            stats['falhas'] += 1
+        elif mensagem:
+            stats['ja_importados'] += 1
+        else:
+            stats['importados'] += 1
+            pendentes_commit += 1
+            if pendentes_commit >= lote:
+                db.session.commit()
+                pendentes_commit = 0
+                click.echo(f"  {stats['importados']} propostas gravadas...")
+        stats['gravacao_s'] += time.monotonic() - inicio_gravacao
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+    em_andamento = {}
+    try:
+        for filename_original, conteudo in _iter_pdfs_lote(origem):
+            stats['encontrados'] += 1
+            filename = secure_filename(filename_original)
+            if filename in nomes_existentes:
+                stats['ignorados_nome'] += 1
+                continue
+            arquivo_hash = hashlib.sha256(conteudo).hexdigest()
+            if arquivo_hash in hashes_existentes:
+                stats['ignorados_hash'] += 1
+                continue
+            nomes_existentes.add(filename)
+            hashes_existentes.add(arquivo_hash)
+
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            with open(filepath, 'wb') as fh:
+                fh.write(conteudo)
+            stats['bytes'] += len(conteudo)
+            item = (filepath, filename_original, filename, arquivo_hash)
+
+            if pool is None:
+                try:
+                    gravar(item, extract_pdf(filepath, extraction_cache) or {}, None)
+                except Exception as e:
+                    print(f"Erro ao extrair PDF ({filepath}): {e}")
+                    gravar(item, None, str(e))
+                continue
+            em_andamento[pool.submit(extract_pdf, filepath, extraction_cache)] = item
+            # Limitar os PDFs em memória/na fila do pool
+            if len(em_andamento) >= workers * 4:
+                prontos, _ = wait(em_andamento, return_when=FIRST_COMPLETED)
+                for future in prontos:
+                    item = em_andamento.pop(future)
+                    gravar(item, *_extraction_result(future, item[0]))
+        for future in list(em_andamento):
+            item = em_andamento.pop(future)
+            gravar(item, *_extraction_result(future, item[0]))
+        inicio_commit = time.monotonic()
+        db.session.commit()
+        stats['gravacao_s'] += time.monotonic() - inicio_commit
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    duracao = time.monotonic() - inicio
+    processados = stats['importados'] + stats['ja_importados'] + stats['falhas']
+    click.echo(f"PDFs encontrados:        {stats['encontrados']}")
+    click.echo(f"Ignorados (nome):        {stats['ignorados_nome']}")
+    click.echo(f"Ignorados (conteúdo):    {stats['ignorados_hash']}")
+    click.echo(f"Importados:              {stats['importados']}")
+    click.echo(f"Já importados:           {stats['ja_importados']}")
+    click.echo(f"Falhas:                  {stats['falhas']}")
+    click.echo(f"Tempo total:             {duracao:.1f} s (gravação no banco: {stats['gravacao_s']:.1f} s)")
+    if duracao > 0:
+        click.echo(f"Vazão:                   {processados / duracao:.1f} PDFs/s, "
+                   f"{stats['bytes'] / duracao / (1024 * 1024):.2f} MB/s")
+
+
 if __name__ == '__main__':
     # Criar diretório de uploads se não existir
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
     print("Banco de dados inicializado!")
+    debug = True
+    # Com o reloader, o processo pai só vigia os arquivos: as threads sobem no
+    # processo filho (WERKZEUG_RUN_MAIN), que é o que atende HTTP
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        iniciar_threads()
     # Rodar aplicação
-    app.run(debug=True, host='0.0.0.0', port=2020)
+    app.run(debug=debug, host='0.0.0.0', port=2020)
@@ -0,0 +1,246 @@
+"""
+Benchmark da extração de PDFs (pdf_reader.PropostaExtractor)
+
+Gera o corpus sintético (benchmarks/corpus.py), mede páginas/s de
+extract_all(), a latência de cada extract_* e o pico de memória (RSS) por
+documento, confere os campos extraídos com os valores esperados e compara
+com uma baseline salva anteriormente.
+
+Uso:
+    python benchmarks/bench_extracao.py                   # mede e compara com a baseline
+    python benchmarks/bench_extracao.py --salvar-baseline # grava a baseline atual
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import resource
+import multiprocessing
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from corpus import gerar_corpus  # noqa: E402
+from pdf_reader import PropostaExtractor, text_sidecar_path, EXTRACTOR_VERSION  # noqa: E402
+
+BASELINE_PADRAO = os.path.join(BENCH_DIR, 'baseline.json')
+
+CAMPOS = [
+    'extract_id_proposta', 'extract_data_emissao', 'extract_validade', 'extract_razao_social',
+    'extract_nome_fantasia', 'extract_cnpj', 'extract_telefone', 'extract_celular', 'extract_email',
+    'extract_pessoa_contato', 'extract_itens', 'extract_valor_total', 'extract_tipo',
+    'extract_servicos', 'extract_garantia',
+]
+
+# Diferenças absolutas abaixo destes limites são tratadas como ruído
+RUIDO_MS = 0.1
+RUIDO_RSS_MB = 2.0
+
+
+def _ru_maxrss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB; macOS em bytes
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def _limpar_sidecar(path):
+    try:
+        os.remove(text_sidecar_path(path))
+    except OSError:
+        pass
+
+
+def medir_extract_all(path, repeticoes):
+    """Tempo de extract_all() lendo o PDF do zero; retorna (segundos, páginas lidas, dados).
+
+    Como nas medidas por campo, vale o menor tempo entre as repetições (o
+    menos afetado por outros processos da máquina).
+    """
+    tempos = []
+    dados = None
+    paginas_lidas = 0
+    for _ in range(repeticoes):
+        _limpar_sidecar(path)
+        extractor = PropostaExtractor(path)
+        inicio = time.perf_counter()
+        dados = extractor.extract_all()
+        tempos.append(time.perf_counter() - inicio)
+        paginas_lidas = len(extractor.pages)
+    _limpar_sidecar(path)
+    return min(tempos), paginas_lidas, dados
+
+
+def medir_campos(path, repeticoes):
+    """Latência (menor tempo, em ms) de cada extract_* sobre o texto completo do documento."""
+    extractor = PropostaExtractor(path)
+    extractor.extract_text()
+    _limpar_sidecar(path)
+    resultado = {}
+    # Medidas de frações de milissegundo: repetir mais para reduzir o ruído
+    repeticoes *= 10
+
+    tempos = []
+    for _ in range(repeticoes):
+        extractor._line_index = None
+        inicio = time.perf_counter()
+        extractor._get_line_index()
+        tempos.append(time.perf_counter() - inicio)
+    resultado['indice_linhas'] = min(tempos) * 1000
+
+    for campo in CAMPOS:
+        metodo = getattr(extractor, campo)
+        tempos = []
+        for _ in range(repeticoes):
+            # Índice recém-construído, sem as buscas em cache de chamadas anteriores
+            extractor._line_index = None
+            extractor._get_line_index()
+            inicio = time.perf_counter()
+            metodo()
+            tempos.append(time.perf_counter() - inicio)
+        resultado[campo] = min(tempos) * 1000
+    return resultado
+
+
+def _rss_worker(path, conn):
+    PropostaExtractor(path).extract_all()
+    conn.send(_ru_maxrss_mb())
+    conn.close()
+
+
+def medir_rss(path):
+    """Pico de RSS (MB) de um processo novo que importa o extrator e roda extract_all()."""
+    ctx = multiprocessing.get_context('spawn')
+    recv, send = ctx.Pipe(duplex=False)
+    processo = ctx.Process(target=_rss_worker, args=(path, send))
+    processo.start()
+    pico = recv.recv()
+    processo.join()
+    _limpar_sidecar(path)
+    return pico
+
+
+def conferir(dados, esperado):
+    """Lista as divergências entre os dados extraídos e os valores esperados."""
+    if not dados:
+        return ['extração falhou']
+    erros = []
+    for campo, valor in esperado.items():
+        if campo == 'itens':
+            itens = [{'quantidade': i['quantidade'], 'valor_total': i['valor_total']} for i in dados['itens']]
+            if itens != valor:
+                erros.append(f"itens: {len(itens)} extraídos, {len(valor)} esperados")
+        elif dados.get(campo) != valor:
+            erros.append(f"{campo}: {dados.get(campo)!r} != {valor!r}")
+    return erros
+
+
+def executar(destino, repeticoes):
+    resultados = {}
+    for path, spec, esperado in gerar_corpus(destino):
+        segundos, paginas_lidas, dados = medir_extract_all(path, repeticoes)
+        pico_rss = medir_rss(path)
+        resultados[spec['nome']] = {
+            'paginas': spec['paginas'],
+            'itens': spec['itens'],
+            'paginas_lidas': paginas_lidas,
+            'extract_all_ms': segundos * 1000,
+            'paginas_por_segundo': spec['paginas'] / segundos if segundos else 0.0,
+            'pico_rss_mb': pico_rss,
+            'campos_ms': medir_campos(path, repeticoes),
+            'erros': conferir(dados, esperado),
+        }
+        r = resultados[spec['nome']]
+        print(
+            f"{spec['nome']:<14} {spec['paginas']:>3} pág ({paginas_lidas:>3} lidas) "
+            f"{r['extract_all_ms']:>9.1f} ms {r['paginas_por_segundo']:>8.1f} pág/s "
+            f"RSS {pico_rss:>6.1f} MB"
+            + (f"  ERROS: {'; '.join(r['erros'])}" if r['erros'] else '')
+        )
+    return resultados
+
+
+def imprimir_campos(resultados):
+    nomes = list(resultados)
+    campos = ['indice_linhas'] + CAMPOS
+    print()
+    print(f"{'latência por campo (ms)':<26}" + ''.join(f"{n[:12]:>13}" for n in nomes))
+    for campo in campos:
+        print(f"{campo:<26}" + ''.join(f"{resultados[n]['campos_ms'][campo]:>13.3f}" for n in nomes))
+
+
+def comparar(resultados, baseline, tolerancia):
+    """Lista as regressões em relação à baseline (piora acima da tolerância)."""
+    regressoes = []
+    for nome, atual in resultados.items():
+        base = baseline.get('resultados', {}).get(nome)
+        if base is None:
+            continue
+        if atual['erros'] and not base.get('erros'):
+            regressoes.append(f"{nome}: campos extraídos divergentes ({'; '.join(atual['erros'])})")
+        if atual['paginas_por_segundo'] < base['paginas_por_segundo'] * (1 - tolerancia):
+            regressoes.append(
+                f"{nome}: {atual['paginas_por_segundo']:.1f} pág/s (baseline {base['paginas_por_segundo']:.1f})"
+            )
+        pico_limite = base['pico_rss_mb'] * (1 + tolerancia)
+        if atual['pico_rss_mb'] > pico_limite and atual['pico_rss_mb'] - base['pico_rss_mb'] > RUIDO_RSS_MB:
+            regressoes.append(f"{nome}: pico RSS {atual['pico_rss_mb']:.1f} MB (baseline {base['pico_rss_mb']:.1f})")
+        for campo, ms in atual['campos_ms'].items():
+            base_ms = base.get('campos_ms', {}).get(campo)
+            if base_ms is None:
+                continue
+            if ms > base_ms * (1 + tolerancia) and ms - base_ms > RUIDO_MS:
+                regressoes.append(f"{nome}: {campo} {ms:.3f} ms (baseline {base_ms:.3f})")
+    return regressoes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark da extração de PDFs de propostas')
+    parser.add_argument('--baseline', default=BASELINE_PADRAO, help='arquivo JSON da baseline')
+    parser.add_argument('--salvar-baseline', action='store_true', help='grava os resultados como nova baseline')
+    parser.add_argument('--repeticoes', type=int, default=3, help='repetições por medida (vale o menor tempo)')
+    parser.add_argument('--tolerancia', type=float, default=0.20, help='piora relativa aceita (0.20 = 20%%)')
+    parser.add_argument('--corpus', help='diretório para os PDFs gerados (padrão: temporário)')
+    args = parser.parse_args(argv)
+
+    destino = args.corpus or tempfile.mkdtemp(prefix='bench_propostas_')
+    try:
+        print(f"Extrator versão {EXTRACTOR_VERSION}, {args.repeticoes} repetições por medida\n")
+        resultados = executar(destino, args.repeticoes)
+        imprimir_campos(resultados)
+    finally:
+        if not args.corpus:
+            shutil.rmtree(destino, ignore_errors=True)
+
+    erros = any(r['erros'] for r in resultados.values())
+    if args.salvar_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as fh:
+            json.dump({
+                'extrator_versao': EXTRACTOR_VERSION,
+                'gerado_em': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'resultados': resultados,
+            }, fh, ensure_ascii=False, indent=2)
+        print(f"\nBaseline salva em {args.baseline}")
+        return 1 if erros else 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nSem baseline em {args.baseline}; rode com --salvar-baseline para criar uma.")
+        return 1 if erros else 0
+
+    with open(args.baseline, 'r', encoding='utf-8') as fh:
+        baseline = json.load(fh)
+    regressoes = comparar(resultados, baseline, args.tolerancia)
+    print(f"\nComparação com a baseline (extrator {baseline.get('extrator_versao')}, {baseline.get('gerado_em')}):")
+    if not regressoes:
+        print(f"  nenhuma regressão acima de {args.tolerancia:.0%}")
+        return 1 if erros else 0
+    for regressao in regressoes:
+        print(f"  REGRESSÃO {regressao}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
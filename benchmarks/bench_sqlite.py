@@ -0,0 +1,154 @@
+"""
+Benchmark de leitura durante a importação (configuração das conexões SQLite)
+
+Cria um banco temporário com o esquema de models.py e, enquanto outro processo
+grava propostas e itens em transações de --lote propostas (como o
+importar-lote), mede a latência da consulta da listagem (página ordenada por
+id_proposta + total de propostas). Roda duas vezes: com o
+SQLite padrão (rollback journal) e com models.SQLITE_PRAGMAS (WAL,
+busy_timeout, synchronous=NORMAL, cache e mmap), e mostra p50/p95/máximo das
+leituras, erros "database is locked" e a vazão de gravação.
+
+Uso:
+    python benchmarks/bench_sqlite.py
+    python benchmarks/bench_sqlite.py --segundos 20 --lote 500
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from sqlalchemy import create_engine, insert, text  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from models import db, Proposta, ItemProposta, SQLITE_PRAGMAS, aplicar_pragmas_sqlite  # noqa: E402
+
+CONSULTA_LISTAGEM = text("""
+    SELECT id, id_proposta, razao_social, data_emissao, valor_total, observacoes
+    FROM propostas WHERE versao_atual = 1 ORDER BY id_proposta, id LIMIT 50
+""")
+CONSULTA_CONTAGEM = text("SELECT count(*) FROM propostas WHERE versao_atual = 1")
+
+ITENS_POR_PROPOSTA = 8
+DESCRICAO = 'AUTOCLAVE HORIZONTAL 542 LITROS - ' + 'especificação técnica ' * 20
+
+
+def _propostas(inicio, quantidade):
+    propostas, itens = [], []
+    for n in range(inicio, inicio + quantidade):
+        propostas.append({
+            'id': n, 'id_proposta': f"BA.{n:07d}/25", 'razao_social': f"HOSPITAL {n % 997}",
+            'data_emissao': '17/03/2025', 'valor_total': '23.900,00', 'observacoes': 'Em negociação',
+            'versao_atual': True, 'nome_arquivo_pdf': f"{n}.pdf",
+        })
+        for i in range(ITENS_POR_PROPOSTA):
+            itens.append({
+                'proposta_id': n, 'numero': f"{i + 1:02d}", 'descricao': DESCRICAO, 'quantidade': '01',
+                'valor_unitario': '23.900,00', 'valor_total': '23.900,00',
+            })
+    return propostas, itens
+
+
+def _engine(path, pragmas):
+    engine = create_engine(f"sqlite:///{path}")
+    aplicar_pragmas_sqlite(engine, pragmas)
+    return engine
+
+
+def gravar(path, pragmas, inicio, lote, parar, gravadas, erros):
+    """Processo escritor: grava lotes de propostas (uma transação por lote) até parar."""
+    engine = _engine(path, pragmas)
+    proximo = inicio
+    while not parar.is_set():
+        propostas, itens = _propostas(proximo, lote)
+        try:
+            with engine.begin() as conn:
+                conn.execute(insert(Proposta.__table__), propostas)
+                conn.execute(insert(ItemProposta.__table__), itens)
+        except OperationalError:
+            erros.value += 1
+            continue
+        proximo += lote
+        gravadas.value += lote
+    engine.dispose()
+
+
+def ler(engine, segundos):
+    """Repete a consulta da listagem; retorna as latências (ms) e o número de erros."""
+    latencias, erros = [], 0
+    fim = time.perf_counter() + segundos
+    while time.perf_counter() < fim:
+        inicio = time.perf_counter()
+        try:
+            with engine.connect() as conn:
+                conn.execute(CONSULTA_LISTAGEM).fetchall()
+                conn.execute(CONSULTA_CONTAGEM).fetchall()
+        except OperationalError:
+            erros += 1
+            continue
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    return latencias, erros
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(int(len(ordenados) * p), len(ordenados) - 1)]
+
+
+def executar(nome, pragmas, destino, args):
+    path = os.path.join(destino, f"{nome}.db")
+    engine = _engine(path, pragmas)
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE INDEX idx_bench_listagem ON propostas(versao_atual, id_proposta, id)"))
+        for inicio in range(1, args.iniciais + 1, 1000):
+            propostas, itens = _propostas(inicio, min(1000, args.iniciais + 1 - inicio))
+            conn.execute(insert(Proposta.__table__), propostas)
+            conn.execute(insert(ItemProposta.__table__), itens)
+
+    ctx = multiprocessing.get_context('spawn')
+    parar, gravadas, erros_escrita = ctx.Event(), ctx.Value('i', 0), ctx.Value('i', 0)
+    escritor = ctx.Process(target=gravar, args=(
+        path, pragmas, args.iniciais + 1, args.lote, parar, gravadas, erros_escrita
+    ))
+    escritor.start()
+    time.sleep(1)  # deixar o escritor abrir o banco e começar a gravar
+    latencias, erros_leitura = ler(engine, args.segundos)
+    parar.set()
+    escritor.join()
+    engine.dispose()
+
+    print(
+        f"{nome:<8} leituras {len(latencias):>6}  p50 {percentil(latencias, 0.50):>7.2f} ms  "
+        f"p95 {percentil(latencias, 0.95):>8.2f} ms  máx {max(latencias, default=0):>8.1f} ms  "
+        f"erros leitura {erros_leitura:>3}  escrita {erros_escrita.value:>3}  "
+        f"gravação {gravadas.value / (args.segundos + 1):>7.0f} propostas/s"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Latência da listagem durante a importação (SQLite)')
+    parser.add_argument('--segundos', type=float, default=10, help='duração de cada medida')
+    parser.add_argument('--lote', type=int, default=200, help='propostas por transação de escrita')
+    parser.add_argument('--iniciais', type=int, default=20000, help='propostas já existentes no banco')
+    args = parser.parse_args(argv)
+
+    destino = tempfile.mkdtemp(prefix='bench_sqlite_')
+    try:
+        print(f"{args.iniciais} propostas iniciais, lotes de {args.lote}, {args.segundos:.0f} s por medida\n")
+        executar('padrao', {}, destino, args)
+        executar('pragmas', SQLITE_PRAGMAS, destino, args)
+    finally:
+        shutil.rmtree(destino, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""
+Geração de um corpus sintético de propostas em PDF para os benchmarks
+
+Os PDFs seguem o layout da proposta de exemplo (002-_SANTA_CASA_DE_VALINHOS_-_cod_016.pdf):
+cabeçalho do cliente, carta de apresentação, descrição e tabela de itens,
+condições comerciais numeradas, garantia, serviços e anexos técnicos. O PDF é
+escrito diretamente (Helvetica + WinAnsiEncoding), sem dependências externas.
+"""
+import os
+import json
+import random
+
+LINHAS_POR_PAGINA = 60
+
+# Variações do corpus: número de páginas, número de itens e se as seções de
+# serviços existem (sem elas o extrator precisa ler o documento inteiro).
+CORPUS_PADRAO = [
+    {'nome': 'curta', 'paginas': 2, 'itens': 1, 'servicos': True},
+    {'nome': 'media', 'paginas': 6, 'itens': 5, 'servicos': True},
+    {'nome': 'muitos_itens', 'paginas': 12, 'itens': 60, 'servicos': True},
+    {'nome': 'anexos', 'paginas': 40, 'itens': 8, 'servicos': True},
+    {'nome': 'sem_servicos', 'paginas': 40, 'itens': 8, 'servicos': False},
+]
+
+_RODAPE = [
+    'Vendas: Av. Arnolfo de Azevedo, 210 • 01236-030 • São Paulo • SP • 55 (11) 3670.0000',
+    'Baumer S.A. Fábrica: Av. Pref. Antonio T. Leite, 181 • 13803-330 • Mogi Mirim • SP',
+    'www.baumer.com.br • e-mail: baumer@baumer.com.br TP 01.04.0001 Versão/Revisão 1.000',
+]
+_EQUIPAMENTOS = [
+    'GERADOR DE VAPOR DE 44 KW', 'AUTOCLAVE HORIZONTAL 542 LITROS', 'LAVADORA TERMODESINFECTORA',
+    'SELADORA CONTINUA', 'ESTERILIZADOR A BAIXA TEMPERATURA', 'DESTILADOR DE AGUA 20 L/H',
+    'CARRO DE TRANSPORTE INOX', 'SECADORA DE TRAQUEIAS',
+]
+_FILLER = (
+    'O equipamento deve ser instalado conforme o Manual de Instalação, Operação e Manutenção, '
+    'em local com ventilação adequada, pontos de energia elétrica e água tratada dimensionados '
+    'pelo COMPRADOR de acordo com as especificações técnicas desta proposta.'
+)
+
+
+def _quebrar(texto, largura=95):
+    """Quebra um parágrafo em linhas que cabem na página."""
+    linhas, atual = [], ''
+    for palavra in texto.split():
+        if atual and len(atual) + 1 + len(palavra) > largura:
+            linhas.append(atual)
+            atual = palavra
+        else:
+            atual = f"{atual} {palavra}".strip()
+    if atual:
+        linhas.append(atual)
+    return linhas
+
+
+def _valor(centavos):
+    """Formata centavos no padrão brasileiro (23.900,00)."""
+    reais, cents = divmod(centavos, 100)
+    return f"{reais:,}".replace(',', '.') + f",{cents:02d}"
+
+
+def gerar_proposta(nome, paginas, itens, servicos=True, seed=0):
+    """Monta as linhas de cada página de uma proposta sintética e os valores esperados."""
+    rnd = random.Random(f"{nome}:{seed}")
+    codigo = rnd.randint(1, 999)
+    id_proposta = f"BA.{codigo:04d}/25"
+    cnpj = f"{rnd.randint(10, 99)}.{rnd.randint(100, 999)}.{rnd.randint(100, 999)}/0001-{rnd.randint(10, 99)}"
+    razao = f"HOSPITAL SINTETICO {nome.upper()}"
+
+    cabecalho = [
+        'PROPOSTA COMERCIAL',
+        f"ID da Proposta: {id_proposta} Data Emissão: 17/MAR/2025 Validade: 30 (TRINTA) DIAS",
+        razao,
+        'Razão Social:',
+        razao,
+        'Nome Fantasia:',
+        'CNPJ / CPF:',
+        cnpj,
+        'Inscrição Estadual:',
+        'Contato: Maria Souza – Setor de Engenharia Clínica',
+        f"Telefone: (19)3869-{rnd.randint(1000, 9999)} Cel: E-Mail: compras@{nome}.com.br",
+        'Endereço:',
+        'São Paulo, 17 de março de 2025',
+        'Prezados,',
+    ]
+    cabecalho += _quebrar(
+        'É com grande satisfação que nós da BAUMER S.A vimos aqui apresentar nossa PROPOSTA COMERCIAL '
+        'para fornecimento de nossos Produtos nos Valores e Condições Comerciais a seguir detalhados.'
+    )
+    cabecalho += ['Atenciosamente', 'Gerente de Vendas', 'Equipe MPBIOS/Baumer']
+
+    corpo = ['1. DESCRIÇÃO DO ITEM COTADO:']
+    tabela = [
+        '2. CONFIGURÇÃO, QUANTIDADES E VALORES DOS ITENS COTADOS:',
+        'Unitário Sub Total',
+        'It. Descrição Qt',
+        '(em R$) (em R$)',
+    ]
+    total = 0
+    esperados = []
+    for n in range(1, itens + 1):
+        equipamento = rnd.choice(_EQUIPAMENTOS)
+        quantidade = rnd.randint(1, 4)
+        unitario = rnd.randint(500_00, 250_000_00)
+        subtotal = unitario * quantidade
+        total += subtotal
+        corpo.append(f"ITEM {n:02d} – {equipamento}")
+        corpo += _quebrar(_FILLER)[:2]
+        tabela += [
+            equipamento,
+            f"V0100-{n:03d}-100 R$ {_valor(unitario)} R$ {_valor(subtotal)}",
+            f"{n:02d} {quantidade:02d}",
+        ]
+        esperados.append({'quantidade': f"{quantidade:02d}", 'valor_total': _valor(subtotal)})
+    tabela.append(f"VALOR TOTAL DA PROPOSTA: {_valor(total)} (VALOR POR EXTENSO)")
+
+    condicoes = ['2.1 VALIDADE DA PROPOSTA', '30 (TRINTA) DIAS Corridos. Contados da data de emissão desta proposta.']
+    condicoes += ['2.2 PRAZO DE ENTREGA NA FÁBRICA', '30 (TRINTA) dias a contar da data do pedido.']
+    condicoes += [
+        '2.5 GARANTIA NACIONAL',
+        'A garantia essencialmente abrange e tem os seguintes prazos de duração:',
+        'Para DEFEITOS DE FABRICAÇÃO das suas partes gerais 13 (TREZE)',
+        'MESES',
+        'Para MATERIAL DE DESGASTE 90',
+        '(NOVENTA)',
+        'DIAS',
+        '2.6 CONDIÇÕES DA GARANTIA',
+    ] + _quebrar(_FILLER)
+    if servicos:
+        condicoes += ['2.13 INSTALAÇÃO', 'A instalação dos equipamentos está inclusa nesta proposta.']
+        condicoes += ['2.14 QUALIFICAÇÕES', 'Qualificações QI e QO inclusas nesta proposta.']
+        condicoes += ['2.15 TREINAMENTO', 'Treinamento operacional não incluso.']
+    condicoes.append('3. ANEXOS TÉCNICOS')
+
+    linhas = cabecalho + corpo + tabela + condicoes
+    por_pagina = LINHAS_POR_PAGINA - len(_RODAPE)
+    paginas_texto = [linhas[i:i + por_pagina] for i in range(0, len(linhas), por_pagina)]
+    # Completar com anexos técnicos até o número de páginas pedido
+    anexo = 1
+    while len(paginas_texto) < paginas:
+        pagina = []
+        while len(pagina) < por_pagina:
+            pagina.append(f"3.{anexo} ESPECIFICAÇÃO TÉCNICA {anexo}")
+            pagina += _quebrar(_FILLER) * 3
+            anexo += 1
+        paginas_texto.append(pagina[:por_pagina])
+    paginas_texto = [pagina + _RODAPE for pagina in paginas_texto]
+
+    esperado = {
+        'id_proposta': id_proposta,
+        'razao_social': razao,
+        'cnpj': cnpj,
+        'valor_total': _valor(total),
+        'itens': esperados,
+        'instalacao_status': 'Incluso' if servicos else 'Não informado',
+        'treinamento_status': 'Não incluso' if servicos else 'Não informado',
+    }
+    return paginas_texto, esperado
+
+
+def _pdf_string(texto):
+    dados = texto.encode('cp1252', errors='replace')
+    dados = dados.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+    return b'(' + dados + b')'
+
+
+def escrever_pdf(path, paginas_texto):
+    """Escreve um PDF A4 com uma linha de texto por linha de cada página."""
+    objetos = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        None,  # árvore de páginas, preenchida depois
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+    ]
+    paginas_ids = []
+    for linhas in paginas_texto:
+        conteudo = [b'BT /F1 9 Tf 12 TL 40 800 Td']
+        for linha in linhas:
+            conteudo.append(_pdf_string(linha) + b' Tj T*')
+        conteudo.append(b'ET')
+        stream = b'\n'.join(conteudo)
+        objetos.append(b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+        conteudo_id = len(objetos)
+        objetos.append(
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+            b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>' % conteudo_id
+        )
+        paginas_ids.append(len(objetos))
+    kids = b' '.join(b'%d 0 R' % i for i in paginas_ids)
+    objetos[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(paginas_ids))
+
+    saida = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for numero, objeto in enumerate(objetos, start=1):
+        offsets.append(len(saida))
+        saida += b'%d 0 obj\n' % numero + objeto + b'\nendobj\n'
+    xref = len(saida)
+    saida += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objetos) + 1)
+    for offset in offsets:
+        saida += b'%010d 00000 n \n' % offset
+    saida += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objetos) + 1, xref)
+    with open(path, 'wb') as fh:
+        fh.write(saida)
+
+
+def gerar_corpus(destino, especificacoes=None, seed=0):
+    """Gera os PDFs do corpus em destino e retorna [(caminho, especificação, esperado)]."""
+    os.makedirs(destino, exist_ok=True)
+    gerados = []
+    for spec in especificacoes or CORPUS_PADRAO:
+        paginas_texto, esperado = gerar_proposta(
+            spec['nome'], spec['paginas'], spec['itens'], spec.get('servicos', True), seed
+        )
+        path = os.path.join(destino, f"{spec['nome']} - cod {spec['paginas']:03d}.pdf")
+        escrever_pdf(path, paginas_texto)
+        gerados.append((path, spec, esperado))
+    with open(os.path.join(destino, 'esperado.json'), 'w', encoding='utf-8') as fh:
+        json.dump({os.path.basename(p): e for p, _, e in gerados}, fh, ensure_ascii=False, indent=2)
+    return gerados
+
+
+if __name__ == "__main__":
+    import sys
+    for path, spec, _ in gerar_corpus(sys.argv[1] if len(sys.argv) > 1 else 'corpus'):
+        print(f"{path}: {spec['paginas']} páginas, {spec['itens']} itens")
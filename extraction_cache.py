@@ -0,0 +1,129 @@
+"""
+Cache persistente dos resultados de extração de PDFs
+"""
+import os
+import json
+import hashlib
+import tempfile
+import threading
+
+# Fração de max_bytes liberada a cada limpeza
+FOLGA = 0.1
+
+# Tamanho de cada diretório de cache neste processo: [total em bytes, bytes gravados
+# desde a última varredura]. Fica fora da instância porque o pool de extração recebe
+# uma cópia (pickle) do cache a cada tarefa. Outros processos gravam no mesmo
+# diretório: uma nova varredura a cada FOLGA * max_bytes gravados aqui limita o
+# excesso a essa folga por processo.
+_tamanhos = {}
+_tamanhos_lock = threading.Lock()
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Calcula o SHA-256 do conteúdo de um arquivo."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """Cache em disco do resultado de extract_all(), chaveado pelo conteúdo do PDF.
+
+    A chave combina o SHA-256 do arquivo, a versão do extrator e o nome do
+    arquivo (o extrator usa o nome para inferir tipo e ID). Quando o tamanho
+    total passa de max_bytes, as entradas menos usadas recentemente são removidas.
+    """
+
+    def __init__(self, cache_dir, max_bytes=256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def make_key(self, digest, version, filename):
+        """Monta a chave de cache para um arquivo."""
+        raw = f"{digest}:{version}:{os.path.basename(filename or '')}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Retorna os dados em cache ou None."""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as fh:
+                dados = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        try:
+            # Marcar uso recente para a política de remoção (LRU pelo mtime)
+            os.utime(path, None)
+        except OSError:
+            pass
+        return dados
+
+    def put(self, key, dados):
+        """Grava os dados de forma atômica e aplica o limite de tamanho."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            anterior = os.path.getsize(path)
+        except OSError:
+            anterior = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+                json.dump(dados, fh, ensure_ascii=False)
+            tamanho = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._somar(tamanho - anterior)
+
+    def _somar(self, delta):
+        """Atualiza o total do diretório; só varre o disco (evict) quando o limite ou a folga estouram."""
+        with _tamanhos_lock:
+            estado = _tamanhos.get(self.cache_dir)
+            if estado is not None:
+                estado[0] += delta
+                estado[1] += max(delta, 0)
+                varrer = estado[0] > self.max_bytes or estado[1] > self.max_bytes * FOLGA
+        if estado is None or varrer:
+            self.evict()
+
+    def evict(self):
+        """Varre o diretório e remove as entradas mais antigas até o cache voltar ao limite."""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        removidos = 0
+        if total > self.max_bytes:
+            # Liberar uma folga para a próxima limpeza não vir logo na gravação seguinte
+            alvo = int(self.max_bytes * (1 - FOLGA))
+            for _, size, path in sorted(entries):
+                if total <= alvo:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removidos += 1
+        with _tamanhos_lock:
+            _tamanhos[self.cache_dir] = [total, 0]
+        return removidos
@@ -0,0 +1,155 @@
+"""
+Métricas em memória no formato texto do Prometheus (sem dependências externas)
+
+Contadores, medidores e histogramas com rótulos, protegidos por lock (são
+atualizados pelas threads das requisições, do worker de importação e do
+escritor), e um buffer circular com as requisições lentas mais recentes.
+Os valores valem para o processo atual e recomeçam a cada reinício.
+"""
+import threading
+from collections import deque
+from datetime import datetime
+
+# Limites (em segundos) dos histogramas de duração
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _numero(valor):
+    return repr(float(valor))
+
+
+def _rotulos(nomes, valores, extra=None):
+    pares = list(zip(nomes, valores))
+    if extra:
+        pares.append(extra)
+    if not pares:
+        return ''
+    texto = ','.join(
+        '{}="{}"'.format(nome, str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for nome, valor in pares
+    )
+    return '{' + texto + '}'
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.valores = {}
+        self.lock = threading.Lock()
+
+    def _chave(self, rotulos):
+        return tuple(str(rotulos.get(nome, '')) for nome in self.rotulos)
+
+    def linhas(self):
+        yield f"# HELP {self.nome} {self.ajuda}"
+        yield f"# TYPE {self.nome} {self.tipo}"
+        with self.lock:
+            valores = dict(self.valores)
+        for chave, valor in sorted(valores.items()):
+            yield from self._amostras(chave, valor)
+
+    def _amostras(self, chave, valor):
+        yield f"{self.nome}{_rotulos(self.rotulos, chave)} {_numero(valor)}"
+
+
+class Contador(_Metrica):
+    """Valor que só aumenta (ex.: requisições atendidas)."""
+
+    tipo = 'counter'
+
+    def inc(self, valor=1, **rotulos):
+        chave = self._chave(rotulos)
+        with self.lock:
+            self.valores[chave] = self.valores.get(chave, 0) + valor
+
+
+class Medidor(_Metrica):
+    """Valor atual que sobe e desce (ex.: tamanho de uma fila)."""
+
+    tipo = 'gauge'
+
+    def definir(self, valor, **rotulos):
+        with self.lock:
+            self.valores[self._chave(rotulos)] = valor
+
+
+class Histograma(_Metrica):
+    """Distribuição de observações em faixas cumulativas (le), com soma e contagem."""
+
+    tipo = 'histogram'
+
+    def __init__(self, nome, ajuda, rotulos=(), limites=LIMITES_SEGUNDOS):
+        super().__init__(nome, ajuda, rotulos)
+        self.limites = tuple(sorted(limites))
+
+    def observar(self, valor, **rotulos):
+        chave = self._chave(rotulos)
+        with self.lock:
+            faixas, soma, contagem = self.valores.get(chave) or ((0,) * len(self.limites), 0.0, 0)
+            # Lista nova a cada observação: linhas() lê uma cópia rasa de valores fora do lock
+            faixas = list(faixas)
+            for i, limite in enumerate(self.limites):
+                if valor <= limite:
+                    faixas[i] += 1
+            self.valores[chave] = (faixas, soma + valor, contagem + 1)
+
+    def _amostras(self, chave, valor):
+        faixas, soma, contagem = valor
+        for limite, quantidade in zip(self.limites, faixas):
+            yield f"{self.nome}_bucket{_rotulos(self.rotulos, chave, ('le', _numero(limite)))} {quantidade}"
+        yield f"{self.nome}_bucket{_rotulos(self.rotulos, chave, ('le', '+Inf'))} {contagem}"
+        yield f"{self.nome}_sum{_rotulos(self.rotulos, chave)} {_numero(soma)}"
+        yield f"{self.nome}_count{_rotulos(self.rotulos, chave)} {contagem}"
+
+
+class Registro:
+    """Conjunto de métricas exportadas juntas em /metrics."""
+
+    def __init__(self):
+        self.metricas = []
+
+    def _registrar(self, metrica):
+        self.metricas.append(metrica)
+        return metrica
+
+    def contador(self, nome, ajuda, rotulos=()):
+        return self._registrar(Contador(nome, ajuda, rotulos))
+
+    def medidor(self, nome, ajuda, rotulos=()):
+        return self._registrar(Medidor(nome, ajuda, rotulos))
+
+    def histograma(self, nome, ajuda, rotulos=(), limites=LIMITES_SEGUNDOS):
+        return self._registrar(Histograma(nome, ajuda, rotulos, limites))
+
+    def texto(self):
+        """Todas as métricas no formato de exposição texto do Prometheus (versão 0.0.4)."""
+        linhas = []
+        for metrica in self.metricas:
+            linhas.extend(metrica.linhas())
+        return '\n'.join(linhas) + '\n'
+
+
+class RequisicoesLentas:
+    """Buffer circular com as últimas requisições que passaram de limite_ms."""
+
+    def __init__(self, capacidade=50, limite_ms=500):
+        self.limite_ms = limite_ms
+        self.itens = deque(maxlen=capacidade)
+        self.lock = threading.Lock()
+
+    def registrar(self, duracao_ms, **dados):
+        if duracao_ms < self.limite_ms:
+            return
+        with self.lock:
+            self.itens.append(dict(dados, duracao_ms=round(duracao_ms, 1),
+                                   quando=datetime.now().strftime('%d/%m/%Y %H:%M:%S')))
+
+    def listar(self):
+        """As requisições guardadas, da mais lenta para a mais rápida."""
+        with self.lock:
+            itens = list(self.itens)
+        return sorted(itens, key=lambda item: item['duracao_ms'], reverse=True)
@@ -2,10 +2,22 @@
 Modelos de banco de dados para o sistema de propostas
 """
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from datetime import datetime
 
 db = SQLAlchemy()
 
+# PRAGMAs aplicados a cada conexão SQLite (app.config['SQLITE_PRAGMAS']): WAL deixa
+# a listagem ler enquanto a importação grava; busy_timeout (ms) espera o lock em vez
+# de falhar com "database is locked"; cache_size negativo é em KB.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 5000,
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+}
+
 
 class Proposta(db.Model):
     """Modelo para armazenar propostas comerciais"""
@@ -17,8 +29,14 @@ class Proposta(db.Model):
     nome_fantasia = db.Column(db.String(255))
     id_proposta = db.Column(db.String(50), unique=True, nullable=False)
     data_emissao = db.Column(db.String(20))
+    # data_emissao e valor_total tipados (preenchidos por normalizar_proposta)
+    data_emissao_iso = db.Column(db.Date, index=True)
+    valor_total_centavos = db.Column(db.Integer, index=True)
     validade = db.Column(db.String(50))
     cnpj = db.Column(db.String(20))
+    # Só dígitos (normalize_cnpj) e cliente de mesmo CNPJ, para buscar o histórico pelo índice
+    cnpj_normalizado = db.Column(db.String(20), index=True)
+    cliente_id = db.Column(db.Integer, db.ForeignKey('clientes.id'), index=True)
     telefone = db.Column(db.String(50))
     celular = db.Column(db.String(50))
     email = db.Column(db.String(100))
@@ -38,7 +56,14 @@ class Proposta(db.Model):
     observacoes = db.Column(db.String(30))
     id_proposta_base = db.Column(db.String(50))
     versao = db.Column(db.String(5))
+    # Versão do extrator e SHA-256 do PDF usados no último processamento
+    extrator_versao = db.Column(db.String(10))
+    arquivo_hash = db.Column(db.String(64))
+    # Importação mais recente da base (coalesce(id_proposta_base, id_proposta)); ver atualizar_versao_atual()
+    versao_atual = db.Column(db.Boolean, nullable=False, default=False, index=True)
     data_importacao = db.Column(db.DateTime, default=datetime.now)
+    # Última alteração da proposta ou dos seus itens (sincronização incremental da API)
+    data_atualizacao = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now, index=True)
     
     # Relacionamento com itens
     itens = db.relationship('ItemProposta', backref='proposta', lazy=True, cascade='all, delete-orphan')
@@ -54,8 +79,10 @@ class Proposta(db.Model):
             'nome_fantasia': self.nome_fantasia,
             'id_proposta': self.id_proposta,
             'data_emissao': self.data_emissao,
+            'data_emissao_iso': self.data_emissao_iso.isoformat() if self.data_emissao_iso else None,
             'validade': self.validade,
             'cnpj': self.cnpj,
+            'cliente_id': self.cliente_id,
             'telefone': self.telefone,
             'celular': self.celular,
             'email': self.email,
@@ -63,6 +90,7 @@ class Proposta(db.Model):
             'descricao_item': self.descricao_item,
             'quantidade': self.quantidade,
             'valor_total': self.valor_total,
+            'valor_total_centavos': self.valor_total_centavos,
             'nome_arquivo_pdf': self.nome_arquivo_pdf,
             'cod_vendedor': self.cod_vendedor,
             'data_vencimento': self.data_vencimento.strftime('%d/%m/%Y') if self.data_vencimento else None,
@@ -75,7 +103,9 @@ class Proposta(db.Model):
             'observacoes': self.observacoes,
             'id_proposta_base': self.id_proposta_base,
             'versao': self.versao,
-            'data_importacao': self.data_importacao.strftime('%d/%m/%Y %H:%M:%S') if self.data_importacao else None
+            'extrator_versao': self.extrator_versao,
+            'data_importacao': self.data_importacao.strftime('%d/%m/%Y %H:%M:%S') if self.data_importacao else None,
+            'data_atualizacao': self.data_atualizacao.isoformat(timespec='seconds') if self.data_atualizacao else None
         }
 
 
@@ -91,6 +121,9 @@ class ItemProposta(db.Model):
     quantidade = db.Column(db.String(20))
     valor_unitario = db.Column(db.String(50))
     valor_total = db.Column(db.String(50))
+    # Valores em centavos (ver preencher_centavos_item)
+    valor_unitario_centavos = db.Column(db.Integer)
+    valor_total_centavos = db.Column(db.Integer)
     
     def __repr__(self):
         return f'<ItemProposta {self.numero}>'
@@ -103,7 +136,9 @@ class ItemProposta(db.Model):
             'descricao': self.descricao,
             'quantidade': self.quantidade,
             'valor_unitario': self.valor_unitario,
-            'valor_total': self.valor_total
+            'valor_total': self.valor_total,
+            'valor_unitario_centavos': self.valor_unitario_centavos,
+            'valor_total_centavos': self.valor_total_centavos
         }
 
 
@@ -221,6 +256,162 @@ class Equipamento(db.Model):
         return f'<Equipamento {self.nome} Cliente {self.cliente_id}>'
 
 
+
+class IngestaoJob(db.Model):
+    """Modelo para a fila persistente de importação de PDFs"""
+
+    __tablename__ = 'ingestao_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    caminho = db.Column(db.String(500), nullable=False)
+    nome_original = db.Column(db.String(255))
+    nome_arquivo = db.Column(db.String(255), nullable=False)
+    # queued -> running -> done | failed
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    tentativas = db.Column(db.Integer, nullable=False, default=0)
+    erro = db.Column(db.Text)
+    # Processo que reservou o job ("host:pid"), para recuperar jobs órfãos
+    worker = db.Column(db.String(100))
+    # Já contabilizado na barra de progresso concluída
+    notificado = db.Column(db.Boolean, nullable=False, default=False)
+    data_criacao = db.Column(db.DateTime, default=datetime.now)
+    data_inicio = db.Column(db.DateTime)
+    data_fim = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<IngestaoJob {self.id} {self.status}>'
+
+    def to_dict(self):
+        """Converte o objeto para dicionário"""
+        return {
+            'id': self.id,
+            'nome_original': self.nome_original,
+            'nome_arquivo': self.nome_arquivo,
+            'status': self.status,
+            'tentativas': self.tentativas,
+            'erro': self.erro,
+            'data_criacao': self.data_criacao.strftime('%d/%m/%Y %H:%M:%S') if self.data_criacao else None,
+            'data_fim': self.data_fim.strftime('%d/%m/%Y %H:%M:%S') if self.data_fim else None
+        }
+
+
+
+class ReprocessamentoJob(db.Model):
+    """Modelo para o reprocessamento incremental dos PDFs (com checkpoint)"""
+
+    __tablename__ = 'reprocessamento_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # running | paused | done | cancelled
+    status = db.Column(db.String(20), nullable=False, default='running', index=True)
+    filtro_cod_vendedor = db.Column(db.String(50))
+    filtro_data_inicio = db.Column(db.Date)
+    filtro_data_fim = db.Column(db.Date)
+    # Checkpoint: maior propostas.id já percorrido (paginação por chave)
+    ultimo_id = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    processados = db.Column(db.Integer, nullable=False, default=0)
+    atualizados = db.Column(db.Integer, nullable=False, default=0)
+    ignorados = db.Column(db.Integer, nullable=False, default=0)
+    erros = db.Column(db.Integer, nullable=False, default=0)
+    worker = db.Column(db.String(100))
+    data_criacao = db.Column(db.DateTime, default=datetime.now)
+    data_atualizacao = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    def __repr__(self):
+        return f'<ReprocessamentoJob {self.id} {self.status}>'
+
+    def to_dict(self):
+        """Converte o objeto para dicionário"""
+        return {
+            'id': self.id,
+            'status': self.status,
+            'filtro_cod_vendedor': self.filtro_cod_vendedor,
+            'filtro_data_inicio': self.filtro_data_inicio.strftime('%d/%m/%Y') if self.filtro_data_inicio else None,
+            'filtro_data_fim': self.filtro_data_fim.strftime('%d/%m/%Y') if self.filtro_data_fim else None,
+            'ultimo_id': self.ultimo_id,
+            'total': self.total,
+            'processados': self.processados,
+            'atualizados': self.atualizados,
+            'ignorados': self.ignorados,
+            'erros': self.erros,
+            'data_atualizacao': self.data_atualizacao.strftime('%d/%m/%Y %H:%M:%S') if self.data_atualizacao else None
+        }
+
+
+class RelatorioJob(db.Model):
+    """Modelo para a geração em lote dos relatórios de clientes (um ZIP por job)"""
+
+    __tablename__ = 'relatorio_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # queued -> running -> done | failed; done -> expired quando o ZIP é apagado
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    filtro_regiao = db.Column(db.String(50))
+    filtro_setor = db.Column(db.String(100))
+    filtro_cpm_status = db.Column(db.String(20))
+    total = db.Column(db.Integer, nullable=False, default=0)
+    processados = db.Column(db.Integer, nullable=False, default=0)
+    erro = db.Column(db.Text)
+    arquivo = db.Column(db.String(500))
+    worker = db.Column(db.String(100))
+    data_criacao = db.Column(db.DateTime, default=datetime.now)
+    data_fim = db.Column(db.DateTime)
+    expira_em = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<RelatorioJob {self.id} {self.status}>'
+
+    def to_dict(self):
+        """Converte o objeto para dicionário"""
+        return {
+            'id': self.id,
+            'status': self.status,
+            'filtro_regiao': self.filtro_regiao,
+            'filtro_setor': self.filtro_setor,
+            'filtro_cpm_status': self.filtro_cpm_status,
+            'total': self.total,
+            'processados': self.processados,
+            'erro': self.erro,
+            'data_criacao': self.data_criacao.strftime('%d/%m/%Y %H:%M:%S') if self.data_criacao else None,
+            'data_fim': self.data_fim.strftime('%d/%m/%Y %H:%M:%S') if self.data_fim else None,
+            'expira_em': self.expira_em.strftime('%d/%m/%Y %H:%M:%S') if self.expira_em else None
+        }
+
+
+class MigracaoDados(db.Model):
+    """Modelo para o estado das migrações de dados em segundo plano (com checkpoint)"""
+
+    __tablename__ = 'migracoes_dados'
+
+    id = db.Column(db.Integer, primary_key=True)
+    nome = db.Column(db.String(100), unique=True, nullable=False)
+    # running | done
+    status = db.Column(db.String(20), nullable=False, default='running')
+    # Checkpoint: maior propostas.id já normalizado
+    ultimo_id = db.Column(db.Integer, nullable=False, default=0)
+    processados = db.Column(db.Integer, nullable=False, default=0)
+    alterados = db.Column(db.Integer, nullable=False, default=0)
+    data_inicio = db.Column(db.DateTime, default=datetime.now)
+    data_fim = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<MigracaoDados {self.nome} {self.status}>'
+
+
+def aplicar_pragmas_sqlite(engine, pragmas):
+    """Registra os PRAGMAs para cada conexão nova do engine (só SQLite)."""
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _configurar(dbapi_conn, _registro):
+        cursor = dbapi_conn.cursor()
+        for nome, valor in pragmas.items():
+            cursor.execute(f"PRAGMA {nome} = {valor}")
+        cursor.close()
+
+
 def init_db(app):
     """Inicializa o banco de dados"""
     db.init_app(app)
@@ -3,66 +3,463 @@ Módulo para extração de dados de PDFs de propostas comerciais
 """
 import re
 import os
+import gzip
+import json
+import time
 import pdfplumber
+from bisect import bisect_right
+from itertools import accumulate
 from datetime import datetime
+from extraction_cache import file_sha256
+
+# Versão das regras de extração; incrementar ao alterar qualquer regex/heurística
+# para invalidar os resultados guardados em cache.
+EXTRACTOR_VERSION = '2'
+
+# Texto extraído guardado ao lado do PDF ("<arquivo>.pdf.texto.json.gz"), para
+# que mudanças só nas regex não precisem rodar o pdfplumber de novo.
+TEXT_SIDECAR_SUFFIX = '.texto.json.gz'
+TEXT_SIDECAR_FORMAT = 2
+
+# Páginas iniciais de onde saem os dados do cabeçalho (ID, datas, cliente,
+# contato). As demais páginas só são lidas se itens, garantia, serviços, valor
+# total ou tipo ainda não tiverem sido encontrados.
+HEADER_PAGES = 2
+
+
+def text_sidecar_path(pdf_path):
+    """Caminho do arquivo com o texto extraído de um PDF."""
+    return pdf_path + TEXT_SIDECAR_SUFFIX
+
+
+# Padrões compilados uma única vez na importação do módulo.
+_RE_WHITESPACE = re.compile(r'\s+')
+_RE_ID_LABEL = re.compile(r'ID\s+da\s+Proposta:\s*([A-Z]{2}\.[A-Z0-9-]{3,6}/\d{2,4})', re.IGNORECASE)
+_RE_ID_LABEL_SHORT = re.compile(r'ID\s+da\s+([A-Z]{2}\.[A-Z0-9-]{3,6}/\d{2,4})', re.IGNORECASE)
+_RE_ID_GENERIC = re.compile(r'[A-Z]{2}\.[A-Z0-9-]{3,6}/\d{2,4}', re.IGNORECASE)
+_RE_FILENAME_CODIGO = re.compile(r'^\s*([0-9]{3,4}[A-Z]?(-[A-Z])?)')
+_RE_MPBIOS_LOOSE = re.compile(r'MP-?BIOS', re.IGNORECASE)
+_RE_MP_BIOS = re.compile(r'(^|[^A-Za-z0-9])MP\s*BIOS([^A-Za-z0-9]|$)', re.IGNORECASE)
+_RE_MPBIOS = re.compile(r'(^|[^A-Za-z0-9])MPBIOS([^A-Za-z0-9]|$)', re.IGNORECASE)
+_RE_BAUMER = re.compile(r'(^|[^A-Za-z0-9])BAUMER([^A-Za-z0-9]|$)', re.IGNORECASE)
+_RE_NAO_INCLUSO = re.compile(r'n[aã]o\s+inclus', re.IGNORECASE)
+_RE_INCLUSO = re.compile(r'inclus', re.IGNORECASE)
+_QUALIFICACOES_SIGLAS = [
+    ('QI', re.compile(r'\bQI\b', re.IGNORECASE)),
+    ('QO', re.compile(r'\bQO\b', re.IGNORECASE)),
+    ('QD', re.compile(r'\bQD\b', re.IGNORECASE)),
+]
+_RE_GARANTIA_PRAZO = re.compile(
+    r'Para\s+(.+?)\s+(\d{1,3})\s*(?:\([A-Z\s]+\))?\s*(MESES|MÊS|DIAS|DIA)',
+    re.IGNORECASE
+)
+_RE_DATA_EMISSAO = re.compile(r'(\d{2})\s*/\s*([A-Z]{3})\s*/\s*(\d{2,4})', re.IGNORECASE)
+_MESES = {
+    'JAN': '01', 'FEV': '02', 'MAR': '03', 'ABR': '04',
+    'MAI': '05', 'JUN': '06', 'JUL': '07', 'AGO': '08',
+    'SET': '09', 'OUT': '10', 'NOV': '11', 'DEZ': '12'
+}
+_RE_VALIDADE_EXTENSO = re.compile(r'(\d{1,3})\s*\([A-Z]+\)\s*DIAS', re.IGNORECASE)
+_RE_VALIDADE_DIAS = re.compile(r'Validade[^\d]{0,20}(\d{1,3})\s*DIAS', re.IGNORECASE)
+_RE_VALIDADE_DATA = re.compile(
+    r'Validade[^\d]{0,20}(?:At[eé]\s*)?(\d{2}\s*[./]\s*\d{2}\s*[./]\s*\d{2,4})', re.IGNORECASE
+)
+_RE_VALIDA_ATE = re.compile(r'V[aá]lida\s+at[eé]\s*(\d{2}\s*[./]\s*\d{2}\s*[./]\s*\d{2,4})', re.IGNORECASE)
+_RE_DIAS = re.compile(r'(\d{1,3})\s*DIAS', re.IGNORECASE)
+_RE_DATA_NUMERICA = re.compile(r'(\d{2}\s*[./]\s*\d{2}\s*[./]\s*\d{2,4})')
+_RE_RAZAO_PROXIMO_CAMPO = re.compile(r'(Nome Fantasia|CNPJ|Telefone|Contato|Inscri)', re.IGNORECASE)
+_RE_EMISSAO_PROXIMO_CAMPO = re.compile(r'(Nome Fantasia|CNPJ|Telefone|Contato)', re.IGNORECASE)
+_RE_FANTASIA_PROXIMO_CAMPO = re.compile(r'(CNPJ|Telefone|Contato|Inscrição)')
+_RE_CONTATO_PROXIMO_CAMPO = re.compile(r'(Telefone|Cel:|E-?Mail)')
+_RE_CNPJ = [
+    re.compile(r'\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}'),
+    re.compile(r'\d{2}[.\-]\d{3}[.\-]\d{3}[/-]\d{4}[/-]\d{2}'),
+]
+_RE_TELEFONE = re.compile(r'\(\s*\d{2}\s*\)\s*\d{4,5}-?\d{4}')
+_RE_CELULAR = re.compile(r'Cel:\s*\((\d{2})\)\s*(\d{4,5}-?\d{4})')
+_RE_EMAIL = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+# Vale a primeira ocorrência no documento de qualquer um dos dois formatos.
+_RE_VALOR_TOTAL = re.compile(
+    r'TOTAL\s+R\$\s+([\d.,]+)|VALOR\s+TOTAL\s+DA\s+PROPOSTA[:\s]*R?\$?\s*([\d.,]+)',
+    re.IGNORECASE
+)
+_RE_ITEM_PRECO = re.compile(r'R\$\s*([\d.,]+)\s+R\$\s*([\d.,]+)')
+_RE_ITEM_QTD_LINHA = re.compile(r'^(\d{1,3})\s+(\d{1,3})$')
+_RE_ITEM_NUMERO = re.compile(r'ITEM\s*(\d{1,3})', re.IGNORECASE)
+_RE_ITEM_CABECALHO = re.compile(
+    r'(It\.\s+Descricao|Qt|Unitario|Unitário|Valor\s+Unit|Valor\s+Total|Sub\s*Total|em\s*R\$|\(em\s*R\$\))',
+    re.IGNORECASE
+)
+_RE_ITEM_SKIP_PREFIX = re.compile(
+    r'^(?:\d{1,3}\s*)?(?:\([^)]+\)\s*)?(Marca/Fabricante|Fabricante|Proced[eê]ncia|Registro|Desconto)\b',
+    re.IGNORECASE
+)
+_RE_ITEM_QTD_FINAL = re.compile(r'(?:\s+\d{1,3}){1,2}$')
+_RE_ITEM_CORTE_DESCRICAO = re.compile(
+    r'\s+(?:Marca/Fabricante|Fabricante|Proced[eê]ncia|Registro|Desconto)\b', re.IGNORECASE
+)
+_RE_ITEM_NUMERO_INICIAL = re.compile(r'^\d+\s*')
+_RE_ITEM_LINHA_DESCONTO = re.compile(r'^(VALOR\s+COM|DESCONTO)\b', re.IGNORECASE)
+_RE_SUBSECAO_INICIAL = re.compile(r'^\d+\.\d+')
+_RE_HEADING = re.compile(r'^\d+(?:\.\d+)?\s+.*$', re.IGNORECASE)
+
+# Âncoras procuradas nas linhas (cabeçalhos do cliente, garantia, tabela de
+# itens, seções numeradas).
+_LINE_ANCHORS = {
+    'razao_social': r'Raz[aã]o\s+Social:',
+    'emissao': r'Emiss[aã]o:',
+    'nome_fantasia': r'Nome Fantasia ou Local',
+    'telefone': r'Telefone:',
+    'contato': r'Contato:',
+    'garantia': r'GARANTIA',
+    'validade': r'Validade',
+    'itens_inicio': r'It\.\s+Descricao\s+Qt|CONFIGUR.*VALORES.*ITENS|ITENS\s+COTAD|DESCRICAO\s+DO\s+ITEM',
+    'itens_fim': r'VALOR\s+TOTAL\s+DA\s+PROPOSTA|TOTAL\s+DA\s+PROPOSTA|^TOTAL\s+R\$',
+    'heading': r'^\d+(?:\.\d+)?\s+.*$',
+    'subheading': r'^\d+\.\d+\s+.*$',
+}
+_ANCHOR_BY_PATTERN = {pattern: name for name, pattern in _LINE_ANCHORS.items()}
+# Seções numeradas de serviços (vale o primeiro cabeçalho com qualquer grafia).
+_SERVICOS_KEYWORDS = {
+    'instalacao': ('INSTALAÇÃO', 'INSTALACAO'),
+    'qualificacoes': ('QUALIFICAÇÕES', 'QUALIFICACOES'),
+    'treinamento': ('TREINAMENTO',),
+}
+
+
+def _line_pattern(pattern):
+    """Compila um padrão de linha para buscar no texto das linhas unidas por '\\n'.
+
+    Espaços (\\s) não atravessam a quebra de linha, então cada ocorrência fica
+    contida em uma única linha, como na busca linha a linha. Retorna o par
+    (padrão com IGNORECASE, padrão em minúsculas para o texto já em minúsculas):
+    o segundo evita o IGNORECASE, que desativa a busca rápida por prefixo do re.
+    """
+    def line_only(p):
+        return p.replace(r'\s', r'[^\S\n]')
+    return (
+        re.compile(line_only(pattern), re.IGNORECASE | re.MULTILINE),
+        re.compile(line_only(pattern.lower()), re.MULTILINE),
+    )
+
+
+_LINE_PATTERNS = {name: _line_pattern(p) for name, p in _LINE_ANCHORS.items()}
+_SECTION_PATTERNS = {}
+# Caracteres que o IGNORECASE iguala a letras ASCII mas que str.lower() não
+# converte (ı ~ i, ſ ~ s); se aparecerem, a busca usa o padrão com IGNORECASE.
+_RE_FOLD_UNSAFE = re.compile('[\u0131\u017f]')
+
+
+class _LineIndex:
+    """Índice de linhas: texto das linhas unido uma única vez + offset de cada linha.
+
+    As buscas por âncora rodam direto nesse texto (em C, parando na primeira
+    ocorrência) e os offsets são convertidos em números de linha. A primeira
+    ocorrência de cada âncora fica em cache. Linhas acrescentadas depois são
+    anexadas de forma incremental.
+    """
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.text = ""
+        self.folded = ""
+        self.starts = []
+        self._first = {}
+
+    def update(self):
+        """Anexa ao índice as linhas ainda não indexadas."""
+        novas = self.lines[len(self.starts):]
+        if not novas:
+            return
+        offset = len(self.text) + 1 if self.starts else 0
+        self.starts.extend(accumulate((len(line) + 1 for line in novas[:-1]), initial=offset))
+        chunk = "\n".join(novas)
+        self.text = f"{self.text}\n{chunk}" if offset else chunk
+        if self.folded is not None:
+            # Só usar o texto em minúsculas se os offsets forem preservados
+            folded = chunk.lower()
+            if len(folded) == len(chunk) and not _RE_FOLD_UNSAFE.search(chunk):
+                self.folded = f"{self.folded}\n{folded}" if offset else folded
+            else:
+                self.folded = None
+
+    def _line_at(self, pos):
+        return bisect_right(self.starts, pos) - 1
+
+    def _finder(self, patterns):
+        if self.folded is not None:
+            return patterns[1], self.folded
+        return patterns[0], self.text
+
+    def search(self, patterns, start_line=0):
+        """Primeira linha a partir de start_line que casa com o padrão (ou None)."""
+        if start_line >= len(self.starts):
+            return None
+        pattern, text = self._finder(patterns)
+        match = pattern.search(text, self.starts[start_line])
+        if match:
+            return self._line_at(match.start())
+        return None
+
+    def first(self, name):
+        """Primeira linha com a âncora informada (ou None)."""
+        cached = self._first.get(name)
+        if cached is not None and (cached[0] is not None or cached[1] == len(self.starts)):
+            return cached[0]
+        # Sem cache, ou não encontrada antes: buscar só nas linhas novas
+        inicio = cached[1] if cached is not None else 0
+        idx = self.search(_LINE_PATTERNS[name], inicio)
+        self._first[name] = (idx, len(self.starts))
+        return idx
+
+    def next_after(self, name, line_idx):
+        """Primeira linha depois de line_idx com a âncora informada (ou None)."""
+        return self.search(_LINE_PATTERNS[name], line_idx + 1)
+
+    def iter_lines(self, anchor):
+        """Percorre, em ordem, todas as linhas com a âncora (nome ou par de padrões)."""
+        patterns = _LINE_PATTERNS[anchor] if isinstance(anchor, str) else anchor
+        pattern, text = self._finder(patterns)
+        last = None
+        for match in pattern.finditer(text):
+            i = self._line_at(match.start())
+            if i != last:
+                last = i
+                yield i
 
 
 class PropostaExtractor:
     """Classe para extrair dados de propostas comerciais em PDF"""
     
-    def __init__(self, pdf_path):
+    def __init__(self, pdf_path, reuse_text=False, file_hash=None):
         self.pdf_path = pdf_path
+        self.reuse_text = reuse_text
+        self.file_hash = file_hash
+        self.pages = []
         self.text = ""
         self.lines = []
-        
+        self.page_count = None
+        self._line_index = None
+        self._last_page_start = 0
+        self._pdf = None
+        self._new_pages = False
+        # Segundos de cada etapa do último extract_all ('texto' e 'campos')
+        self.tempos = {}
+
+    def _get_file_hash(self):
+        if self.file_hash is None:
+            self.file_hash = file_sha256(self.pdf_path)
+        return self.file_hash
+
+    def _reset_text(self):
+        """Limpa o texto carregado e, se permitido, recarrega o texto salvo."""
+        self.pages = []
+        self.text = ""
+        self.lines = []
+        self.page_count = None
+        self._line_index = None
+        self._last_page_start = 0
+        self._new_pages = False
+        if self.reuse_text:
+            self.load_text_sidecar()
+
+    def _append_page(self, page_text):
+        """Acrescenta o texto de uma página a self.text e self.lines."""
+        self.pages.append(page_text or "")
+        if page_text:
+            chunk = page_text + "\n"
+            self._last_page_start = len(self.text)
+            self.text += chunk
+            # Criar lista de linhas para facilitar busca (estendida no lugar,
+            # para o índice de linhas continuar válido)
+            self.lines.extend(line.strip() for line in chunk.split('\n') if line.strip())
+
+    def all_pages_read(self):
+        """Indica se todas as páginas do PDF já foram carregadas."""
+        return self.page_count is not None and len(self.pages) >= self.page_count
+
+    def read_page(self):
+        """Lê a próxima página ainda não carregada; retorna False se não houver mais."""
+        if self.all_pages_read():
+            return False
+        if self._pdf is None:
+            self._pdf = pdfplumber.open(self.pdf_path)
+            self.page_count = len(self._pdf.pages)
+            if self.all_pages_read():
+                return False
+        page = self._pdf.pages[len(self.pages)]
+        # Alguns PDFs retornam None; evitar TypeError.
+        page_text = page.extract_text()
+        if not page_text:
+            # Fallback para layouts que não extraem bem no modo padrão.
+            try:
+                page_text = page.extract_text(layout=True)
+            except Exception:
+                page_text = None
+        # Liberar os objetos da página já lida (reduz o pico de memória)
+        page.close()
+        self._append_page(page_text)
+        self._new_pages = True
+        return True
+
+    def close(self):
+        """Fecha o PDF, se estiver aberto."""
+        if self._pdf is not None:
+            self._pdf.close()
+            self._pdf = None
+
     def extract_text(self):
         """Extrai todo o texto do PDF"""
         try:
-            with pdfplumber.open(self.pdf_path) as pdf:
-                self.text = ""
-                for page in pdf.pages:
-                    # Alguns PDFs retornam None; evitar TypeError.
-                    page_text = page.extract_text()
-                    if not page_text:
-                        # Fallback para layouts que não extraem bem no modo padrão.
-                        try:
-                            page_text = page.extract_text(layout=True)
-                        except Exception:
-                            page_text = None
-                    if page_text:
-                        self.text += page_text + "\n"
-                
-                # Criar lista de linhas para facilitar busca
-                self.lines = [line.strip() for line in self.text.split('\n') if line.strip()]
-            return True
+            self._reset_text()
+            while self.read_page():
+                pass
         except Exception as e:
             print(f"Erro ao extrair texto do PDF: {e}")
             return False
-    
+        finally:
+            self.close()
+        if self._new_pages:
+            self.save_text_sidecar()
+        return True
+
+    def extract_text_until_settled(self):
+        """Lê páginas sob demanda até todos os campos de extract_all() estarem definidos.
+
+        Os campos do cabeçalho vêm das primeiras HEADER_PAGES páginas; itens,
+        garantia, serviços, valor total e tipo são lidos só até a seção
+        correspondente terminar. Anexos técnicos no fim do PDF não são abertos.
+        """
+        try:
+            self._reset_text()
+            while not self._fields_settled():
+                if not self.read_page():
+                    break
+        except Exception as e:
+            print(f"Erro ao extrair texto do PDF: {e}")
+            return False
+        finally:
+            self.close()
+        if self._new_pages:
+            self.save_text_sidecar()
+        return True
+
+    def _fields_settled(self):
+        """Indica se o texto já lido basta para definir todos os campos."""
+        if self.all_pages_read():
+            return True
+        if len(self.pages) < HEADER_PAGES:
+            return False
+        if self._itens_section()[1] is None or self._garantia_section()[1] is None:
+            return False
+        if any(self._numbered_section(keywords)[1] is None for keywords in _SERVICOS_KEYWORDS.values()):
+            return False
+        # Valor total: exigir uma página lida depois da ocorrência, para não
+        # cortar um valor que continua na página seguinte.
+        match = _RE_VALOR_TOTAL.search(self.text)
+        if match is None or match.end() > self._last_page_start:
+            return False
+        # Tipo: decidido pelo nome do arquivo ou por BAUMER no texto
+        filename = os.path.basename(self.pdf_path)
+        if _RE_MP_BIOS.search(filename) or _RE_MPBIOS.search(filename) or _RE_BAUMER.search(filename):
+            return True
+        return _RE_BAUMER.search(self.text) is not None
+
+    def _header_view(self):
+        """Extrator restrito às primeiras HEADER_PAGES páginas (dados do cabeçalho)."""
+        if len(self.pages) <= HEADER_PAGES:
+            return self
+        header = PropostaExtractor(self.pdf_path)
+        for page_text in self.pages[:HEADER_PAGES]:
+            header._append_page(page_text)
+        return header
+
+    def load_text_sidecar(self):
+        """Carrega o texto salvo ao lado do PDF, se ainda corresponder ao arquivo."""
+        try:
+            with gzip.open(text_sidecar_path(self.pdf_path), 'rt', encoding='utf-8') as fh:
+                salvo = json.load(fh)
+        except (OSError, ValueError, EOFError):
+            return False
+        if salvo.get('formato') != TEXT_SIDECAR_FORMAT:
+            return False
+        try:
+            if salvo.get('sha256') != self._get_file_hash():
+                return False
+        except OSError:
+            return False
+        self.pages = []
+        self.text = ""
+        self.lines = []
+        self._line_index = None
+        for page_text in salvo.get('paginas') or []:
+            self._append_page(page_text)
+        self.page_count = salvo.get('total_paginas')
+        return True
+
+    def save_text_sidecar(self):
+        """Grava o texto extraído (páginas e linhas) compactado ao lado do PDF.
+
+        Pode conter só as primeiras páginas; as demais são lidas do PDF quando
+        alguma regra precisar delas.
+        """
+        path = text_sidecar_path(self.pdf_path)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            conteudo = {
+                'formato': TEXT_SIDECAR_FORMAT,
+                'sha256': self._get_file_hash(),
+                'total_paginas': self.page_count,
+                'paginas': self.pages,
+                'linhas': self.lines,
+            }
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as fh:
+                json.dump(conteudo, fh, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            return True
+        except OSError as e:
+            print(f"Erro ao salvar texto extraído: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+
+    def _get_line_index(self):
+        """Retorna o índice de linhas-âncora, estendendo-o para linhas novas."""
+        if self._line_index is None or self._line_index.lines is not self.lines:
+            self._line_index = _LineIndex(self.lines)
+        self._line_index.update()
+        return self._line_index
+
     def find_line_with(self, pattern):
         """Encontra linha que contém o padrão"""
+        anchor = _ANCHOR_BY_PATTERN.get(pattern)
+        if anchor is not None:
+            i = self._get_line_index().first(anchor)
+            if i is None:
+                return None, None
+            return i, self.lines[i]
         for i, line in enumerate(self.lines):
             if re.search(pattern, line, re.IGNORECASE):
                 return i, line
         return None, None
+
     
     def extract_id_proposta(self):
         """Extrai o ID da proposta"""
         # Primeiro, tentar extrair pelo rótulo "ID da Proposta"
-        pattern_label = r'ID\s+da\s+Proposta:\s*([A-Z]{2}\.[A-Z0-9-]{3,6}/\d{2,4})'
-        match = re.search(pattern_label, self.text, re.IGNORECASE)
+        match = _RE_ID_LABEL.search(self.text)
         if match:
             return match.group(1)
 
         # Variante comum: "ID da <ID>"
-        pattern_label_short = r'ID\s+da\s+([A-Z]{2}\.[A-Z0-9-]{3,6}/\d{2,4})'
-        match = re.search(pattern_label_short, self.text, re.IGNORECASE)
+        match = _RE_ID_LABEL_SHORT.search(self.text)
         if match:
             return match.group(1)
         
         # Fallback: procurar IDs no formato XX.XXXX/AA(AA) (com letras/números)
-        pattern_generic = r'[A-Z]{2}\.[A-Z0-9-]{3,6}/\d{2,4}'
-        match = re.search(pattern_generic, self.text, re.IGNORECASE)
+        match = _RE_ID_GENERIC.search(self.text)
         if match:
             return match.group(0)
 
@@ -72,58 +469,58 @@ class PropostaExtractor:
             return id_from_filename
         return None
 
-    def _find_section_by_numbered_heading(self, keyword):
-        """Retorna o bloco de texto de uma seção numerada (ex.: '2.13 INSTALAÇÃO')."""
+    def _numbered_section(self, keywords):
+        """(início, fim) da primeira seção numerada com uma das palavras-chave.
+
+        fim é None enquanto o próximo cabeçalho não aparecer no texto já lido.
+        """
         if not self.lines:
-            return None
-        heading_pattern = re.compile(r'^\d+(?:\.\d+)?\s+.*$', re.IGNORECASE)
-        keyword_pattern = re.compile(r'^\d+(?:\.\d+)?\s+.*' + re.escape(keyword) + r'.*$', re.IGNORECASE)
+            return None, None
+        keyword_patterns = _SECTION_PATTERNS.get(keywords)
+        if keyword_patterns is None:
+            keyword_patterns = _line_pattern('|'.join(re.escape(k) for k in keywords))
+            _SECTION_PATTERNS[keywords] = keyword_patterns
+
+        # Equivale a '^\d+(?:\.\d+)?\s+.*KEYWORD.*$': a palavra-chave (só letras)
+        # nunca cai no prefixo numérico, então basta achar a primeira linha que
+        # a contém e é um cabeçalho numerado.
+        index = self._get_line_index()
+        for i in index.iter_lines(keyword_patterns):
+            if _RE_HEADING.match(self.lines[i]):
+                return i, index.next_after('heading', i)
+        return None, None
 
-        start_idx = None
-        for i, line in enumerate(self.lines):
-            if keyword_pattern.search(line):
-                start_idx = i
-                break
+    def _find_section_by_numbered_heading(self, *keywords):
+        """Retorna o bloco de texto de uma seção numerada (ex.: '2.13 INSTALAÇÃO')."""
+        start_idx, end_idx = self._numbered_section(keywords)
         if start_idx is None:
             return None
-
-        end_idx = len(self.lines)
-        for j in range(start_idx + 1, len(self.lines)):
-            if heading_pattern.match(self.lines[j]):
-                end_idx = j
-                break
+        if end_idx is None:
+            end_idx = len(self.lines)
         return "\n".join(self.lines[start_idx:end_idx])
 
     def _extract_incluso_status(self, section_text):
         """Detecta se a seção indica 'incluso' ou 'não incluso'."""
         if not section_text:
             return "Não informado"
-        if re.search(r'n[aã]o\s+inclus', section_text, re.IGNORECASE):
+        if _RE_NAO_INCLUSO.search(section_text):
             return "Não incluso"
-        if re.search(r'inclus', section_text, re.IGNORECASE):
+        if _RE_INCLUSO.search(section_text):
             return "Incluso"
         return "Não informado"
 
     def extract_servicos(self):
         """Extrai status de serviços: instalação, qualificações e treinamento."""
-        instalacao_text = self._find_section_by_numbered_heading('INSTALAÇÃO') or \
-            self._find_section_by_numbered_heading('INSTALACAO')
-        qualificacoes_text = self._find_section_by_numbered_heading('QUALIFICAÇÕES') or \
-            self._find_section_by_numbered_heading('QUALIFICACOES')
-        treinamento_text = self._find_section_by_numbered_heading('TREINAMENTO')
+        instalacao_text = self._find_section_by_numbered_heading(*_SERVICOS_KEYWORDS['instalacao'])
+        qualificacoes_text = self._find_section_by_numbered_heading(*_SERVICOS_KEYWORDS['qualificacoes'])
+        treinamento_text = self._find_section_by_numbered_heading(*_SERVICOS_KEYWORDS['treinamento'])
 
         qualificacoes_status = self._extract_incluso_status(qualificacoes_text)
         if qualificacoes_text and qualificacoes_status == "Incluso":
-            inclui_qi = re.search(r'\bQI\b', qualificacoes_text, re.IGNORECASE) is not None
-            inclui_qo = re.search(r'\bQO\b', qualificacoes_text, re.IGNORECASE) is not None
-            inclui_qd = re.search(r'\bQD\b', qualificacoes_text, re.IGNORECASE) is not None
-            qualificacoes_partes = []
-            if inclui_qi:
-                qualificacoes_partes.append('QI')
-            if inclui_qo:
-                qualificacoes_partes.append('QO')
-            if inclui_qd:
-                qualificacoes_partes.append('QD')
+            qualificacoes_partes = [
+                sigla for sigla, pattern in _QUALIFICACOES_SIGLAS
+                if pattern.search(qualificacoes_text)
+            ]
             if qualificacoes_partes:
                 qualificacoes_status = f"{qualificacoes_status} ({'/'.join(qualificacoes_partes)})"
 
@@ -133,39 +530,33 @@ class PropostaExtractor:
             'treinamento_status': self._extract_incluso_status(treinamento_text),
         }
 
-    def extract_garantia(self):
-        """Extrai a seção de garantia e um resumo de prazos."""
+    def _garantia_section(self):
+        """(início, fim) da seção de garantia; fim é None se ainda não apareceu."""
         if not self.lines:
-            return {'garantia_resumo': None, 'garantia_texto': None}
+            return None, None
+        index = self._get_line_index()
+        start_idx = index.first('garantia')
+        if start_idx is None:
+            return None, None
+        return start_idx, index.next_after('heading', start_idx)
 
+    def extract_garantia(self):
+        """Extrai a seção de garantia e um resumo de prazos."""
         # Localizar início da garantia
-        start_idx = None
-        for i, line in enumerate(self.lines):
-            if re.search(r'GARANTIA', line, re.IGNORECASE):
-                start_idx = i
-                break
+        start_idx, end_idx = self._garantia_section()
         if start_idx is None:
             return {'garantia_resumo': None, 'garantia_texto': None}
-
-        heading_pattern = re.compile(r'^\d+(?:\.\d+)?\s+.*$', re.IGNORECASE)
-        end_idx = len(self.lines)
-        for j in range(start_idx + 1, len(self.lines)):
-            if heading_pattern.match(self.lines[j]):
-                end_idx = j
-                break
+        if end_idx is None:
+            end_idx = len(self.lines)
 
         garantia_texto = "\n".join(self.lines[start_idx:end_idx])
 
         # Resumo de prazos: normalizar quebras para evitar "MESES" em linha separada
         texto_compacto = " ".join(self.lines[start_idx:end_idx])
-        texto_compacto = re.sub(r'\s+', ' ', texto_compacto).strip()
+        texto_compacto = _RE_WHITESPACE.sub(' ', texto_compacto).strip()
 
         prazos = []
-        pattern = re.compile(
-            r'Para\s+(.+?)\s+(\d{1,3})\s*(?:\([A-Z\s]+\))?\s*(MESES|MÊS|DIAS|DIA)',
-            re.IGNORECASE
-        )
-        for match in pattern.finditer(texto_compacto):
+        for match in _RE_GARANTIA_PRAZO.finditer(texto_compacto):
             descricao = match.group(1).strip().rstrip(':')
             quantidade = match.group(2)
             unidade = match.group(3).upper()
@@ -178,7 +569,7 @@ class PropostaExtractor:
         """Monta um ID baseado no nome do arquivo, se possível."""
         filename = os.path.basename(self.pdf_path)
         # Ex.: "015B - ...", "009-B - ...", "010A - ..."
-        match = re.match(r'^\s*([0-9]{3,4}[A-Z]?(-[A-Z])?)', filename)
+        match = _RE_FILENAME_CODIGO.match(filename)
         if not match:
             return None
         codigo = match.group(1)
@@ -194,7 +585,7 @@ class PropostaExtractor:
 
         # Inferir prefixo
         prefixo = "BA"
-        if re.search(r'MP-?BIOS', self.text, re.IGNORECASE):
+        if _RE_MPBIOS_LOOSE.search(self.text):
             prefixo = "MP"
 
         if ano:
@@ -203,18 +594,12 @@ class PropostaExtractor:
     
     def extract_data_emissao(self):
         """Extrai a data de emissão"""
-        pattern = r'(\d{2})\s*/\s*([A-Z]{3})\s*/\s*(\d{2,4})'
-        match = re.search(pattern, self.text[:1000], re.IGNORECASE)
+        match = _RE_DATA_EMISSAO.search(self.text[:1000])
         if match:
             day, mon, year = match.group(1), match.group(2), match.group(3)
             # Converter formato 17/JAN/25 para datetime
             try:
-                meses = {
-                    'JAN': '01', 'FEV': '02', 'MAR': '03', 'ABR': '04',
-                    'MAI': '05', 'JUN': '06', 'JUL': '07', 'AGO': '08',
-                    'SET': '09', 'OUT': '10', 'NOV': '11', 'DEZ': '12'
-                }
-                month = meses.get(mon.upper(), '01')
+                month = _MESES.get(mon.upper(), '01')
                 if len(year) == 2:
                     year = '20' + year
                 return f"{day}/{month}/{year}"
@@ -227,40 +612,36 @@ class PropostaExtractor:
         texto = self.text[:2000]
 
         # Ex.: "30 (TRINTA) DIAS"
-        pattern = r'(\d{1,3})\s*\([A-Z]+\)\s*DIAS'
-        match = re.search(pattern, texto, re.IGNORECASE)
+        match = _RE_VALIDADE_EXTENSO.search(texto)
         if match:
             return f"{match.group(1)} DIAS"
 
         # Ex.: "Validade: 30 DIAS" ou "Validade da Proposta: 30 dias corridos"
-        pattern = r'Validade[^\d]{0,20}(\d{1,3})\s*DIAS'
-        match = re.search(pattern, texto, re.IGNORECASE)
+        match = _RE_VALIDADE_DIAS.search(texto)
         if match:
             return f"{match.group(1)} DIAS"
 
         # Ex.: "Validade: Até 30.05.2025" ou "Validade: 30/05/2025"
-        pattern = r'Validade[^\d]{0,20}(?:At[eé]\s*)?(\d{2}\s*[./]\s*\d{2}\s*[./]\s*\d{2,4})'
-        match = re.search(pattern, texto, re.IGNORECASE)
+        match = _RE_VALIDADE_DATA.search(texto)
         if match:
-            date_str = re.sub(r'\s+', '', match.group(1)).replace('.', '/')
+            date_str = _RE_WHITESPACE.sub('', match.group(1)).replace('.', '/')
             return date_str
 
         # Ex.: "Válida até 30/05/2025"
-        pattern = r'V[aá]lida\s+at[eé]\s*(\d{2}\s*[./]\s*\d{2}\s*[./]\s*\d{2,4})'
-        match = re.search(pattern, texto, re.IGNORECASE)
+        match = _RE_VALIDA_ATE.search(texto)
         if match:
-            date_str = re.sub(r'\s+', '', match.group(1)).replace('.', '/')
+            date_str = _RE_WHITESPACE.sub('', match.group(1)).replace('.', '/')
             return date_str
 
         # Fallback por linha com "Validade"
-        for line in self.lines:
-            if re.search(r'Validade', line, re.IGNORECASE):
-                match = re.search(r'(\d{1,3})\s*DIAS', line, re.IGNORECASE)
-                if match:
-                    return f"{match.group(1)} DIAS"
-                match = re.search(r'(\d{2}\s*[./]\s*\d{2}\s*[./]\s*\d{2,4})', line)
-                if match:
-                    return re.sub(r'\s+', '', match.group(1)).replace('.', '/')
+        for i in self._get_line_index().iter_lines('validade'):
+            line = self.lines[i]
+            match = _RE_DIAS.search(line)
+            if match:
+                return f"{match.group(1)} DIAS"
+            match = _RE_DATA_NUMERICA.search(line)
+            if match:
+                return _RE_WHITESPACE.sub('', match.group(1)).replace('.', '/')
 
         return None
     
@@ -274,7 +655,7 @@ class PropostaExtractor:
                 return parts[1].strip()
             if idx + 1 < len(self.lines):
                 next_line = self.lines[idx + 1]
-                if not re.search(r'(Nome Fantasia|CNPJ|Telefone|Contato|Inscri)', next_line, re.IGNORECASE):
+                if not _RE_RAZAO_PROXIMO_CAMPO.search(next_line):
                     return next_line
 
         # Fallback: linha após "Emissão:"
@@ -282,20 +663,20 @@ class PropostaExtractor:
         if idx is not None and idx + 1 < len(self.lines):
             razao = self.lines[idx + 1]
             # Verificar se não é um campo conhecido
-            if not re.search(r'(Nome Fantasia|CNPJ|Telefone|Contato)', razao, re.IGNORECASE):
+            if not _RE_EMISSAO_PROXIMO_CAMPO.search(razao):
                 return razao
         return None
 
     def extract_tipo(self):
         """Detecta tipo da proposta baseado em MP BIOS ou BAUMER."""
         filename = os.path.basename(self.pdf_path)
-        if re.search(r'(^|[^A-Za-z0-9])MP\s*BIOS([^A-Za-z0-9]|$)', filename, re.IGNORECASE) or re.search(r'(^|[^A-Za-z0-9])MPBIOS([^A-Za-z0-9]|$)', filename, re.IGNORECASE):
+        if _RE_MP_BIOS.search(filename) or _RE_MPBIOS.search(filename):
             return 'Serviço'
-        if re.search(r'(^|[^A-Za-z0-9])BAUMER([^A-Za-z0-9]|$)', filename, re.IGNORECASE):
+        if _RE_BAUMER.search(filename):
             return 'Produto'
 
-        has_mp = re.search(r'(^|[^A-Za-z0-9])MP\s*BIOS([^A-Za-z0-9]|$)', self.text, re.IGNORECASE) or re.search(r'(^|[^A-Za-z0-9])MPBIOS([^A-Za-z0-9]|$)', self.text, re.IGNORECASE)
-        has_baumer = re.search(r'(^|[^A-Za-z0-9])BAUMER([^A-Za-z0-9]|$)', self.text, re.IGNORECASE)
+        has_mp = _RE_MP_BIOS.search(self.text) or _RE_MPBIOS.search(self.text)
+        has_baumer = _RE_BAUMER.search(self.text)
         if has_mp and not has_baumer:
             return 'Serviço'
         if has_baumer and not has_mp:
@@ -315,18 +696,14 @@ class PropostaExtractor:
             # Verificar linha seguinte
             if idx + 1 < len(self.lines):
                 next_line = self.lines[idx + 1]
-                if not re.search(r'(CNPJ|Telefone|Contato|Inscrição)', next_line):
+                if not _RE_FANTASIA_PROXIMO_CAMPO.search(next_line):
                     return next_line
         return "Não informado"
     
     def extract_cnpj(self):
         """Extrai o CNPJ"""
-        patterns = [
-            r'\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}',
-            r'\d{2}[.\-]\d{3}[.\-]\d{3}[/-]\d{4}[/-]\d{2}'
-        ]
-        for pattern in patterns:
-            match = re.search(pattern, self.text)
+        for pattern in _RE_CNPJ:
+            match = pattern.search(self.text)
             if match:
                 return match.group(0)
         return None
@@ -336,28 +713,26 @@ class PropostaExtractor:
         # Procurar telefone na linha "Telefone:"
         idx, line = self.find_line_with(r'Telefone:')
         if idx is not None:
-            tel_match = re.search(r'\(\s*\d{2}\s*\)\s*\d{4,5}-?\d{4}', line)
+            tel_match = _RE_TELEFONE.search(line)
             if tel_match:
                 return tel_match.group(0).replace("  ", " ").strip()
 
         # Fallback: procurar primeiro telefone no texto
-        tel_match = re.search(r'\(\s*\d{2}\s*\)\s*\d{4,5}-?\d{4}', self.text)
+        tel_match = _RE_TELEFONE.search(self.text)
         if tel_match:
             return tel_match.group(0).replace("  ", " ").strip()
         return "Não informado"
     
     def extract_celular(self):
         """Extrai o celular"""
-        pattern = r'Cel:\s*\((\d{2})\)\s*(\d{4,5}-?\d{4})'
-        match = re.search(pattern, self.text)
+        match = _RE_CELULAR.search(self.text)
         if match:
             return f"({match.group(1)}) {match.group(2)}"
         return None
     
     def extract_email(self):
         """Extrai o email"""
-        pattern = r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
-        match = re.search(pattern, self.text[:1500])
+        match = _RE_EMAIL.search(self.text[:1500])
         if match:
             return match.group(0)
         return None
@@ -373,68 +748,52 @@ class PropostaExtractor:
             # Verificar linha seguinte
             if idx + 1 < len(self.lines):
                 next_line = self.lines[idx + 1]
-                if not re.search(r'(Telefone|Cel:|E-?Mail)', next_line):
+                if not _RE_CONTATO_PROXIMO_CAMPO.search(next_line):
                     return next_line
         return None
     
+    def _itens_section(self):
+        """(início, fim) da seção de itens; fim é None se ainda não apareceu."""
+        if not self.lines:
+            return None, None
+        # Início: primeira linha com qualquer um dos formatos de cabeçalho da tabela
+        index = self._get_line_index()
+        idx_inicio = index.first('itens_inicio')
+        if idx_inicio is None:
+            return None, None
+
+        # Procurar final da seção de itens (somente após o início)
+        # Fallback: se encontrar um novo cabeçalho numerado depois do início
+        # Evitar confundir itens "01 ..." com seções "2.1 ..."
+        fins = [
+            idx for idx in (index.next_after('itens_fim', idx_inicio), index.next_after('subheading', idx_inicio))
+            if idx is not None
+        ]
+        return idx_inicio, (min(fins) if fins else None)
+
     def extract_itens(self):
         """Extrai os itens da proposta com valores"""
         itens = []
 
-        if not self.lines:
-            return itens
-
-        # Encontrar in??cio da se????o de itens (v??rios formatos)
-        start_patterns = [
-            r'It\.\s+Descricao\s+Qt',
-            r'CONFIGUR.*VALORES.*ITENS',
-            r'ITENS\s+COTAD',
-            r'DESCRICAO\s+DO\s+ITEM'
-        ]
-        idx_inicio = None
-        for pattern in start_patterns:
-            idx_inicio, _ = self.find_line_with(pattern)
-            if idx_inicio is not None:
-                break
+        idx_inicio, idx_fim = self._itens_section()
         if idx_inicio is None:
             return itens
-
-        # Procurar final da se????o de itens (somente ap??s o in??cio)
-        end_patterns = [
-            r'VALOR\s+TOTAL\s+DA\s+PROPOSTA',
-            r'TOTAL\s+DA\s+PROPOSTA',
-            r'^TOTAL\s+R\$'
-        ]
-        idx_fim = None
-        for j in range(idx_inicio + 1, len(self.lines)):
-            line = self.lines[j]
-            if any(re.search(pat, line, re.IGNORECASE) for pat in end_patterns):
-                idx_fim = j
-                break
         if idx_fim is None:
             idx_fim = len(self.lines)
 
-        # Fallback: se encontrar um novo cabe??alho numerado depois do in??cio
-        # Evitar confundir itens "01 ..." com se??es "2.1 ..."
-        heading_pattern = re.compile(r'^\d+\.\d+\s+.*$', re.IGNORECASE)
-        for j in range(idx_inicio + 1, len(self.lines)):
-            if heading_pattern.match(self.lines[j]):
-                idx_fim = min(idx_fim, j)
-                break
-
-        price_pattern = re.compile(r'R\$\s*([\d.,]+)\s+R\$\s*([\d.,]+)')
-        qty_line_pattern = re.compile(r'^(\d{1,3})\s+(\d{1,3})$')
-        item_num_pattern = re.compile(r'ITEM\s*(\d{1,3})', re.IGNORECASE)
-        header_ignore = re.compile(r'(It\.\s+Descricao|Qt|Unitario|Unit\u00e1rio|Valor\s+Unit|Valor\s+Total|Sub\s*Total|em\s*R\$|\(em\s*R\$\))', re.IGNORECASE)
+        price_pattern = _RE_ITEM_PRECO
+        qty_line_pattern = _RE_ITEM_QTD_LINHA
+        item_num_pattern = _RE_ITEM_NUMERO
+        header_ignore = _RE_ITEM_CABECALHO
 
         descricao_buffer = []
-        skip_prefix = re.compile(r'^(?:\d{1,3}\s*)?(?:\([^)]+\)\s*)?(Marca/Fabricante|Fabricante|Proced[eê]ncia|Registro|Desconto)\b', re.IGNORECASE)
+        skip_prefix = _RE_ITEM_SKIP_PREFIX
         i = idx_inicio + 1
         fallback_num = 1
         while i < idx_fim:
             line = self.lines[i]
 
-            # Ignorar linhas de cabe??alho da tabela
+            # Ignorar linhas de cabeçalho da tabela
             if header_ignore.search(line):
                 i += 1
                 continue
@@ -449,19 +808,19 @@ class PropostaExtractor:
                     descricao_parts.extend([d for d in descricao_buffer if not header_ignore.search(d)])
                     descricao_buffer = []
 
-                # Parte antes dos valores na pr??pria linha
+                # Parte antes dos valores na própria linha
                 parte_antes = line[:price_match.start()].strip()
                 if parte_antes:
                     descricao_parts.append(parte_antes)
 
                 descricao = ' '.join(descricao_parts).strip() or None
                 if descricao:
-                    descricao = re.sub(r'(?:\s+\d{1,3}){1,2}$', '', descricao).strip()
+                    descricao = _RE_ITEM_QTD_FINAL.sub('', descricao).strip()
                 if descricao:
-                    descricao = re.split(r'\s+(?:Marca/Fabricante|Fabricante|Proced[eê]ncia|Registro|Desconto)\b', descricao, 1, flags=re.IGNORECASE)[0].strip()
+                    descricao = _RE_ITEM_CORTE_DESCRICAO.split(descricao, 1)[0].strip()
                 if descricao:
-                    descricao = re.sub(r'^\d+\s*', '', descricao).strip()
-                if descricao and re.search(r'^(VALOR\s+COM|DESCONTO)\b', descricao, re.IGNORECASE):
+                    descricao = _RE_ITEM_NUMERO_INICIAL.sub('', descricao).strip()
+                if descricao and _RE_ITEM_LINHA_DESCONTO.search(descricao):
                     i += 1
                     continue
                 if descricao and len(descricao) < 5:
@@ -504,8 +863,8 @@ class PropostaExtractor:
                 i += 1
                 continue
 
-            # Acumular descri????o at?? achar linha com pre??os
-            if line and not re.match(r'^\d+\.\d+', line) and not header_ignore.search(line):
+            # Acumular descrição até achar linha com preços
+            if line and not _RE_SUBSECAO_INICIAL.match(line) and not header_ignore.search(line):
                 if not skip_prefix.search(line.strip()):
                     descricao_buffer.append(line)
 
@@ -515,32 +874,33 @@ class PropostaExtractor:
 
     def extract_valor_total(self):
         """Extrai o valor total da proposta"""
-        patterns = [
-            r'TOTAL\s+R\$\s+([\d.,]+)',
-            r'VALOR\s+TOTAL\s+DA\s+PROPOSTA[:\s]*R?\$?\s*([\d.,]+)'
-        ]
-        for pattern in patterns:
-            match = re.search(pattern, self.text, re.IGNORECASE)
-            if match:
-                return match.group(1)
+        match = _RE_VALOR_TOTAL.search(self.text)
+        if match:
+            return match.group(1) or match.group(2)
         return None
     
     def extract_all(self):
         """Extrai todos os dados da proposta"""
-        if not self.extract_text():
+        inicio = time.perf_counter()
+        lido = self.extract_text_until_settled()
+        self.tempos = {'texto': time.perf_counter() - inicio}
+        if not lido:
             return None
-        
+
+        inicio = time.perf_counter()
+        # Dados do cabeçalho: somente as primeiras páginas
+        cabecalho = self._header_view()
         dados = {
-            'id_proposta': self.extract_id_proposta(),
-            'data_emissao': self.extract_data_emissao(),
-            'validade': self.extract_validade(),
-            'razao_social': self.extract_razao_social(),
-            'nome_fantasia': self.extract_nome_fantasia(),
-            'cnpj': self.extract_cnpj(),
-            'telefone': self.extract_telefone(),
-            'celular': self.extract_celular(),
-            'email': self.extract_email(),
-            'pessoa_contato': self.extract_pessoa_contato(),
+            'id_proposta': cabecalho.extract_id_proposta(),
+            'data_emissao': cabecalho.extract_data_emissao(),
+            'validade': cabecalho.extract_validade(),
+            'razao_social': cabecalho.extract_razao_social(),
+            'nome_fantasia': cabecalho.extract_nome_fantasia(),
+            'cnpj': cabecalho.extract_cnpj(),
+            'telefone': cabecalho.extract_telefone(),
+            'celular': cabecalho.extract_celular(),
+            'email': cabecalho.extract_email(),
+            'pessoa_contato': cabecalho.extract_pessoa_contato(),
             'itens': self.extract_itens(),
             'valor_total': self.extract_valor_total(),
             'tipo': self.extract_tipo()
@@ -560,10 +920,49 @@ class PropostaExtractor:
         else:
             dados['descricao_item'] = None
             dados['quantidade'] = None
-        
+
+        self.tempos['campos'] = time.perf_counter() - inicio
         return dados
 
 
+def extract_pdf(pdf_path, cache=None, reuse_text=True):
+    """Extrai os dados de um PDF; ponto de entrada usado pelo pool de processos.
+
+    Se um ExtractionCache for informado, PDFs com o mesmo conteúdo (e mesma
+    versão do extrator) não são processados novamente. Com reuse_text, o texto
+    salvo ao lado do PDF é reaproveitado e só as regras de extração rodam.
+    """
+    return extract_pdf_medido(pdf_path, cache, reuse_text)[0]
+
+
+def extract_pdf_medido(pdf_path, cache=None, reuse_text=True):
+    """Como extract_pdf, mas retorna (dados, tempos) com os segundos de cada etapa:
+    'cache' (hash do arquivo e consulta ao cache), 'texto' (leitura das páginas
+    ou do texto salvo) e 'campos' (regras de extração).
+    """
+    if cache is None:
+        extrator = PropostaExtractor(pdf_path, reuse_text=reuse_text)
+        dados = extrator.extract_all()
+        return dados, extrator.tempos
+
+    inicio = time.perf_counter()
+    file_hash = file_sha256(pdf_path)
+    key = cache.make_key(file_hash, EXTRACTOR_VERSION, pdf_path)
+    dados = cache.get(key)
+    tempos = {'cache': time.perf_counter() - inicio}
+    if dados is not None:
+        return dados, tempos
+    extrator = PropostaExtractor(pdf_path, reuse_text=reuse_text, file_hash=file_hash)
+    dados = extrator.extract_all()
+    tempos.update(extrator.tempos)
+    if dados:
+        try:
+            cache.put(key, dados)
+        except OSError as e:
+            print(f"Erro ao gravar cache de extração: {e}")
+    return dados, tempos
+
+
 def test_extractor():
     """Função de teste"""
     pdf_path = "/home/ubuntu/upload/0012-CooperativadetrabalhomedidodePousoAlegre(UNIMED)-CME-542P-890P(conf.1)-PHB105P-TWE400P-EA34.03-E0201-042-cod050.pdf"
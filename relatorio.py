@@ -0,0 +1,48 @@
+"""
+Montagem do relatório XLSX de um cliente (abas Cliente, Contatos, Parque
+instalado, Visitas e Propostas)
+
+Recebe só listas de valores já formatados, sem acesso ao banco, para poder
+rodar em outros processos na geração em lote (ver RelatorioJob em app.py).
+"""
+import io
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+# Abas do relatório: (título, cabeçalho, chave em dados)
+ABAS = [
+    ('Cliente', ['Campo', 'Valor'], 'cliente'),
+    ('Contatos', ['Nome', 'Email', 'Telefone', 'Cargo', 'Setor'], 'contatos'),
+    ('Parque instalado', ['Equipamento', 'Quantidade', 'Marca', 'Modelo', 'Ano'], 'equipamentos'),
+    ('Visitas', ['Data', 'Histórico'], 'visitas'),
+    ('Propostas', ['ID Proposta', 'Razão Social', 'Data Emissão', 'Valor Total', 'Cod Vendedor'], 'propostas'),
+]
+
+
+def _autosize_sheet(ws):
+    for col in ws.columns:
+        max_len = 0
+        col_letter = get_column_letter(col[0].column)
+        for cell in col:
+            if cell.value is not None:
+                max_len = max(max_len, len(str(cell.value)))
+        ws.column_dimensions[col_letter].width = min(max_len + 2, 60)
+
+
+def montar_relatorio_cliente(dados):
+    """Gera o XLSX a partir das linhas de cada aba (ver ABAS) e retorna os bytes do arquivo."""
+    wb = Workbook()
+    ws = wb.active
+    for n, (titulo, cabecalho, chave) in enumerate(ABAS):
+        if n:
+            ws = wb.create_sheet(titulo)
+        else:
+            ws.title = titulo
+        ws.append(cabecalho)
+        for linha in dados[chave]:
+            ws.append(linha)
+        _autosize_sheet(ws)
+
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()